@@ -0,0 +1,427 @@
+"""
+Load-test the services in-process through an ASGI client.
+
+Each service is imported from its own directory, its MongoDB is seeded with
+synthetic users / categories / transactions, and every scenario is driven at
+a fixed concurrency. Latency percentiles and throughput are printed and can
+be written as JSON to diff between commits.
+
+    # against a throwaway mongod (never point this at real data)
+    python benchmarks/bench.py --service all --mongo-uri mongodb://localhost:27017 \
+        --users 100 --transactions 100000 --concurrency 20 --requests 2000 -o after.json
+
+    # no mongod around: in-memory mongomock-motor (and fakeredis) stand-ins (slower,
+    # for smoke runs; operations mongomock doesn't implement show up in the errors column)
+    python benchmarks/bench.py --service transaction --mock --transactions 5000
+
+    # compare with an earlier run
+    python benchmarks/bench.py --service all --mock --compare before.json
+
+Run from backend/. Extra dependencies are in benchmarks/requirements.txt.
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+import httpx
+from bson import ObjectId
+from jose import jwt
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVICES = {
+    "user": "user_service",
+    "transaction": "transaction_service",
+    "category": "category_service",
+}
+SECRET_KEY = "benchmark-secret-key"
+PASSWORD = "benchmark-password"
+SEED_BATCH_SIZE = 10000
+
+
+# --------------------------------
+# Service loading / seeding
+# --------------------------------
+def load_service(name: str, mongo_uri: str, mock: bool):
+    """Import <service>/app/main.py; every service is a package called `app`, so one per process."""
+    os.environ["MONGO_URI"] = mongo_uri
+    os.environ["SECRET_KEY"] = SECRET_KEY
+    # Services run one at a time here, so there is no category_service to poll
+    os.environ.setdefault("CATEGORY_EVENTS_ENABLED", "false")
+    if mock:
+        # mongomock can't say whether it's a replica set, so no change streams
+        os.environ.setdefault("CHANGE_FEED_SOURCE", "local")
+    sys.path.insert(0, os.path.join(BACKEND_DIR, SERVICES[name]))
+    module = importlib.import_module("app.main")
+    if mock:
+        from mongomock_motor import AsyncMongoMockClient
+
+        # The lifespan binds whatever client this returns
+        mock_client = AsyncMongoMockClient()
+        module.create_mongo_client = lambda uri: mock_client
+
+        async def no_warm_up(client):
+            pass
+
+        module.warm_up_pool = no_warm_up
+
+        # mongomock has no sessions or read preferences: report reads go to the one "server"
+        if hasattr(module, "causal_session"):
+            from contextlib import asynccontextmanager
+
+            @asynccontextmanager
+            async def no_session(client, after=None):
+                yield None
+
+            module.causal_session = no_session
+            module.for_reports = lambda collection: collection
+
+        # ...and the shared cache runs against an in-memory fakeredis
+        import fakeredis
+        from app.cache import SharedCache
+
+        module.create_shared_cache = lambda namespace: SharedCache(fakeredis.FakeAsyncRedis(), namespace)
+    return module
+
+
+def make_token(user_id: str) -> str:
+    expire = datetime.utcnow() + timedelta(hours=2)
+    return jwt.encode({"sub": user_id, "exp": expire}, SECRET_KEY, algorithm="HS256")
+
+
+async def insert_batched(collection, docs):
+    for i in range(0, len(docs), SEED_BATCH_SIZE):
+        await collection.insert_many(docs[i:i + SEED_BATCH_SIZE], ordered=False)
+
+
+async def seed(name: str, module, args, rng: random.Random) -> dict:
+    user_ids = [str(ObjectId()) for _ in range(args.users)]
+    fixtures = {"user_ids": user_ids}
+
+    if name == "user":
+        from app import hashing
+
+        # Hash once: seeding 1000s of bcrypt hashes would take minutes
+        password_hash = hashing.get_password_hash(PASSWORD)
+        await insert_batched(module.users_collection, [
+            {"_id": ObjectId(uid), "name": f"Bench {i}", "email": f"bench-{i}@example.com",
+             "password_hash": password_hash}
+            for i, uid in enumerate(user_ids)
+        ])
+
+    elif name == "category":
+        await insert_batched(module.categories_collection, [
+            {"user_id": uid, "name": f"category-{j}", "type": rng.choice(["income", "expense"])}
+            for uid in user_ids for j in range(args.categories_per_user)
+        ])
+
+    elif name == "transaction":
+        category_ids = [str(ObjectId()) for _ in range(args.categories_per_user)]
+        start = datetime(datetime.now().year - 2, 1, 1)
+        span = (datetime.now() - start).total_seconds()
+        docs = [
+            {
+                "user_id": rng.choice(user_ids),
+                "category_id": rng.choice(category_ids),
+                "type": rng.choice(["income", "expense"]),
+                "amount": round(rng.uniform(1, 5000), 2),
+                "date": start + timedelta(seconds=rng.uniform(0, span)),
+                "note": f"bench {i}",
+            }
+            for i in range(args.transactions)
+        ]
+        if hasattr(module, "transaction_store"):
+            # Whichever layout TRANSACTION_STORAGE picked
+            for i in range(0, len(docs), SEED_BATCH_SIZE):
+                await module.transaction_store.insert_many(docs[i:i + SEED_BATCH_SIZE])
+        else:
+            await insert_batched(module.transactions_collection, docs)
+        if hasattr(module, "rollups_collection"):
+            from app.rollups import rebuild_rollups
+
+            await rebuild_rollups(getattr(module, "transaction_store", module.transactions_collection),
+                                  module.rollups_collection)
+        fixtures["category_ids"] = category_ids
+
+    return fixtures
+
+
+async def cleanup(name: str, module, fixtures: dict):
+    """Remove seeded data so a real mongod can be reused between runs."""
+    user_ids = fixtures["user_ids"]
+    if name == "user":
+        await module.users_collection.delete_many({"_id": {"$in": [ObjectId(u) for u in user_ids]}})
+    elif name == "category":
+        await module.categories_collection.delete_many({"user_id": {"$in": user_ids}})
+    elif name == "transaction":
+        store = getattr(module, "transaction_store", None)
+        collection = store.collection if store else module.transactions_collection
+        await collection.delete_many({"user_id": {"$in": user_ids}})
+        if hasattr(module, "rollups_collection"):
+            await module.rollups_collection.delete_many({"user_id": {"$in": user_ids}})
+
+
+# --------------------------------
+# Scenarios
+# --------------------------------
+# Each scenario is an async callable(client, rng) that sends one logical
+# operation and returns the final response.
+def scenarios(name: str, fixtures: dict, args):
+    user_ids = fixtures["user_ids"]
+
+    def auth(rng):
+        user_id = rng.choice(user_ids)
+        return user_id, {"Authorization": f"Bearer {tokens[user_id]}"}
+
+    tokens = {uid: make_token(uid) for uid in user_ids}
+    year = datetime.now().year
+
+    if name == "user":
+        async def login(client, rng):
+            i = rng.randrange(len(user_ids))
+            return await client.post("/users/login", json={"email": f"bench-{i}@example.com", "password": PASSWORD})
+
+        async def profile(client, rng):
+            user_id, headers = auth(rng)
+            return await client.get(f"/users/{user_id}", headers=headers)
+
+        return {"login": login, "profile": profile}
+
+    if name == "category":
+        async def list_categories(client, rng):
+            return await client.get("/categories", headers=auth(rng)[1])
+
+        async def crud_category(client, rng):
+            user_id, headers = auth(rng)
+            created = await client.post("/categories", headers=headers, json={
+                "user_id": user_id, "name": f"bench-{ObjectId()}", "type": "expense"})
+            if created.status_code != 200:
+                return created
+            category_id = created.json()["_id"]
+            updated = await client.put(f"/categories/{category_id}", headers=headers, json={"name": f"bench-{ObjectId()}"})
+            if updated.status_code != 200:
+                return updated
+            return await client.delete(f"/categories/{category_id}", headers=headers)
+
+        return {"list_categories": list_categories, "crud_category": crud_category}
+
+    async def list_transactions(client, rng):
+        return await client.get("/transactions", params={"limit": args.page_size}, headers=auth(rng)[1])
+
+    async def list_month(client, rng):
+        return await client.get("/transactions", params={"month": rng.randint(1, 12)}, headers=auth(rng)[1])
+
+    async def summary_monthly(client, rng):
+        return await client.get("/transactions/summary/monthly",
+                                params={"year": year, "compare_year": year - 1}, headers=auth(rng)[1])
+
+    async def summary_categories(client, rng):
+        return await client.get("/transactions/summary/categories", params={"year": year}, headers=auth(rng)[1])
+
+    async def crud_transaction(client, rng):
+        user_id, headers = auth(rng)
+        created = await client.post("/transactions", headers=headers, json={
+            "user_id": user_id, "type": "expense", "amount": 10.5,
+            "date": datetime.now().isoformat(), "category_id": rng.choice(fixtures["category_ids"])})
+        if created.status_code != 200:
+            return created
+        txn_id = created.json()["_id"]
+        updated = await client.put(f"/transactions/{txn_id}", headers=headers, json={
+            "amount": 20.0, "type": None, "date": None, "note": None})
+        if updated.status_code != 200:
+            return updated
+        return await client.delete(f"/transactions/{txn_id}", headers=headers)
+
+    return {
+        "list_transactions": list_transactions,
+        "list_month": list_month,
+        "summary_monthly": summary_monthly,
+        "summary_categories": summary_categories,
+        "crud_transaction": crud_transaction,
+    }
+
+
+# --------------------------------
+# Driver
+# --------------------------------
+def percentile(sorted_values, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+async def drive(client, scenario, total: int, concurrency: int, rng: random.Random) -> dict:
+    latencies, errors = [], 0
+    remaining = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            start = time.perf_counter()
+            try:
+                response = await scenario(client, rng)
+                ok = response.status_code < 400
+            except Exception:
+                ok = False
+            latencies.append(time.perf_counter() - start)
+            errors += not ok
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": total,
+        "errors": errors,
+        "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+async def bench_service(name: str, args) -> dict:
+    rng = random.Random(args.seed)
+    module = load_service(name, args.mongo_uri or "mongodb://localhost:27017", args.mock)
+    app = module.app
+
+    async with app.router.lifespan_context(app):
+        fixtures = await seed(name, module, args, rng)
+        transport = httpx.ASGITransport(app=app)
+        results = {}
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                for scenario_name, scenario in scenarios(name, fixtures, args).items():
+                    if args.scenario and scenario_name not in args.scenario:
+                        continue
+                    # Warm caches and connection pools before measuring
+                    await drive(client, scenario, min(args.concurrency, args.requests), args.concurrency, rng)
+                    results[scenario_name] = await drive(client, scenario, args.requests, args.concurrency, rng)
+        finally:
+            if not args.keep_data:
+                await cleanup(name, module, fixtures)
+    return results
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_all(args) -> dict:
+    """Every service imports as `app`, so each one is benchmarked in its own process."""
+    results = {}
+    for name in SERVICES:
+        cmd = [sys.executable, os.path.abspath(__file__), *service_argv(args, name)]
+        output = subprocess.check_output(cmd, text=True)
+        results.update(json.loads(output)["results"])
+    return results
+
+
+def service_argv(args, name: str) -> list:
+    argv = ["--service", name, "--json-only",
+            "--users", str(args.users), "--transactions", str(args.transactions),
+            "--categories-per-user", str(args.categories_per_user),
+            "--concurrency", str(args.concurrency), "--requests", str(args.requests),
+            "--page-size", str(args.page_size), "--seed", str(args.seed)]
+    if args.mongo_uri:
+        argv += ["--mongo-uri", args.mongo_uri]
+    if args.mock:
+        argv.append("--mock")
+    if args.keep_data:
+        argv.append("--keep-data")
+    for scenario in args.scenario or []:
+        argv += ["--scenario", scenario]
+    return argv
+
+
+def print_report(report: dict, baseline: dict = None):
+    header = f"{'scenario':<22}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}"
+    print(header)
+    print("-" * len(header))
+    for scenario_name, r in report["results"].items():
+        print(f"{scenario_name:<22}{r['throughput_rps']:>10}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}{r['errors']:>8}")
+        before = (baseline or {}).get("results", {}).get(scenario_name)
+        if before:
+            deltas = [
+                f"{key} {(r[key] - before[key]) / before[key] * 100:+.1f}%"
+                for key in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms") if before[key]
+            ]
+            print(f"{'  vs ' + baseline['meta']['commit']:<22}{', '.join(deltas)}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--service", choices=[*SERVICES, "all"], default="all")
+    parser.add_argument("--mongo-uri", default=os.environ.get("BENCH_MONGO_URI"),
+                        help="Throwaway mongod to seed (default: $BENCH_MONGO_URI)")
+    parser.add_argument("--mock", action="store_true", help="Use an in-memory mongomock-motor stand-in")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--transactions", type=int, default=10000)
+    parser.add_argument("--categories-per-user", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=500, help="Requests per scenario")
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--scenario", action="append", help="Only run these scenarios (repeatable)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--keep-data", action="store_true", help="Leave seeded data in MongoDB")
+    parser.add_argument("-o", "--output", help="Write the JSON report here")
+    parser.add_argument("--compare", help="Earlier JSON report to print deltas against")
+    parser.add_argument("--json-only", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if not args.mongo_uri and not args.mock:
+        parser.error("pass --mongo-uri (or set BENCH_MONGO_URI) or use --mock")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.service == "all":
+        results = run_all(args)
+    else:
+        results = asyncio.run(bench_service(args.service, args))
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "backend": "mongomock" if args.mock else "mongod",
+            "service": args.service,
+            "users": args.users,
+            "transactions": args.transactions,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+        },
+        "results": results,
+    }
+    if args.json_only:
+        print(json.dumps(report))
+        return
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+Check where transaction_service sends its reads on a replica set, and that
+report reads still see the user's own writes.
+
+    # starts a three-member replica set for the run (see replica_set.py)
+    python benchmarks/read_routing.py --mongod /opt/mongodb/bin/mongod
+
+    # or an existing throwaway replica set; uses its own database, dropped afterwards
+    python benchmarks/read_routing.py --mongo-uri 'mongodb://h1,h2,h3/?replicaSet=rs0'
+
+Each round writes a transaction and then reads the summary, analytics and
+export straight away; every one of them must include the write. Every
+command the driver sends is tallied by the member that ran it: report reads
+should land on secondaries and everything else on the primary. With --lag,
+one more round holds replication back on the secondaries (a failpoint) for
+that many seconds, so its report reads have to wait for them instead of
+answering from before the write.
+
+Run from backend/.
+"""
+import argparse
+import asyncio
+import collections
+import importlib
+import os
+import shutil
+import sys
+import time
+from datetime import datetime
+
+import httpx
+from jose import jwt
+from pymongo import MongoClient, monitoring
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from replica_set import replica_set  # noqa: E402
+
+DB_NAME = "read_routing_check"
+SECRET_KEY = "read-routing-secret-key"
+USER_ID = "read-routing-user"
+# (command, collection) pairs that are report reads
+REPORT_READS = {
+    ("aggregate", "monthly_rollups"),
+    ("find", "transactions_db"), ("getMore", "transactions_db"),
+    ("aggregate", "transaction_buckets"), ("getMore", "transaction_buckets"),
+}
+
+
+class CommandTally(monitoring.CommandListener):
+    """Counts commands against the check's database by (command, collection, member address)."""
+
+    def __init__(self):
+        self.counts = collections.Counter()
+
+    def started(self, event):
+        if event.database_name != DB_NAME:
+            return
+        # getMore names its cursor first; the collection comes after
+        target = event.command.get("collection" if event.command_name == "getMore" else event.command_name)
+        collection = target if isinstance(target, str) else ""
+        self.counts[(event.command_name, collection, "%s:%s" % event.connection_id)] += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def hold_replication(members: list, on: bool):
+    for member in members:
+        client = MongoClient(member, directConnection=True)
+        try:
+            client.admin.command("configureFailPoint", "stopReplProducer", mode="alwaysOn" if on else "off")
+        finally:
+            client.close()
+
+
+async def check_round(http, headers, expected: int, failures: list, label: str):
+    now = datetime.now()
+    written = await http.post("/transactions", headers=headers, json={
+        "user_id": USER_ID, "type": "expense", "amount": 1.0, "date": now.isoformat(), "note": label,
+    })
+    written.raise_for_status()
+    started = time.perf_counter()
+    summary = (await http.get("/transactions/summary", headers=headers,
+                              params={"year": now.year, "month": now.month})).json()
+    analytics = (await http.get("/transactions/analytics", headers=headers)).json()
+    export = (await http.get("/transactions/export", headers=headers)).text
+    elapsed = time.perf_counter() - started
+
+    seen = {
+        "summary": summary["count"],
+        "analytics": round(sum(month["expense"] for month in analytics["months"])),
+        "export": len(export.strip().splitlines()) - 1,
+    }
+    for name, count in seen.items():
+        if count != expected:
+            failures.append(f"{label}: {name} saw {count} transactions, expected {expected}")
+    return elapsed
+
+
+async def run(args, uri: str) -> int:
+    tally = CommandTally()
+    # Only clients created after this report to it
+    monitoring.register(tally)
+
+    os.environ["MONGO_URI"] = uri
+    os.environ["SECRET_KEY"] = SECRET_KEY
+    os.environ["CATEGORY_EVENTS_ENABLED"] = "false"
+    os.environ["MONGO_REPORT_READ_PREFERENCE"] = args.read_preference
+    sys.path.insert(0, os.path.join(BACKEND_DIR, "transaction_service"))
+    main = importlib.import_module("app.main")
+    main.DB_NAME = DB_NAME
+
+    probe = MongoClient(uri)
+    hello = probe.admin.command("hello")
+    primary, secondaries = hello["primary"], hello.get("hosts", [])
+    secondaries = [host for host in secondaries if host != primary]
+    probe.close()
+
+    token = jwt.encode({"sub": USER_ID}, SECRET_KEY, algorithm="HS256")
+    headers = {"Authorization": f"Bearer {token}"}
+    failures = []
+    async with main.app.router.lifespan_context(main.app):
+        try:
+            await main.client.drop_database(DB_NAME)
+            await main.ensure_indexes()
+            await main.ensure_rollups()
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://check", timeout=120) as http:
+                written = 0
+                for i in range(args.rounds):
+                    written += 1
+                    await check_round(http, headers, written, failures, f"round {i + 1}")
+                if args.lag:
+                    hold_replication(secondaries, True)
+                    loop = asyncio.get_running_loop()
+                    release = loop.call_later(args.lag, hold_replication, secondaries, False)
+                    try:
+                        written += 1
+                        elapsed = await check_round(http, headers, written, failures, "lagging round")
+                    finally:
+                        release.cancel()
+                        hold_replication(secondaries, False)
+                    print(f"lagging round: report reads took {elapsed:.1f}s with replication held for {args.lag}s")
+        finally:
+            await main.client.drop_database(DB_NAME)
+
+    print(f"\n  {'command':<16}{'collection':<22}{'primary':>9}{'secondary':>11}")
+    by_target = collections.defaultdict(lambda: [0, 0])
+    for (command, collection, address), count in tally.counts.items():
+        by_target[(command, collection)][0 if address == primary else 1] += count
+    for (command, collection), (on_primary, on_secondary) in sorted(by_target.items()):
+        print(f"  {command:<16}{collection:<22}{on_primary:>9}{on_secondary:>11}")
+        if args.read_preference != "primary" and secondaries:
+            if (command, collection) in REPORT_READS and on_primary:
+                failures.append(f"{command} on {collection} ran on the primary {on_primary} times")
+        if (command, collection) not in REPORT_READS and on_secondary:
+            failures.append(f"{command} on {collection} ran on a secondary {on_secondary} times")
+
+    print()
+    for failure in failures:
+        print("FAIL", failure)
+    print("FAILED" if failures else "OK")
+    return 1 if failures else 0
+
+
+async def run_with_replica_set(args) -> int:
+    if args.mongo_uri:
+        return await run(args, args.mongo_uri)
+    async with replica_set(args.mongod) as uri:
+        return await run(args, uri)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-uri", help="Existing replica set to use instead of starting one")
+    parser.add_argument("--mongod", default=shutil.which("mongod") or "mongod",
+                        help="mongod binary for the replica set started otherwise (default: on PATH)")
+    parser.add_argument("--read-preference", default="secondaryPreferred", help="MONGO_REPORT_READ_PREFERENCE to run with")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--lag", type=float, default=3.0, help="Seconds to hold replication back in the last round (0: skip)")
+    args = parser.parse_args(argv)
+    sys.exit(asyncio.run(run_with_replica_set(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Start a throwaway three-member MongoDB replica set on localhost.
+
+Each member is a mongod process with its own temporary data directory; all
+of them are stopped and removed on exit. Used by read_routing.py, and handy
+on its own for running a service against a replica set:
+
+    # prints the connection string and keeps the set up until Ctrl-C
+    python benchmarks/replica_set.py --mongod /opt/mongodb/bin/mongod
+
+    MONGO_URI='mongodb://127.0.0.1:27117,127.0.0.1:27118,127.0.0.1:27119/?replicaSet=rs-local' \\
+        uvicorn app.main:app
+
+Members run with test commands enabled, so failpoints such as
+stopReplProducer can hold replication back to simulate a lagging secondary.
+Run from backend/.
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from contextlib import asynccontextmanager
+
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+REPLICA_SET_NAME = "rs-local"
+BASE_PORT = 27117
+MEMBERS = 3
+STARTUP_TIMEOUT = 60
+
+
+def wait_until(check, timeout: float, what: str):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if check():
+                return
+        except PyMongoError:
+            pass
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Timed out waiting for {what}")
+        time.sleep(0.25)
+
+
+def member_states(client: MongoClient) -> list:
+    return [member["stateStr"] for member in client.admin.command("replSetGetStatus")["members"]]
+
+
+def start(mongod: str, base_port: int, members: int, name: str):
+    """Launch and initiate the set; returns (connection string, processes, data directory)."""
+    root = tempfile.mkdtemp(prefix="replica-set-")
+    ports = [base_port + i for i in range(members)]
+    processes = []
+    try:
+        for port in ports:
+            dbpath = os.path.join(root, str(port))
+            os.makedirs(dbpath)
+            processes.append(subprocess.Popen(
+                [mongod, "--replSet", name, "--port", str(port), "--dbpath", dbpath, "--bind_ip", "127.0.0.1",
+                 "--setParameter", "enableTestCommands=1", "--quiet",
+                 "--logpath", os.path.join(root, f"{port}.log")],
+                stdout=subprocess.DEVNULL,
+            ))
+
+        first = MongoClient("127.0.0.1", ports[0], directConnection=True, serverSelectionTimeoutMS=1000)
+        try:
+            wait_until(lambda: first.admin.command("ping"), STARTUP_TIMEOUT, f"mongod on port {ports[0]}")
+            first.admin.command("replSetInitiate", {
+                "_id": name,
+                # The first member is preferred as primary, so runs are repeatable
+                "members": [
+                    {"_id": i, "host": f"127.0.0.1:{port}", "priority": 2 if i == 0 else 1}
+                    for i, port in enumerate(ports)
+                ],
+            })
+            wait_until(
+                lambda: sorted(member_states(first)) == ["PRIMARY"] + ["SECONDARY"] * (members - 1),
+                STARTUP_TIMEOUT, "the replica set to elect a primary",
+            )
+        finally:
+            first.close()
+    except BaseException:
+        stop(processes, root)
+        raise
+    hosts = ",".join(f"127.0.0.1:{port}" for port in ports)
+    return f"mongodb://{hosts}/?replicaSet={name}", processes, root
+
+
+def stop(processes: list, root: str):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    shutil.rmtree(root, ignore_errors=True)
+
+
+@asynccontextmanager
+async def replica_set(mongod: str = "mongod", base_port: int = BASE_PORT, members: int = MEMBERS,
+                      name: str = REPLICA_SET_NAME):
+    """Yield the connection string of a fresh replica set; stopped and deleted afterwards."""
+    uri, processes, root = await asyncio.to_thread(start, mongod, base_port, members, name)
+    try:
+        yield uri
+    finally:
+        await asyncio.to_thread(stop, processes, root)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongod", default=shutil.which("mongod") or "mongod", help="mongod binary (default: on PATH)")
+    parser.add_argument("--port", type=int, default=BASE_PORT, help="First member's port; the others follow")
+    parser.add_argument("--members", type=int, default=MEMBERS)
+    parser.add_argument("--name", default=REPLICA_SET_NAME)
+    args = parser.parse_args(argv)
+
+    uri, processes, root = start(args.mongod, args.port, args.members, args.name)
+    print(uri, flush=True)
+    try:
+        while all(process.poll() is None for process in processes):
+            time.sleep(1)
+        print("A member exited; stopping the rest")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop(processes, root)
+
+
+if __name__ == "__main__":
+    main()
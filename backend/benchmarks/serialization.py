@@ -0,0 +1,158 @@
+"""
+Measure response serialization alone: pydantic response_model vs the
+FAST_JSON_RESPONSES orjson path.
+
+The listing endpoint is driven through the real app, but its collection is
+replaced by an in-memory one that hands back pre-built documents, so the
+numbers are the cost of validating / encoding the rows rather than MongoDB.
+
+    python benchmarks/serialization.py --service transaction --rows 1000 --requests 200
+    python benchmarks/serialization.py --service category --rows 500
+
+Run from backend/.
+"""
+import argparse
+import asyncio
+import importlib
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+import httpx
+from bson import ObjectId
+from jose import jwt
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SECRET_KEY = "benchmark-secret-key"
+USER_ID = "benchmark-user"
+
+# service -> (directory, collection attribute, listing path)
+TARGETS = {
+    "transaction": ("transaction_service", "transactions_collection", "/transactions"),
+    "category": ("category_service", "categories_collection", "/categories"),
+}
+
+
+class StaticCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, *args, **kwargs):
+        return self
+
+    def limit(self, n):
+        return StaticCursor(self.docs[:n])
+
+    async def to_list(self, length):
+        # Copies, like the driver decoding a fresh batch for every request
+        return [dict(doc) for doc in self.docs]
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self.docs:
+            yield dict(doc)
+
+
+class StaticCollection:
+    """Just enough of a Motor collection for the listing endpoints."""
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find(self, query=None, projection=None, session=None):
+        return StaticCursor(self.docs)
+
+    async def find_one(self, query=None, projection=None, session=None):
+        # Only the ETag's version lookup calls this; "no writes yet" is fine
+        return None
+
+
+def make_docs(service: str, rows: int) -> list:
+    start = datetime(2024, 1, 1)
+    if service == "category":
+        return [
+            {"_id": ObjectId(), "user_id": USER_ID, "name": f"category {i}", "type": "expense"}
+            for i in range(rows)
+        ]
+    return [
+        {
+            "_id": ObjectId(),
+            "user_id": USER_ID,
+            "category_id": str(ObjectId()),
+            "type": "expense" if i % 4 else "income",
+            "amount": round(10 + i * 1.37, 2),
+            "date": start + timedelta(hours=i),
+            "note": f"transaction {i}",
+        }
+        for i in range(rows)
+    ]
+
+
+async def run(args) -> dict:
+    directory, attribute, path = TARGETS[args.service]
+    os.environ.setdefault("MONGO_URI", "mongodb://benchmark.invalid")
+    os.environ["SECRET_KEY"] = SECRET_KEY
+    # One page holds every row
+    os.environ["MAX_PAGE_SIZE"] = os.environ["DEFAULT_PAGE_SIZE"] = str(max(args.rows, 1))
+    sys.path.insert(0, os.path.join(BACKEND_DIR, directory))
+    module = importlib.import_module("app.main")
+    # No lifespan: the endpoint only needs the collection
+    collection = StaticCollection(make_docs(args.service, args.rows))
+    setattr(module, attribute, collection)
+    if args.service == "transaction":
+        from app.storage import DocumentStore
+
+        module.transaction_store = DocumentStore(collection)
+    module.versions_collection = StaticCollection([])
+
+    token = jwt.encode({"sub": USER_ID}, SECRET_KEY, algorithm="HS256")
+    headers = {"Authorization": f"Bearer {token}"}
+
+    report = {}
+    transport = httpx.ASGITransport(app=module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        bodies = {}
+        for mode in ("pydantic", "orjson"):
+            module.FAST_JSON_RESPONSES = mode == "orjson"
+            for _ in range(args.warmup):
+                await client.get(path, headers=headers)
+            timings = []
+            for _ in range(args.requests):
+                start = time.perf_counter()
+                response = await client.get(path, headers=headers)
+                timings.append(time.perf_counter() - start)
+                response.raise_for_status()
+            bodies[mode] = response.json()
+            report[mode] = {
+                "mean_ms": statistics.mean(timings) * 1000,
+                "median_ms": statistics.median(timings) * 1000,
+                "bytes": len(response.content),
+            }
+    if bodies["pydantic"] != bodies["orjson"]:
+        raise SystemExit("The two paths returned different bodies")
+    report["speedup"] = report["pydantic"]["median_ms"] / report["orjson"]["median_ms"]
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--service", choices=list(TARGETS), default="transaction")
+    parser.add_argument("--rows", type=int, default=1000, help="Documents per response")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run(args))
+    print(f"{args.service}: {args.rows} rows per response, {args.requests} requests")
+    for mode in ("pydantic", "orjson"):
+        r = report[mode]
+        print(f"  {mode:<9} median {r['median_ms']:8.2f} ms   mean {r['mean_ms']:8.2f} ms   {r['bytes']} bytes")
+    print(f"  speedup   {report['speedup']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
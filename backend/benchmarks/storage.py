@@ -0,0 +1,234 @@
+"""
+Compare the transaction storage layouts in transaction_service/app/storage.py.
+
+The same synthetic transactions are loaded one per document, then migrated
+into user-month buckets. Reads and writes are timed through each store the
+way the endpoints call them, and collection and index sizes are reported.
+
+    # against a throwaway mongod; uses its own database, dropped afterwards
+    python benchmarks/storage.py --mongo-uri mongodb://localhost:27017 --rows 1000000 --users 1000 -o storage.json
+
+    # no mongod around: mongomock-motor, for smoke runs (no sizes, and far slower than mongod)
+    python benchmarks/storage.py --mock --rows 20000 --users 50
+
+Run from backend/.
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DB_NAME = "storage_benchmark"
+SEED_BATCH_SIZE = 10000
+LAYOUTS = ("documents", "buckets")
+
+
+def make_rows(rng: random.Random, user_ids: list, count: int, start: datetime, span: float):
+    for i in range(count):
+        yield {
+            "user_id": rng.choice(user_ids),
+            "category_id": f"category-{rng.randrange(20)}",
+            "type": rng.choice(["income", "expense"]),
+            "amount": round(rng.uniform(1, 5000), 2),
+            "date": start + timedelta(seconds=rng.uniform(0, span)),
+            "note": f"bench {i}",
+        }
+
+
+async def load(documents, rng, args, user_ids, start, span):
+    batch = []
+    for row in make_rows(rng, user_ids, args.rows, start, span):
+        batch.append(row)
+        if len(batch) == SEED_BATCH_SIZE:
+            await documents.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        await documents.insert_many(batch, ordered=False)
+
+
+async def sizes(db, name: str, mock: bool) -> dict:
+    if mock:
+        return {"count": await db[name].count_documents({})}
+    stats = await db.command("collStats", name)
+    return {
+        "count": stats["count"],
+        "data_bytes": stats["size"],
+        "storage_bytes": stats["storageSize"],
+        "index_bytes": stats["totalIndexSize"],
+        "indexes": stats["indexSizes"],
+    }
+
+
+def summarize(timings: list) -> dict:
+    timings = sorted(timings)
+    pick = lambda pct: timings[min(len(timings) - 1, int(len(timings) * pct / 100))] * 1000
+    return {"p50_ms": pick(50), "p95_ms": pick(95), "p99_ms": pick(99), "mean_ms": statistics.mean(timings) * 1000}
+
+
+async def timed(results: dict, name: str, calls: int, operation):
+    timings = []
+    for i in range(calls):
+        start = time.perf_counter()
+        await operation(i)
+        timings.append(time.perf_counter() - start)
+    results[name] = summarize(timings)
+
+
+async def bench_store(main, store, args, rng, user_ids, start, span) -> dict:
+    """Time the listing reads and the single-transaction writes against one store."""
+    sort = main.keyset_sort("-date")
+    projection = main.TRANSACTION_PROJECTION
+    results = {}
+
+    async def listing(query, limit=None):
+        return await store.find(query, projection, sort, limit=limit).to_list(None)
+
+    async def month(_):
+        day = start + timedelta(seconds=rng.uniform(0, span))
+        period_start, period_end = main.period_range(day.year, day.month)
+        await listing({"user_id": rng.choice(user_ids), "date": {"$gte": period_start, "$lt": period_end}})
+
+    async def first_page(_):
+        await listing({"user_id": rng.choice(user_ids)}, args.page_size + 1)
+
+    async def category_page(_):
+        await listing({"user_id": rng.choice(user_ids), "category_id": f"category-{rng.randrange(20)}"}, args.page_size + 1)
+
+    # The cursor for each user's second page comes from an untimed first page
+    after = {}
+    for user_id in user_ids[:args.requests]:
+        page = await listing({"user_id": user_id}, args.page_size)
+        if page:
+            after[user_id] = main.encode_cursor(page[-1])
+    paged_users = list(after)
+
+    async def next_page(i):
+        user_id = paged_users[i % len(paged_users)]
+        await listing(main.transactions_query(user_id, {}, "-date", after[user_id]), args.page_size + 1)
+
+    await timed(results, "list_month", args.requests, month)
+    await timed(results, "list_first_page", args.requests, first_page)
+    if paged_users:
+        await timed(results, "list_next_page", args.requests, next_page)
+    await timed(results, "list_category", args.requests, category_page)
+
+    # Writes touch only rows added here, so both stores end where they started
+    added = list(make_rows(rng, user_ids, args.requests, start, span))
+
+    async def insert(i):
+        await store.insert_one(added[i])
+
+    async def update(i):
+        await store.update(added[i]["user_id"], added[i]["_id"], {"amount": added[i]["amount"] + 1})
+
+    async def delete(i):
+        await store.delete(added[i]["user_id"], added[i]["_id"])
+
+    await timed(results, "insert", args.requests, insert)
+    await timed(results, "update", args.requests, update)
+    await timed(results, "delete", args.requests, delete)
+    return results
+
+
+async def run(args) -> dict:
+    os.environ.setdefault("MONGO_URI", args.mongo_uri or "mongodb://benchmark.invalid")
+    sys.path.insert(0, os.path.join(BACKEND_DIR, "transaction_service"))
+    main = importlib.import_module("app.main")
+    from app import storage
+
+    if args.mock:
+        from mongomock_motor import AsyncMongoMockClient
+
+        client = AsyncMongoMockClient()
+    else:
+        from app.mongo import create_mongo_client
+
+        client = create_mongo_client(args.mongo_uri)
+    db = client[DB_NAME]
+    documents = storage.DocumentStore(db[main.COLLECTION_NAME])
+    buckets = storage.BucketStore(db[main.BUCKETS_COLLECTION_NAME], size=args.bucket_size)
+
+    rng = random.Random(args.seed)
+    user_ids = [f"user-{i}" for i in range(args.users)]
+    start = datetime(datetime.now().year - 2, 1, 1)
+    span = (datetime.now() - start).total_seconds()
+
+    report = {"rows": args.rows, "users": args.users, "bucket_size": args.bucket_size}
+    try:
+        await db.drop_collection(documents.collection.name)
+        await db.drop_collection(buckets.collection.name)
+        await documents.ensure_indexes()
+        await buckets.ensure_indexes()
+
+        began = time.perf_counter()
+        await load(documents.collection, rng, args, user_ids, start, span)
+        report["load_seconds"] = time.perf_counter() - began
+        began = time.perf_counter()
+        await storage.migrate(documents.collection, buckets)
+        report["migrate_seconds"] = time.perf_counter() - began
+
+        for layout, store in zip(LAYOUTS, (documents, buckets)):
+            report[layout] = {
+                "size": await sizes(db, store.collection.name, args.mock),
+                # Same seed for both, so they answer the same queries
+                "latency": await bench_store(main, store, args, random.Random(args.seed), user_ids, start, span),
+            }
+    finally:
+        if not args.keep_data:
+            await client.drop_database(DB_NAME)
+    return report
+
+
+def megabytes(value) -> str:
+    return f"{value / 2**20:10.1f} MB" if isinstance(value, (int, float)) else f"{'n/a':>13}"
+
+
+def print_report(report: dict):
+    print(f"{report['rows']} transactions, {report['users']} users, buckets of {report['bucket_size']}")
+    print(f"  loaded in {report['load_seconds']:.1f}s, migrated to buckets in {report['migrate_seconds']:.1f}s")
+    print(f"\n  {'layout':<10}{'stored docs':>13}{'data':>14}{'storage':>14}{'indexes':>14}")
+    for layout in LAYOUTS:
+        size = report[layout]["size"]
+        print(f"  {layout:<10}{size['count']:>13}{megabytes(size.get('data_bytes'))}"
+              f"{megabytes(size.get('storage_bytes'))}{megabytes(size.get('index_bytes'))}")
+
+    print(f"\n  {'operation':<18}{'documents p50/p95 ms':>24}{'buckets p50/p95 ms':>24}{'p50 ratio':>11}")
+    for name, docs in report["documents"]["latency"].items():
+        bkts = report["buckets"]["latency"][name]
+        print(f"  {name:<18}{docs['p50_ms']:>12.2f} /{docs['p95_ms']:>9.2f}"
+              f"{bkts['p50_ms']:>14.2f} /{bkts['p95_ms']:>9.2f}{bkts['p50_ms'] / docs['p50_ms']:>10.2f}x")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-uri", default=os.environ.get("BENCH_MONGO_URI"),
+                        help="Throwaway mongod (default: $BENCH_MONGO_URI)")
+    parser.add_argument("--mock", action="store_true", help="Use an in-memory mongomock-motor stand-in")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--bucket-size", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=500, help="Calls per operation and layout")
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--keep-data", action="store_true", help=f"Leave the {DB_NAME} database in MongoDB")
+    parser.add_argument("-o", "--output", help="Write the JSON report here")
+    args = parser.parse_args(argv)
+    if not args.mongo_uri and not args.mock:
+        parser.error("pass --mongo-uri (or set BENCH_MONGO_URI) or use --mock")
+
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,31 @@
-from fastapi import FastAPI, HTTPException, Query, Depends
+from fastapi import FastAPI, HTTPException, Query, Depends, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer
 from pydantic import BaseModel, Field
 from typing import Optional, List
+from datetime import datetime
 from bson import ObjectId
-import motor.motor_asyncio
+from pymongo import ASCENDING, IndexModel, ReturnDocument
+from pymongo.errors import DuplicateKeyError, OperationFailure
+import logging
 import os
-from jose import JWTError, jwt
+import orjson
+from contextlib import asynccontextmanager
+from jose import JWTError
+from app.auth import TokenVerifier
+from app.cache import SharedCache, create_shared_cache
+from app.changes import ChangeFeed, delete_change, upsert_change
+from app.metrics import event_loop_monitor, instrument
+from app.mongo import create_mongo_client, warm_up_pool
+from app.singleflight import SingleFlight
+from app.versions import VERSION_HEADER, bump_version, cache_headers, check_version
 
 # --- Environment & Security ---
 # SECRET_KEY ต้องตรงกับใน user-service
 SECRET_KEY = os.environ.get("SECRET_KEY", "a_default_secret_key_for_development")
 ALGORITHM = "HS256"
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token") # URL ไม่สำคัญใน service นี้
+token_verifier = TokenVerifier(SECRET_KEY, ALGORITHM)
 
 # --- MongoDB Connection ---
 try:
@@ -20,9 +33,126 @@ try:
 except KeyError:
     raise RuntimeError("MONGO_URI environment variable not set. Application cannot start.")
 
-client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_URI)
-db = client["categories_db"]
-categories_collection = db["categories"]
+DB_NAME = "categories_db"
+COLLECTION_NAME = "categories"
+VERSIONS_COLLECTION_NAME = "user_versions"
+EVENTS_COLLECTION_NAME = "category_events"
+
+# สร้างใน lifespan เพื่อให้แต่ละ worker process มี connection pool ของตัวเอง
+client = None
+db = None
+categories_collection = None
+versions_collection = None
+events_collection = None
+# แทนที่ใน lifespan; ถ้าไม่ได้ตั้ง REDIS_URL จะไม่ cache อะไรเลย
+category_cache = SharedCache(None, "categories")
+# request ที่เหมือนกันและมาพร้อมกันใน worker เดียวกันจะใช้ผลของ query เดียวกัน
+categories_flight = SingleFlight("get_categories")
+# stream การเปลี่ยนแปลงของผู้ใช้แต่ละคน ที่ /categories/changes
+change_feed = ChangeFeed()
+
+def bind_database(mongo_client):
+    global client, db, categories_collection, versions_collection, events_collection
+    client = mongo_client
+    db = client[DB_NAME]
+    categories_collection = db[COLLECTION_NAME]
+    versions_collection = db[VERSIONS_COLLECTION_NAME]
+    events_collection = db[EVENTS_COLLECTION_NAME]
+
+# จำนวน id สูงสุดที่ GET /categories/batch รับได้
+MAX_BATCH_IDS = int(os.environ.get("MAX_BATCH_IDS", "500"))
+
+# Outbox: service ที่อ่าน /internal/category-events ต้องใช้ token ที่มี scope นี้
+EVENTS_SCOPE = "category-events"
+MAX_EVENTS_PER_FETCH = int(os.environ.get("MAX_EVENTS_PER_FETCH", "500"))
+
+# ข้ามการ validate ทีละแถวด้วย pydantic ใน endpoint ที่คืนรายการ แล้ว encode ด้วย orjson
+FAST_JSON_RESPONSES = os.environ.get("FAST_JSON_RESPONSES", "false").lower() == "true"
+
+# รัน explain() กับ query หลักตอนเริ่ม service และไม่ยอมเริ่มถ้า query ไหนเป็น COLLSCAN
+CHECK_QUERY_PLANS = os.environ.get("CHECK_QUERY_PLANS", "false").lower() == "true"
+
+# --- Indexes ---
+# ชื่อ category ไม่ซ้ำกันต่อผู้ใช้และประเภท และใช้กับการดึงรายการตามผู้ใช้ (+ ประเภท) ด้วย
+CATEGORY_INDEXES = [
+    IndexModel(
+        [("user_id", ASCENDING), ("name", ASCENDING), ("type", ASCENDING)],
+        name="user_id_name_type",
+        unique=True,
+    ),
+]
+
+def hot_queries():
+    probe_user = "__query_plan_check__"
+    return {
+        "get_categories": categories_collection.find({"user_id": probe_user}),
+        "get_categories(type)": categories_collection.find({"user_id": probe_user, "type": "expense"}),
+        "duplicate_check": categories_collection.find({"user_id": probe_user, "name": "probe", "type": "expense"}),
+    }
+
+logger = logging.getLogger(__name__)
+
+async def rename_duplicate_categories() -> int:
+    """ ตั้งชื่อใหม่ให้ category ที่ชื่อและประเภทซ้ำกันในผู้ใช้เดียวกัน (ตัวที่เก่าที่สุดคงชื่อเดิม) คืนจำนวนที่เปลี่ยน """
+    duplicates = categories_collection.aggregate([
+        {"$sort": {"_id": ASCENDING}},
+        {"$group": {"_id": {"user_id": "$user_id", "name": "$name", "type": "$type"}, "ids": {"$push": "$_id"}}},
+        {"$match": {"ids.1": {"$exists": True}}},
+    ])
+    renamed = 0
+    async for group in duplicates:
+        key = group["_id"]
+        taken = set(await categories_collection.distinct("name", {"user_id": key["user_id"], "type": key["type"]}))
+        suffix = 1
+        for category_id in group["ids"][1:]:
+            suffix += 1
+            while f"{key['name']} ({suffix})" in taken:
+                suffix += 1
+            name = f"{key['name']} ({suffix})"
+            taken.add(name)
+            # เปลี่ยนเฉพาะเมื่อชื่อยังเหมือนเดิม: worker อื่นที่เริ่มพร้อมกันอาจเปลี่ยนไปแล้ว
+            result = await categories_collection.update_one({"_id": category_id, "name": key["name"]}, {"$set": {"name": name}})
+            if result.modified_count:
+                renamed += 1
+                await data_changed(key["user_id"], upsert_change(category_row({**key, "_id": category_id, "name": name})))
+                await publish_event("renamed", key["user_id"], str(category_id), name)
+    return renamed
+
+async def ensure_indexes():
+    try:
+        await categories_collection.create_indexes(CATEGORY_INDEXES)
+    except OperationFailure as e:
+        if e.code != 11000:
+            raise
+        # ข้อมูลที่มีอยู่ก่อนมี unique index อาจมีชื่อซ้ำ: เปลี่ยนชื่อตัวที่ซ้ำแทนการลบ
+        # เพื่อให้ transaction ที่อ้างถึงยังอยู่ใน category เดิม แล้วสร้าง index อีกครั้ง
+        renamed = await rename_duplicate_categories()
+        logger.warning("Renamed %d duplicate categories so the unique (user_id, name, type) index can be built", renamed)
+        await categories_collection.create_indexes(CATEGORY_INDEXES)
+
+def plan_stages(plan) -> set:
+    """ รวมชื่อ `stage` ทั้งหมดที่อยู่ใน plan tree ของ explain() """
+    stages = set()
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.add(plan["stage"])
+        for value in plan.values():
+            stages |= plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            stages |= plan_stages(item)
+    return stages
+
+async def verify_query_plans():
+    """ หยุดทันทีถ้า query หลักตัวไหนต้อง scan ทั้ง collection """
+    collection_scans = []
+    for name, cursor in hot_queries().items():
+        explain = await cursor.explain()
+        if "COLLSCAN" in plan_stages(explain["queryPlanner"]["winningPlan"]):
+            collection_scans.append(name)
+    if collection_scans:
+        raise RuntimeError(f"Queries not served by an index: {', '.join(collection_scans)}")
+
 
 # --- Helper for ObjectId ---
 class PyObjectId(ObjectId):
@@ -57,6 +187,73 @@ class CategoryOut(CategoryBase):
         json_encoders = {ObjectId: str}
         allow_population_by_field_name = True
 
+# --- Fast JSON path ---
+CATEGORY_FIELDS = ("user_id", "name", "type")
+# ดึงเฉพาะ field ที่ CategoryOut ส่งกลับ
+CATEGORY_PROJECTION = dict.fromkeys(CATEGORY_FIELDS, 1)
+
+def category_row(doc: dict) -> dict:
+    """ แปลง document ให้มีรูปแบบเดียวกับที่ CategoryOut serialize ในรอบเดียว """
+    row = {field: doc.get(field) for field in CATEGORY_FIELDS}
+    row["_id"] = str(doc["_id"])
+    return row
+
+async def list_categories(request: Request, response: Response, query: dict):
+    user_id = query["user_id"]
+    # ถ้า client มีข้อมูลเวอร์ชันล่าสุดอยู่แล้ว check_version จะตอบ 304 โดยไม่ต้อง query
+    # ส่งเวอร์ชันไปด้วย เพื่อให้ client รู้ว่ามี event ใดของ /categories/changes อยู่แล้ว
+    etag, version = await check_version(versions_collection, request, user_id)
+    headers = cache_headers(etag, version)
+
+    async def load():
+        # ETag ระบุทั้งเวอร์ชันข้อมูลและ request อยู่แล้ว จึงใช้เป็น field ใน shared cache และ key ของ single-flight ได้เลย
+        rows = await category_cache.get(user_id, etag)
+        if rows is None:
+            docs = await categories_collection.find(query, CATEGORY_PROJECTION).to_list(None)
+            rows = [category_row(doc) for doc in docs]
+            await category_cache.set(user_id, etag, rows)
+        return rows
+
+    # ทุก request ได้ list เดียวกัน ห้ามแก้ไข
+    rows = await categories_flight.do(etag, load)
+    if FAST_JSON_RESPONSES:
+        return Response(orjson.dumps(rows), media_type="application/json", headers=headers)
+    response.headers.update(headers)
+    return rows
+
+async def data_changed(user_id: str, change: Optional[dict] = None):
+    """ เรียกหลังเขียนข้อมูลของผู้ใช้สำเร็จทุกครั้ง; `change` คือสิ่งที่ผู้ที่เปิด /categories/changes จะได้รับ """
+    version = await bump_version(versions_collection, user_id, change)
+    await category_cache.invalidate(user_id)
+    change_feed.written(user_id, version, change)
+
+# --- Outbox ---
+# การลบ/เปลี่ยนชื่อ category ถูกบันทึกเป็น event ให้ transaction_service มาดึงไปแก้ข้อมูลของตัวเอง
+# (แต่ละ service มี MongoDB ของตัวเอง) event จะอยู่จนกว่าผู้ใช้ event จะ ack
+class CategoryEvent(BaseModel):
+    id: str
+    type: str
+    user_id: str
+    category_id: str
+    name: Optional[str] = None
+    created_at: datetime
+
+class EventAck(BaseModel):
+    ids: List[str]
+
+async def publish_event(type: str, user_id: str, category_id: str, name: Optional[str] = None):
+    # เขียนหลังจากแก้ category สำเร็จแล้ว: ถ้า process ตายระหว่างนั้น event จะหายไป
+    # แต่จะไม่มี event ของการแก้ไขที่ไม่ได้เกิดขึ้นจริง
+    # event "deleted" ที่หายไปซ่อมได้ด้วย `python -m app.category_events reconcile` ใน transaction_service
+    # ซึ่งเทียบ category ที่ transaction อ้างถึงกับ /internal/category-ids
+    await events_collection.insert_one({
+        "type": type,
+        "user_id": user_id,
+        "category_id": category_id,
+        "name": name,
+        "created_at": datetime.utcnow(),
+    })
+
 # --- Authentication Dependency ---
 async def get_current_user_id(token: str = Depends(oauth2_scheme)) -> str:
     credentials_exception = HTTPException(
@@ -65,7 +262,7 @@ async def get_current_user_id(token: str = Depends(oauth2_scheme)) -> str:
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = token_verifier.decode(token)
         user_id: str = payload.get("sub")
         if user_id is None:
             raise credentials_exception
@@ -73,8 +270,32 @@ async def get_current_user_id(token: str = Depends(oauth2_scheme)) -> str:
     except JWTError:
         raise credentials_exception
 
+async def require_events_scope(token: str = Depends(oauth2_scheme)):
+    """ สำหรับ service อื่นเท่านั้น: token ของผู้ใช้ไม่มี scope """
+    try:
+        payload = token_verifier.decode(token)
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Could not validate credentials")
+    if payload.get("scope") != EVENTS_SCOPE:
+        raise HTTPException(status_code=403, detail="Not allowed to read category events")
+
 # --- FastAPI App ---
-app = FastAPI(title="Category Service")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global category_cache
+    bind_database(create_mongo_client(MONGO_URI))
+    category_cache = create_shared_cache("categories")
+    # ทำให้เสร็จก่อนเริ่มรับ request แรก
+    await warm_up_pool(client)
+    await ensure_indexes()
+    if CHECK_QUERY_PLANS:
+        await verify_query_plans()
+    async with event_loop_monitor(), change_feed.running(client, versions_collection):
+        yield
+    await category_cache.close()
+    client.close()
+
+app = FastAPI(title="Category Service", lifespan=lifespan)
 
 # Enable CORS
 app.add_middleware(
@@ -83,12 +304,16 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", VERSION_HEADER],
 )
+instrument(app)
 
 
 # --- API Routes ---
 @app.get("/categories", response_model=List[CategoryOut])
 async def get_categories(
+    request: Request,
+    response: Response,
     type: Optional[str] = Query(None, pattern="^(income|expense)$"),
     current_user_id: str = Depends(get_current_user_id)
 ):
@@ -97,8 +322,26 @@ async def get_categories(
     if type:
         query["type"] = type
     
-    categories = await categories_collection.find(query).to_list(100)
-    return categories
+    return await list_categories(request, response, query)
+
+
+@app.get("/categories/batch", response_model=List[CategoryOut])
+async def get_categories_batch(
+    request: Request,
+    response: Response,
+    ids: str = Query(..., description="Comma separated category ids"),
+    current_user_id: str = Depends(get_current_user_id)
+):
+    """ ดึง categories หลายรายการตาม id ในคำขอเดียว (เฉพาะของผู้ใช้ที่ล็อกอินอยู่) """
+    requested = {i.strip() for i in ids.split(",") if i.strip()}
+    if len(requested) > MAX_BATCH_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_IDS} ids per request")
+    # id ที่ไม่ถูกต้องจะถูกข้ามไป เหมือนกับ id ที่ไม่พบ
+    object_ids = [ObjectId(i) for i in requested if ObjectId.is_valid(i)]
+    if not object_ids:
+        return []
+    query = {"_id": {"$in": object_ids}, "user_id": current_user_id}
+    return await list_categories(request, response, query)
 
 
 @app.post("/categories", response_model=CategoryOut)
@@ -108,68 +351,77 @@ async def create_category(category: CategoryCreate, current_user_id: str = Depen
     if category.user_id != current_user_id:
         raise HTTPException(status_code=403, detail="Not authorized to create category for this user")
     
-    # ตรวจสอบว่ามีหมวดหมู่ชื่อและประเภทนี้อยู่แล้วหรือไม่
-    existing = await categories_collection.find_one({
-        "user_id": current_user_id,
-        "name": category.name,
-        "type": category.type
-    })
-    if existing:
-        raise HTTPException(status_code=400, detail="หมวดหมู่นี้มีอยู่แล้ว")
-
-
+    # ชื่อและประเภทซ้ำจะถูกปฏิเสธโดย unique index (user_id, name, type)
     new_category = category.model_dump()
-    result = await categories_collection.insert_one(new_category)
-    created = await categories_collection.find_one({"_id": result.inserted_id})
-    return created
+    try:
+        await categories_collection.insert_one(new_category)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="หมวดหมู่นี้มีอยู่แล้ว")
+    await data_changed(current_user_id, upsert_change(category_row(new_category)))
+    # insert_one ใส่ new_category["_id"] ให้แล้ว จึงไม่ต้องอ่านกลับมาอีก
+    return new_category
 
 
 @app.put("/categories/{id}", response_model=CategoryOut)
 async def update_category(id: str, category: CategoryUpdate, current_user_id: str = Depends(get_current_user_id)):
     """ อัปเดต category ตาม id """
-    # ตรวจสอบก่อนว่า category นี้เป็นของผู้ใช้ที่ login อยู่หรือไม่
-    existing_category = await categories_collection.find_one({"_id": ObjectId(id)})
-    if not existing_category or existing_category.get("user_id") != current_user_id:
-        raise HTTPException(status_code=404, detail="Category not found or not authorized")
-
     update_data = {k: v for k, v in category.model_dump().items() if v is not None}
     if not update_data:
         raise HTTPException(status_code=400, detail="No fields to update")
-    
-    # ตรวจสอบว่าการอัปเดตจะทำให้เกิดข้อมูลซ้ำหรือไม่
-    if 'name' in update_data or 'type' in update_data:
-        check_name = update_data.get('name', existing_category['name'])
-        check_type = update_data.get('type', existing_category['type'])
-        
-        duplicate_check = await categories_collection.find_one({
-            "user_id": current_user_id,
-            "name": check_name,
-            "type": check_type,
-            "_id": {"$ne": ObjectId(id)} # ไม่ใช่เอกสารปัจจุบัน
-        })
-        if duplicate_check:
-            raise HTTPException(status_code=400, detail="ชื่อหมวดหมู่นี้ถูกใช้แล้ว")
-
-    result = await categories_collection.update_one(
-        {"_id": ObjectId(id)}, {"$set": update_data}
-    )
-    if result.modified_count == 0:
-        # This might happen if the update data is the same as the existing data
-        pass
 
-    updated = await categories_collection.find_one({"_id": ObjectId(id)})
+    # ตรวจสอบความเป็นเจ้าของใน filter เดียวกับการอัปเดต และให้ unique index กันชื่อซ้ำ
+    try:
+        updated = await categories_collection.find_one_and_update(
+            {"_id": ObjectId(id), "user_id": current_user_id},
+            {"$set": update_data},
+            return_document=ReturnDocument.AFTER,
+        )
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="ชื่อหมวดหมู่นี้ถูกใช้แล้ว")
+    if updated is None:
+        raise HTTPException(status_code=404, detail="Category not found or not authorized")
+    await data_changed(current_user_id, upsert_change(category_row(updated)))
+    if "name" in update_data:
+        await publish_event("renamed", current_user_id, id, updated["name"])
     return updated
 
 
 @app.delete("/categories/{id}")
 async def delete_category(id: str, current_user_id: str = Depends(get_current_user_id)):
     """ ลบ category """
-    # ตรวจสอบก่อนว่า category นี้เป็นของผู้ใช้ที่ login อยู่หรือไม่
-    existing_category = await categories_collection.find_one({"_id": ObjectId(id)})
-    if not existing_category or existing_category.get("user_id") != current_user_id:
-        raise HTTPException(status_code=404, detail="Category not found or not authorized")
-
-    result = await categories_collection.delete_one({"_id": ObjectId(id)})
+    # ลบเฉพาะ category ที่เป็นของผู้ใช้ที่ login อยู่
+    result = await categories_collection.delete_one({"_id": ObjectId(id), "user_id": current_user_id})
     if result.deleted_count == 0:
-        raise HTTPException(status_code=404, detail="Category not found")
+        raise HTTPException(status_code=404, detail="Category not found or not authorized")
+    await data_changed(current_user_id, delete_change(id))
+    await publish_event("deleted", current_user_id, id)
     return
+
+
+# 🔔 Server-Sent Events ของทุกการเปลี่ยนแปลง categories ของผู้ใช้ (ดู app/changes.py)
+# ให้ client แก้รายการที่มีอยู่แทนการดึงใหม่ทั้งหมด
+@app.get("/categories/changes")
+async def category_changes(current_user_id: str = Depends(get_current_user_id)):
+    return change_feed.stream(versions_collection, current_user_id)
+
+
+# 📨 Outbox feed สำหรับ service อื่น (ไม่ได้เปิดผ่าน nginx/ingress): event ที่ยังไม่ถูก ack เรียงจากเก่าไปใหม่
+@app.get("/internal/category-events", response_model=List[CategoryEvent], dependencies=[Depends(require_events_scope)])
+async def get_category_events(limit: int = Query(100, ge=1, le=MAX_EVENTS_PER_FETCH)):
+    events = await events_collection.find().sort("_id", ASCENDING).limit(limit).to_list(None)
+    return [CategoryEvent(id=str(event.pop("_id")), **event) for event in events]
+
+
+# 📨 id ของ category ทั้งหมดที่ผู้ใช้ยังมีอยู่ ใช้ตอน reconcile event ที่หายไป
+@app.get("/internal/category-ids", response_model=List[str], dependencies=[Depends(require_events_scope)])
+async def get_category_ids(user_id: str):
+    categories = await categories_collection.find({"user_id": user_id}, {"_id": 1}).to_list(None)
+    return [str(category["_id"]) for category in categories]
+
+
+@app.post("/internal/category-events/ack", dependencies=[Depends(require_events_scope)])
+async def ack_category_events(ack: EventAck):
+    """ ลบ event ที่ประมวลผลเสร็จแล้ว """
+    object_ids = [ObjectId(i) for i in ack.ids if ObjectId.is_valid(i)]
+    result = await events_collection.delete_many({"_id": {"$in": object_ids}})
+    return {"deleted": result.deleted_count}
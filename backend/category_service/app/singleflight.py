@@ -0,0 +1,44 @@
+import asyncio
+
+from prometheus_client import Counter
+
+# This module is kept identical in transaction_service and category_service;
+# each image only ships its own app/ directory, so copy changes to both
+# (transaction_service tests/test_shared.py fails while they differ).
+#
+# Collapses identical concurrent reads in one worker process into a single
+# MongoDB call whose result every caller receives. Key reads by their ETag
+# (see app/versions.py): it names the user, the request and the data version,
+# so a read that starts after a write has finished never joins an older one.
+
+SINGLEFLIGHT_CALLS = Counter(
+    "singleflight_calls_total",
+    "Read calls by handler, either executed or coalesced into one already in flight",
+    ["name", "result"],
+)
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = {}
+
+    async def do(self, key, load):
+        """
+        Return `await load()`, sharing one call between concurrent callers with
+        the same key. Callers get the same object, so they must not mutate it.
+        """
+        task = self.calls.get(key)
+        if task is None:
+            # A task of its own, so a caller that disconnects doesn't cancel the others
+            task = asyncio.ensure_future(load())
+            self.calls[key] = task
+            task.add_done_callback(lambda _: self.forget(key, task))
+            SINGLEFLIGHT_CALLS.labels(self.name, "executed").inc()
+        else:
+            SINGLEFLIGHT_CALLS.labels(self.name, "coalesced").inc()
+        return await asyncio.shield(task)
+
+    def forget(self, key, task):
+        if self.calls.get(key) is task:
+            del self.calls[key]
@@ -0,0 +1,82 @@
+import hashlib
+from typing import Optional
+
+from fastapi import HTTPException, Request
+from pymongo import ReturnDocument
+
+# This module is kept identical in transaction_service and category_service;
+# each image only ships its own app/ directory, so copy changes to both
+# (transaction_service tests/test_shared.py fails while they differ).
+#
+# One document per user, {"_id": user_id, "version": n, "change": {...}},
+# bumped after every write to that user's data. Listing and summary responses
+# derive a strong ETag from it, so a conditional GET that hits costs one _id
+# lookup instead of the query and the payload. `change` describes the latest
+# write for the per-user event streams in app/changes.py.
+
+CACHE_CONTROL = "private, no-cache"
+# The version a listing was read at, so a client can tell which change events
+# it already holds; CORS has to expose it alongside ETag
+VERSION_HEADER = "X-Data-Version"
+
+
+async def current_version(versions, user_id: str, session=None) -> int:
+    doc = await versions.find_one({"_id": user_id}, {"version": 1}, session=session)
+    return doc["version"] if doc else 0
+
+
+async def bump_version(versions, user_id: str, change: Optional[dict] = None) -> int:
+    """
+    Call once the write itself has succeeded. A reader that sees the new
+    version then also sees the new data; a reader racing the other way only
+    tags fresh data with the old version, which costs one extra full fetch.
+    Leave `change` out when the write is too big to describe; returns the new version.
+    """
+    doc = await versions.find_one_and_update(
+        {"_id": user_id},
+        {"$inc": {"version": 1}, "$set": {"change": change}},
+        projection={"version": 1},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return doc["version"]
+
+
+def make_etag(request: Request, user_id: str, version: int, *extra) -> str:
+    # The URL picks the representation; `extra` covers inputs it doesn't show (e.g. today's year)
+    key = "|".join(str(part) for part in (user_id, version, request.url.path, request.url.query, *extra))
+    return '"%s"' % hashlib.sha1(key.encode()).hexdigest()
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    # If-None-Match uses weak comparison, so W/"x" matches "x"
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in tags or etag in tags
+
+
+def cache_headers(etag: str, version: Optional[int] = None) -> dict:
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if version is not None:
+        headers[VERSION_HEADER] = str(version)
+    return headers
+
+
+async def check_version(versions, request: Request, user_id: str, *extra, session=None):
+    """
+    Return (ETag, version) for this response, or answer 304 if the client
+    already holds it. Reads in a causally consistent `session` then see at
+    least the data of that version (see causal_session in app/mongo.py).
+    """
+    version = await current_version(versions, user_id, session)
+    etag = make_etag(request, user_id, version, *extra)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        raise HTTPException(status_code=304, headers=cache_headers(etag, version))
+    return etag, version
+
+
+async def check_etag(versions, request: Request, user_id: str, *extra, session=None) -> str:
+    """check_version for responses that don't send the version itself."""
+    etag, _ = await check_version(versions, request, user_id, *extra, session=session)
+    return etag
@@ -0,0 +1,177 @@
+import os
+from datetime import datetime
+
+import numpy as np
+
+# --------------------------------
+# Analytics
+# --------------------------------
+# One projected pass over the cursor fills a few parallel NumPy columns;
+# everything after that works on whole arrays, so the cost is reading the
+# rows once rather than Python loops over them. compute_analytics is plain
+# CPU work, so callers run it off the event loop.
+
+ANALYTICS_PROJECTION = {"amount": 1, "date": 1, "type": 1, "category_id": 1}
+ANALYTICS_BATCH_SIZE = int(os.environ.get("ANALYTICS_BATCH_SIZE", "2000"))
+
+PERCENTILES = (25, 50, 75, 90)
+# Tukey's fences: an expense is unusual above Q3 + factor * IQR of its category...
+OUTLIER_IQR_FACTOR = float(os.environ.get("OUTLIER_IQR_FACTOR", "1.5"))
+# ...once the category has enough expenses for its quartiles to mean something
+OUTLIER_MIN_SAMPLES = int(os.environ.get("OUTLIER_MIN_SAMPLES", "8"))
+MAX_OUTLIERS = 50
+
+
+class Columns:
+    """A set of transactions as parallel arrays; categories[code] is the category_id behind a code."""
+
+    def __init__(self, ids: list, dates, months, amounts, is_expense, codes, categories: list):
+        self.ids = ids
+        self.dates = dates
+        self.months = months
+        self.amounts = amounts
+        self.is_expense = is_expense
+        self.codes = codes
+        self.categories = categories
+
+    def __len__(self):
+        return len(self.ids)
+
+
+async def load_columns(cursor) -> Columns:
+    ids, dates, months, amounts, is_expense, codes = [], [], [], [], [], []
+    category_codes = {}
+    async for doc in cursor:
+        date = doc["date"]
+        ids.append(str(doc["_id"]))
+        dates.append(date)
+        # Months counted from year 0, so consecutive months differ by one
+        months.append(date.year * 12 + date.month - 1)
+        amounts.append(doc["amount"])
+        is_expense.append(doc["type"] == "expense")
+        codes.append(category_codes.setdefault(doc.get("category_id"), len(category_codes)))
+    return Columns(
+        ids,
+        np.array(dates, dtype="datetime64[ms]"),
+        np.array(months, dtype=np.int64),
+        np.array(amounts, dtype=np.float64),
+        np.array(is_expense, dtype=bool),
+        np.array(codes, dtype=np.int64),
+        list(category_codes),
+    )
+
+
+def rolling_mean(values, window: int):
+    """Mean of each value and the window - 1 before it (fewer at the start)."""
+    sums = np.concatenate(([0.0], np.cumsum(values)))
+    ends = np.arange(1, len(values) + 1)
+    starts = np.maximum(ends - window, 0)
+    return (sums[ends] - sums[starts]) / (ends - starts)
+
+
+def year_over_year(values):
+    """Change from the same month a year earlier; NaN where that month is before the data starts."""
+    previous = np.full(len(values), np.nan)
+    previous[12:] = values[:-12]
+    return values - previous, previous
+
+
+def optional(value):
+    return None if np.isnan(value) else float(value)
+
+
+def monthly_trends(columns: Columns, window: int) -> list:
+    first = columns.months.min()
+    offsets = columns.months - first
+    length = offsets.max() + 1
+    income = np.bincount(offsets, weights=np.where(columns.is_expense, 0.0, columns.amounts), minlength=length)
+    expense = np.bincount(offsets, weights=np.where(columns.is_expense, columns.amounts, 0.0), minlength=length)
+    net = income - expense
+    income_avg, expense_avg, net_avg = (rolling_mean(v, window) for v in (income, expense, net))
+    income_yoy, _ = year_over_year(income)
+    expense_yoy, expense_before = year_over_year(expense)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        expense_yoy_pct = np.where(expense_before > 0, expense_yoy / expense_before * 100, np.nan)
+
+    return [
+        {
+            "year": int(month // 12),
+            "month": int(month % 12) + 1,
+            "income": float(income[i]),
+            "expense": float(expense[i]),
+            "net": float(net[i]),
+            "income_avg": float(income_avg[i]),
+            "expense_avg": float(expense_avg[i]),
+            "net_avg": float(net_avg[i]),
+            "income_yoy": optional(income_yoy[i]),
+            "expense_yoy": optional(expense_yoy[i]),
+            "expense_yoy_pct": optional(expense_yoy_pct[i]),
+        }
+        for i, month in enumerate(range(first, first + length))
+    ]
+
+
+def group_quantile(sorted_values, starts, counts, q: float):
+    """Per-group quantile of values sorted within each group, interpolated like np.percentile."""
+    position = (counts - 1) * q
+    below = np.floor(position).astype(np.int64)
+    above = np.ceil(position).astype(np.int64)
+    low, high = sorted_values[starts + below], sorted_values[starts + above]
+    return low + (position - below) * (high - low)
+
+
+def category_spending(columns: Columns):
+    """Expense percentiles per category, and the expenses above their category's upper fence."""
+    rows = np.flatnonzero(columns.is_expense)
+    if not len(rows):
+        return [], []
+    # Group by category, ascending amount within each
+    rows = rows[np.lexsort((columns.amounts[rows], columns.codes[rows]))]
+    amounts, codes = columns.amounts[rows], columns.codes[rows]
+    groups, starts, counts = np.unique(codes, return_index=True, return_counts=True)
+
+    quantiles = {p: group_quantile(amounts, starts, counts, p / 100) for p in PERCENTILES}
+    q1, q3 = quantiles[25], quantiles[75]
+    fences = np.where(counts >= OUTLIER_MIN_SAMPLES, q3 + OUTLIER_IQR_FACTOR * (q3 - q1), np.inf)
+    totals = np.add.reduceat(amounts, starts)
+
+    # Biggest spending first
+    categories = [
+        {
+            "category_id": columns.categories[groups[g]],
+            "count": int(counts[g]),
+            "total": float(totals[g]),
+            **{f"p{p}": float(quantiles[p][g]) for p in PERCENTILES},
+            "outlier_threshold": None if np.isinf(fences[g]) else float(fences[g]),
+        }
+        for g in np.argsort(-totals, kind="stable")
+    ]
+
+    fence_per_row = np.repeat(fences, counts)
+    flagged = amounts > fence_per_row
+    outlier_rows, outlier_fences = rows[flagged], fence_per_row[flagged]
+    # Most recent first
+    recent = np.argsort(columns.dates[outlier_rows])[::-1][:MAX_OUTLIERS]
+    outliers = [
+        {
+            "transaction_id": columns.ids[row],
+            "date": columns.dates[row].astype(datetime),
+            "amount": float(columns.amounts[row]),
+            "category_id": columns.categories[columns.codes[row]],
+            "threshold": float(fence),
+        }
+        for row, fence in zip(outlier_rows[recent], outlier_fences[recent])
+    ]
+    return categories, outliers
+
+
+def compute_analytics(columns: Columns, window: int) -> dict:
+    if not len(columns):
+        return {"window": window, "months": [], "categories": [], "outliers": []}
+    categories, outliers = category_spending(columns)
+    return {
+        "window": window,
+        "months": monthly_trends(columns, window),
+        "categories": categories,
+        "outliers": outliers,
+    }
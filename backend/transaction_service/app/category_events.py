@@ -0,0 +1,215 @@
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import sys
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+
+import httpx
+from jose import jwt
+from prometheus_client import Counter, Histogram
+from pymongo.errors import DuplicateKeyError
+
+# --------------------------------
+# Category events consumer
+# --------------------------------
+# category_service records category deletes and renames in an outbox and
+# serves them at /internal/category-events (not routed by nginx/ingress).
+# One worker across all replicas, whichever holds the lease, polls that feed,
+# hands each batch to `apply_events` and acks it. A batch that fails stays
+# in the outbox and is retried with exponential backoff, so `apply_events`
+# must be idempotent.
+#
+# category_service writes an event after the change itself, so a crash in
+# between loses it. `reconcile` repairs lost deletes: it finds categories that
+# transactions or rollups here still point at but category_service no longer
+# has, and applies the `deleted` event that never arrived:
+#
+#   python -m app.category_events reconcile [--user USER_ID] [--dry-run]
+
+CATEGORY_EVENTS_ENABLED = os.environ.get("CATEGORY_EVENTS_ENABLED", "true").lower() == "true"
+CATEGORY_EVENTS_POLL_INTERVAL = float(os.environ.get("CATEGORY_EVENTS_POLL_INTERVAL", "5"))
+CATEGORY_EVENTS_BATCH_SIZE = int(os.environ.get("CATEGORY_EVENTS_BATCH_SIZE", "100"))
+CATEGORY_EVENTS_MAX_BACKOFF = float(os.environ.get("CATEGORY_EVENTS_MAX_BACKOFF", "300"))
+# Another worker takes over once the holder hasn't renewed the lease for this long
+CATEGORY_EVENTS_LEASE_SECONDS = float(os.environ.get("CATEGORY_EVENTS_LEASE_SECONDS", "60"))
+
+# Must match EVENTS_SCOPE in category_service
+EVENTS_SCOPE = "category-events"
+LEASE_NAME = "category-events"
+
+EVENTS_APPLIED = Counter(
+    "category_events_applied_total",
+    "Category events applied to transactions, by event type",
+    ["type"],
+)
+EVENT_BATCH_FAILURES = Counter(
+    "category_events_failures_total",
+    "Category event batches that failed and will be retried",
+)
+EVENT_LAG = Histogram(
+    "category_events_lag_seconds",
+    "Time from the change in category_service to applying it here",
+    buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 900, 3600),
+)
+
+logger = logging.getLogger(__name__)
+
+
+def service_token(secret_key: str, algorithm: str) -> str:
+    expire = datetime.utcnow() + timedelta(minutes=5)
+    return jwt.encode(
+        {"sub": "transaction_service", "scope": EVENTS_SCOPE, "exp": expire},
+        secret_key,
+        algorithm=algorithm,
+    )
+
+
+async def acquire_lease(leases, owner: str, seconds: float = CATEGORY_EVENTS_LEASE_SECONDS) -> bool:
+    """Take or renew the lease; False while another live owner holds it."""
+    now = datetime.utcnow()
+    try:
+        await leases.update_one(
+            {"_id": LEASE_NAME, "$or": [{"owner": owner}, {"expires_at": {"$lt": now}}]},
+            {"$set": {"owner": owner, "expires_at": now + timedelta(seconds=seconds)}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        # The filter didn't match because someone else holds it, so the upsert collided
+        return False
+    return True
+
+
+class CategoryEventConsumer:
+    def __init__(self, http, leases, apply_events, secret_key: str, algorithm: str):
+        self.http = http
+        self.leases = leases
+        self.apply_events = apply_events
+        self.secret_key = secret_key
+        self.algorithm = algorithm
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+
+    async def poll_once(self) -> int:
+        """Fetch, apply and ack one batch; returns how many events it contained."""
+        headers = {"Authorization": f"Bearer {service_token(self.secret_key, self.algorithm)}"}
+        response = await self.http.get(
+            "/internal/category-events", params={"limit": CATEGORY_EVENTS_BATCH_SIZE}, headers=headers
+        )
+        response.raise_for_status()
+        events = response.json()
+        if not events:
+            return 0
+
+        await self.apply_events(events)
+        now = datetime.utcnow()
+        for event in events:
+            EVENTS_APPLIED.labels(event["type"]).inc()
+            EVENT_LAG.observe(max(0.0, (now - datetime.fromisoformat(event["created_at"])).total_seconds()))
+
+        ack = await self.http.post(
+            "/internal/category-events/ack", json={"ids": [event["id"] for event in events]}, headers=headers
+        )
+        ack.raise_for_status()
+        return len(events)
+
+    async def run(self):
+        backoff = CATEGORY_EVENTS_POLL_INTERVAL
+        while True:
+            delay = CATEGORY_EVENTS_POLL_INTERVAL
+            try:
+                if await acquire_lease(self.leases, self.owner):
+                    if await self.poll_once() == CATEGORY_EVENTS_BATCH_SIZE:
+                        # Probably more waiting; don't sleep
+                        delay = 0
+                backoff = CATEGORY_EVENTS_POLL_INTERVAL
+            except Exception as e:
+                # Keep the loop alive whatever went wrong; the batch is retried.
+                # Network trouble is routine, anything else gets a traceback.
+                EVENT_BATCH_FAILURES.inc()
+                logger.warning(
+                    "Applying category events failed, retrying in %.1fs: %r", backoff, e,
+                    exc_info=not isinstance(e, httpx.HTTPError),
+                )
+                delay = backoff
+                backoff = min(backoff * 2, CATEGORY_EVENTS_MAX_BACKOFF)
+            await asyncio.sleep(delay)
+
+
+@asynccontextmanager
+async def category_event_consumer(http, leases, apply_events, secret_key: str, algorithm: str):
+    """Run the consumer for the lifetime of the app (if enabled); enter it from the lifespan."""
+    if not CATEGORY_EVENTS_ENABLED:
+        yield
+        return
+    consumer = CategoryEventConsumer(http, leases, apply_events, secret_key, algorithm)
+    task = asyncio.create_task(consumer.run())
+    try:
+        yield
+    finally:
+        task.cancel()
+
+
+# --------------------------------
+# Reconcile
+# --------------------------------
+def referenced_categories_pipeline() -> list:
+    return [
+        {"$match": {"category_id": {"$ne": None}}},
+        {"$group": {"_id": {"user_id": "$user_id", "category_id": "$category_id"}}},
+    ]
+
+
+async def referenced_categories(store, rollups, scope: dict) -> dict:
+    """user_id -> category ids its transactions (read through an app.storage store) or rollups point at."""
+    referenced = {}
+    for cursor in (
+        store.aggregate(scope, referenced_categories_pipeline()),
+        rollups.aggregate([{"$match": scope}, *referenced_categories_pipeline()]),
+    ):
+        async for row in cursor:
+            referenced.setdefault(row["_id"]["user_id"], set()).add(row["_id"]["category_id"])
+    return referenced
+
+
+async def reconcile(http, store, rollups, apply_events, secret_key: str, algorithm: str,
+                    user_id: str = None, dry_run: bool = False) -> list:
+    """Apply (unless dry_run) and return a `deleted` event for every category that's gone from category_service."""
+    scope = {} if user_id is None else {"user_id": user_id}
+    headers = {"Authorization": f"Bearer {service_token(secret_key, algorithm)}"}
+    events = []
+    for user, category_ids in sorted((await referenced_categories(store, rollups, scope)).items()):
+        response = await http.get("/internal/category-ids", params={"user_id": user}, headers=headers)
+        response.raise_for_status()
+        for category_id in sorted(category_ids - set(response.json())):
+            events.append({"type": "deleted", "user_id": user, "category_id": category_id})
+    if events and not dry_run:
+        await apply_events(events)
+    return events
+
+
+async def run_command(argv) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.category_events")
+    parser.add_argument("command", choices=["reconcile"])
+    parser.add_argument("--user", help="Only this user_id (default: everyone)")
+    parser.add_argument("--dry-run", action="store_true", help="Only list what would be applied")
+    args = parser.parse_args(argv)
+
+    from app import main
+    from app.mongo import create_mongo_client
+
+    main.bind_database(create_mongo_client(main.MONGO_URI))
+    async with httpx.AsyncClient(base_url=main.CATEGORY_SERVICE_URL, timeout=main.CATEGORY_LOOKUP_TIMEOUT) as http:
+        events = await reconcile(
+            http, main.transaction_store, main.rollups_collection, main.apply_category_events,
+            main.SECRET_KEY, main.ALGORITHM, args.user, args.dry_run,
+        )
+    for event in events:
+        print(event)
+    print(f"{len(events)} deleted categories {'found' if args.dry_run else 'applied'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(run_command(sys.argv[1:])))
@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import orjson
+from fastapi.responses import StreamingResponse
+from prometheus_client import Counter, Gauge
+from pymongo.errors import PyMongoError
+
+from app.versions import current_version
+
+# This module is kept identical in transaction_service and category_service;
+# each image only ships its own app/ directory, so copy changes to both
+# (transaction_service tests/test_shared.py fails while they differ).
+#
+# Per-user Server-Sent Events describing each write, so clients patch the
+# lists they hold instead of downloading them again. Every write already
+# bumps the user's document in the versions collection (see app/versions.py)
+# and records the change there, so that one update is the whole feed:
+#
+# - on a replica set (or mongos) every worker watches the versions
+#   collection with a change stream, which sees the writes of all workers
+#   and replicas;
+# - a standalone mongod has no change streams, so each worker broadcasts its
+#   own writes to its own subscribers. Writes made elsewhere show up as a gap
+#   in the version numbers of the next event.
+#
+# Events, each with the `version` the write produced:
+#   ready   first on every connection; the version the user's data is at
+#   upsert  `doc`, the row as the listing returns it
+#   delete  `id`
+#   reset   a write too big to describe (bulk import, category cleanup)
+# A client refetches on `reset`, on a version gap, and on a `ready` whose
+# version isn't the one it holds; it skips events it has already seen.
+
+# "auto" uses change streams where the deployment has them; or force "change-stream" / "local"
+CHANGE_FEED_SOURCE = os.environ.get("CHANGE_FEED_SOURCE", "auto")
+if CHANGE_FEED_SOURCE not in ("auto", "change-stream", "local"):
+    raise RuntimeError("CHANGE_FEED_SOURCE must be 'auto', 'change-stream' or 'local'")
+# A comment line this often keeps proxies from timing idle streams out
+CHANGE_FEED_HEARTBEAT = float(os.environ.get("CHANGE_FEED_HEARTBEAT", "15"))
+# Streams end after this long, so open ones don't hold a draining worker; clients reconnect
+CHANGE_FEED_MAX_SECONDS = float(os.environ.get("CHANGE_FEED_MAX_SECONDS", "300"))
+# Events a slow client may fall behind by before its stream is closed
+CHANGE_FEED_QUEUE_SIZE = int(os.environ.get("CHANGE_FEED_QUEUE_SIZE", "100"))
+CHANGE_FEED_RETRY_MS = 3000
+CHANGE_FEED_MAX_BACKOFF = 60.0
+
+STREAM_HEADERS = {
+    "Cache-Control": "no-cache",
+    # Tells nginx (and ingress-nginx) not to buffer the stream
+    "X-Accel-Buffering": "no",
+}
+
+CHANGE_FEED_SUBSCRIBERS = Gauge(
+    "change_feed_subscribers",
+    "Open per-user change streams",
+    multiprocess_mode="livesum",
+)
+CHANGE_FEED_CLOSED = Counter(
+    "change_feed_closed_total",
+    "Change streams closed early so the client reconnects and refetches",
+    ["reason"],
+)
+
+logger = logging.getLogger(__name__)
+
+
+def upsert_change(row: dict) -> dict:
+    return {"op": "upsert", "doc": row}
+
+
+def delete_change(id: str) -> dict:
+    return {"op": "delete", "id": id}
+
+
+def sse_event(event: str, data: dict, id: Optional[int] = None, retry: Optional[int] = None) -> bytes:
+    lines = [f"event: {event}"]
+    if id is not None:
+        lines.append(f"id: {id}")
+    if retry is not None:
+        lines.append(f"retry: {retry}")
+    # orjson never emits a newline, so the payload is a single data line
+    lines.append("data: " + orjson.dumps(data).decode())
+    return ("\n".join(lines) + "\n\n").encode()
+
+
+async def detect_source(client) -> str:
+    if CHANGE_FEED_SOURCE != "auto":
+        return CHANGE_FEED_SOURCE
+    hello = await client.admin.command("hello")
+    # Change streams read the oplog, which replica set members and mongos have and a standalone doesn't
+    return "change-stream" if "setName" in hello or hello.get("msg") == "isdbgrid" else "local"
+
+
+class ChangeFeed:
+    def __init__(self):
+        # user_id -> queues of that user's open streams in this worker
+        self.subscribers = {}
+        self.source = "local"
+
+    def written(self, user_id: str, version: int, change: Optional[dict]):
+        """Report a write made by this worker; the change stream reports it otherwise."""
+        if self.source == "local":
+            self.publish(user_id, version, change)
+
+    def publish(self, user_id: str, version: int, change: Optional[dict]):
+        for queue in self.subscribers.get(user_id, ()):
+            if queue.full():
+                # Too far behind to catch up event by event
+                CHANGE_FEED_CLOSED.labels("overflow").inc()
+                self.close(queue)
+            else:
+                queue.put_nowait((version, change))
+
+    def close(self, queue: asyncio.Queue):
+        """End the stream reading `queue`; what's still queued is covered by the refetch after it reconnects."""
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(None)
+
+    def close_all(self, reason: str):
+        for queues in self.subscribers.values():
+            for queue in queues:
+                CHANGE_FEED_CLOSED.labels(reason).inc()
+                self.close(queue)
+
+    async def watch(self, versions):
+        backoff = 1.0
+        pipeline = [{"$match": {"operationType": {"$in": ["insert", "update"]}}}]
+        while True:
+            try:
+                async with versions.watch(pipeline) as stream:
+                    backoff = 1.0
+                    async for event in stream:
+                        # The first bump for a user is an upsert, so an insert
+                        fields = event.get("fullDocument") or event["updateDescription"]["updatedFields"]
+                        # A `change` equal to the previous one isn't in updatedFields; a reset is always safe
+                        self.publish(event["documentKey"]["_id"], fields["version"], fields.get("change"))
+            except PyMongoError as e:
+                logger.warning("Change stream on %s failed, restarting in %.1fs: %r", versions.name, backoff, e)
+            # Events may have been missed meanwhile; reconnecting clients compare versions and refetch
+            self.close_all("source")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, CHANGE_FEED_MAX_BACKOFF)
+
+    @asynccontextmanager
+    async def running(self, client, versions):
+        """Pick the source and watch for the lifetime of the app if it's a change stream; enter it from the lifespan."""
+        self.source = await detect_source(client)
+        logger.info("Change feed source: %s", self.source)
+        if self.source == "local":
+            yield
+            return
+        task = asyncio.create_task(self.watch(versions))
+        try:
+            yield
+        finally:
+            task.cancel()
+
+    async def events(self, versions, user_id: str):
+        queue = asyncio.Queue(CHANGE_FEED_QUEUE_SIZE)
+        self.subscribers.setdefault(user_id, set()).add(queue)
+        CHANGE_FEED_SUBSCRIBERS.inc()
+        try:
+            # Read after subscribing, so every write past this version is queued
+            yield sse_event("ready", {"version": await current_version(versions, user_id)}, retry=CHANGE_FEED_RETRY_MS)
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + CHANGE_FEED_MAX_SECONDS
+            while (remaining := deadline - loop.time()) > 0:
+                try:
+                    item = await asyncio.wait_for(queue.get(), min(CHANGE_FEED_HEARTBEAT, remaining))
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
+                    continue
+                if item is None:
+                    break
+                version, change = item
+                change = change or {"op": "reset"}
+                yield sse_event(change["op"], {"version": version, **change}, id=version)
+        finally:
+            queues = self.subscribers[user_id]
+            queues.discard(queue)
+            if not queues:
+                del self.subscribers[user_id]
+            CHANGE_FEED_SUBSCRIBERS.dec()
+
+    def stream(self, versions, user_id: str) -> StreamingResponse:
+        return StreamingResponse(self.events(versions, user_id), media_type="text/event-stream", headers=STREAM_HEADERS)
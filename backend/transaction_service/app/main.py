@@ -1,15 +1,40 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi import Depends
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field, GetCoreSchemaHandler
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, GetCoreSchemaHandler, ValidationError
 from pydantic_core import core_schema
 from typing import Optional, List
-from datetime import datetime
+from datetime import datetime, timezone
+from contextlib import asynccontextmanager
 from bson import ObjectId
-import motor.motor_asyncio
+from bson.errors import InvalidId
+import httpx
+import logging
+from pymongo import ASCENDING, DESCENDING
+import asyncio
 import os
-from jose import JWTError, jwt
+import io
+import csv
+import codecs
+import collections
+import json
+import base64
+import orjson
+from jose import JWTError
 from fastapi.security import OAuth2PasswordBearer
+from app.analytics import ANALYTICS_BATCH_SIZE, ANALYTICS_PROJECTION, compute_analytics, load_columns
+from app.auth import TTLCache, TokenVerifier
+from app.cache import SharedCache, create_shared_cache
+from app.category_events import category_event_consumer
+from app.changes import ChangeFeed, delete_change, upsert_change
+from app.metrics import event_loop_monitor, instrument
+from app.mongo import causal_session, create_mongo_client, for_reports, warm_up_pool
+from app.singleflight import SingleFlight
+from app.rollups import ROLLUP_INDEXES, apply_rollups, move_category_rollups, rebuild_rollups
+from app.storage import BucketStore, DocumentStore
+from app.versions import VERSION_HEADER, bump_version, cache_headers, check_etag, check_version, current_version
 
 # --------------------------------
 # Config
@@ -22,17 +47,130 @@ except KeyError:
     raise RuntimeError("MONGO_URI environment variable not set. Application cannot start.")
 DB_NAME = "transactions_service"
 COLLECTION_NAME = "transactions_db"
+ROLLUPS_COLLECTION_NAME = "monthly_rollups"
+VERSIONS_COLLECTION_NAME = "user_versions"
+LEASES_COLLECTION_NAME = "leases"
+# One-off data migrations that have completed, by name
+MIGRATIONS_COLLECTION_NAME = "migrations"
+BUCKETS_COLLECTION_NAME = "transaction_buckets"
+
+# "documents" (one per transaction) or "buckets" (one per user-month); see app/storage.py
+TRANSACTION_STORAGE = os.environ.get("TRANSACTION_STORAGE", "documents")
+if TRANSACTION_STORAGE not in ("documents", "buckets"):
+    raise RuntimeError(f"TRANSACTION_STORAGE must be 'documents' or 'buckets', not {TRANSACTION_STORAGE!r}")
+
+# Paging / streaming
+MAX_PAGE_SIZE = int(os.environ.get("MAX_PAGE_SIZE", "500"))
+# Page size of a listing that doesn't pass `limit`; the whole list is at /transactions/stream
+DEFAULT_PAGE_SIZE = min(int(os.environ.get("DEFAULT_PAGE_SIZE", "100")), MAX_PAGE_SIZE)
+STREAM_BATCH_SIZE = int(os.environ.get("STREAM_BATCH_SIZE", "200"))
+
+# Skip per-row pydantic validation on listings and encode them with orjson
+FAST_JSON_RESPONSES = os.environ.get("FAST_JSON_RESPONSES", "false").lower() == "true"
+
+# Bulk import: rows per insert_many batch, and how many row errors to report back
+BULK_CHUNK_SIZE = int(os.environ.get("BULK_CHUNK_SIZE", "500"))
+BULK_MAX_REPORTED_ERRORS = int(os.environ.get("BULK_MAX_REPORTED_ERRORS", "100"))
+
+# Category names for ?expand=category are looked up in category_service
+CATEGORY_SERVICE_URL = os.environ.get("CATEGORY_SERVICE_URL", "http://category_service:8000")
+CATEGORY_LOOKUP_TIMEOUT = float(os.environ.get("CATEGORY_LOOKUP_TIMEOUT", "2"))
+CATEGORY_CACHE_SIZE = int(os.environ.get("CATEGORY_CACHE_SIZE", "10000"))
+CATEGORY_CACHE_TTL = float(os.environ.get("CATEGORY_CACHE_TTL", "60"))
+# Must not exceed MAX_BATCH_IDS in category_service
+CATEGORY_BATCH_SIZE = 500
+
+# /transactions/analytics results kept per worker: up to ANALYTICS_CACHE_PER_USER
+# parameter sets for each of the ANALYTICS_CACHE_USERS most recent users
+ANALYTICS_CACHE_USERS = int(os.environ.get("ANALYTICS_CACHE_USERS", "1000"))
+ANALYTICS_CACHE_PER_USER = int(os.environ.get("ANALYTICS_CACHE_PER_USER", "8"))
+ANALYTICS_CACHE_TTL = float(os.environ.get("ANALYTICS_CACHE_TTL", "600"))
+
+# Run explain() on the hot queries at startup and refuse to start on a COLLSCAN
+CHECK_QUERY_PLANS = os.environ.get("CHECK_QUERY_PLANS", "false").lower() == "true"
 
 # --- Security ---
 SECRET_KEY = os.environ.get("SECRET_KEY", "a_default_secret_key_for_development")
 ALGORITHM = "HS256"
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+token_verifier = TokenVerifier(SECRET_KEY, ALGORITHM)
+
+logger = logging.getLogger(__name__)
+
+# Created in the lifespan, so every worker process opens its own pools
+client = None
+db = None
+transactions_collection = None
+# Every read and write of transactions goes through this
+transaction_store = None
+rollups_collection = None
+# The same, reading where MONGO_REPORT_READ_PREFERENCE says (see app/mongo.py);
+# only for report reads, in a causal_session anchored on the user's version
+report_store = None
+report_rollups = None
+versions_collection = None
+leases_collection = None
+migrations_collection = None
+category_http = None
+# Replaced in the lifespan; a no-op until then (and when REDIS_URL isn't set)
+summary_cache = SharedCache(None, "summaries")
+
+
+def bind_database(mongo_client):
+    global client, db, transactions_collection, transaction_store, rollups_collection, versions_collection, \
+        leases_collection, migrations_collection, report_store, report_rollups
+    client = mongo_client
+    db = client[DB_NAME]
+    transactions_collection = db[COLLECTION_NAME]
+    if TRANSACTION_STORAGE == "buckets":
+        transaction_store = BucketStore(db[BUCKETS_COLLECTION_NAME])
+        report_store = BucketStore(for_reports(db[BUCKETS_COLLECTION_NAME]))
+    else:
+        transaction_store = DocumentStore(transactions_collection)
+        report_store = DocumentStore(for_reports(transactions_collection))
+    rollups_collection = db[ROLLUPS_COLLECTION_NAME]
+    report_rollups = for_reports(rollups_collection)
+    versions_collection = db[VERSIONS_COLLECTION_NAME]
+    leases_collection = db[LEASES_COLLECTION_NAME]
+    migrations_collection = db[MIGRATIONS_COLLECTION_NAME]
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global category_http, summary_cache
+    bind_database(create_mongo_client(MONGO_URI))
+    category_http = httpx.AsyncClient(base_url=CATEGORY_SERVICE_URL, timeout=CATEGORY_LOOKUP_TIMEOUT)
+    summary_cache = create_shared_cache("summaries")
+    # Everything below finishes before the server accepts its first request
+    await warm_up_pool(client)
+    await ensure_indexes()
+    await ensure_rollups()
+    if CHECK_QUERY_PLANS:
+        await verify_query_plans()
+    async with event_loop_monitor(), change_feed.running(client, versions_collection), category_event_consumer(
+        category_http, leases_collection, apply_category_events, SECRET_KEY, ALGORITHM
+    ):
+        yield
+    await category_http.aclose()
+    await summary_cache.close()
+    client.close()
 
-app = FastAPI(title="Transaction Service")
 
-client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_URI)
-db = client[DB_NAME]
-transactions_collection = db[COLLECTION_NAME]
+app = FastAPI(title="Transaction Service", lifespan=lifespan)
+
+# (user_id, category_id) -> name; "" remembers ids category_service doesn't know
+category_name_cache = TTLCache(CATEGORY_CACHE_SIZE, CATEGORY_CACHE_TTL)
+
+# user_id -> TTLCache of analytics results by ETag
+analytics_cache = TTLCache(ANALYTICS_CACHE_USERS, ANALYTICS_CACHE_TTL)
+
+# Identical concurrent reads in this worker share one MongoDB call
+listing_flight = SingleFlight("get_transactions")
+summaries_flight = SingleFlight("summaries")
+analytics_flight = SingleFlight("analytics")
+
+# Per-user streams of writes, served at /transactions/changes
+change_feed = ChangeFeed()
 
 origins = [
     "http://localhost:5173",  # Origin ของ React App
@@ -46,7 +184,76 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"], # อนุญาตทุก Method
     allow_headers=["*"], # อนุญาตทุก Header
+    expose_headers=["X-Next-Cursor", "ETag", VERSION_HEADER],
 )
+instrument(app)
+
+
+# --------------------------------
+# Indexes
+# --------------------------------
+# Transaction indexes depend on the storage layout and live with each store in app/storage.py
+def hot_queries():
+    probe_user = "__query_plan_check__"
+    start_date, end_date = datetime(2000, 1, 1), datetime(2000, 2, 1)
+    return {
+        "get_transactions": transaction_store.plan_cursor({"user_id": probe_user}, KEYSET_SORT),
+        "get_transactions(month)": transaction_store.plan_cursor(
+            {"user_id": probe_user, "date": {"$gte": start_date, "$lt": end_date}}, KEYSET_SORT
+        ),
+        "get_transactions(category_id)": transaction_store.plan_cursor(
+            {"user_id": probe_user, "category_id": "probe"}, KEYSET_SORT
+        ),
+        "get_transactions(sort=amount)": transaction_store.plan_cursor({"user_id": probe_user}, keyset_sort("amount")),
+        "get_transactions(q)": transaction_store.plan_cursor(
+            {"user_id": probe_user, "$text": {"$search": "probe"}}, KEYSET_SORT
+        ),
+        "summary(rollups)": rollups_collection.find({"user_id": probe_user, "year": 2000}),
+    }
+
+
+async def ensure_indexes():
+    await transaction_store.ensure_indexes()
+    await rollups_collection.create_indexes(ROLLUP_INDEXES)
+
+
+async def ensure_rollups():
+    # First start after rollups were introduced: build them from existing data. Done is
+    # recorded only once the rebuild finishes, so one that failed halfway runs again.
+    if await migrations_collection.find_one({"_id": ROLLUPS_COLLECTION_NAME}):
+        return
+    if await transaction_store.collection.estimated_document_count() > 0:
+        # Other workers may be rebuilding too, which is harmless; a failure stops startup
+        count = await rebuild_rollups(transaction_store, rollups_collection)
+        logger.info("Built %d monthly rollups from existing transactions", count)
+    await migrations_collection.update_one(
+        {"_id": ROLLUPS_COLLECTION_NAME}, {"$set": {"completed_at": datetime.now(timezone.utc)}}, upsert=True
+    )
+
+
+def plan_stages(plan) -> set:
+    """Collect every `stage` name found anywhere in an explain() plan tree."""
+    stages = set()
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.add(plan["stage"])
+        for value in plan.values():
+            stages |= plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            stages |= plan_stages(item)
+    return stages
+
+
+async def verify_query_plans():
+    """Fail loudly if any hot query would fall back to a collection scan."""
+    collection_scans = []
+    for name, cursor in hot_queries().items():
+        explain = await cursor.explain()
+        if "COLLSCAN" in plan_stages(explain["queryPlanner"]["winningPlan"]):
+            collection_scans.append(name)
+    if collection_scans:
+        raise RuntimeError(f"Queries not served by an index: {', '.join(collection_scans)}")
 
 
 # --------------------------------
@@ -75,6 +282,13 @@ def fix_obj_id(doc):
         doc["_id"] = str(doc["_id"])
     return doc
 
+def transaction_id(id: str) -> ObjectId:
+    # A malformed id can't name any transaction, so it is as missing as any other
+    try:
+        return ObjectId(id)
+    except InvalidId:
+        raise HTTPException(status_code=404, detail="Transaction not found or not authorized")
+
 def fix_obj_id_list(docs):
     return [fix_obj_id(d) for d in docs]
 
@@ -86,7 +300,7 @@ async def get_current_user_id(token: str = Depends(oauth2_scheme)) -> str:
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = token_verifier.decode(token)
         user_id: str = payload.get("sub")
         if user_id is None:
             raise credentials_exception
@@ -122,11 +336,537 @@ class TransactionUpdate(BaseModel):
 
 class TransactionOut(TransactionBase):
     id: str = Field(default=None, alias="_id")
+    # Only filled in when the listing is requested with ?expand=category
+    category_name: Optional[str] = None
 
     class Config:
         allow_population_by_field_name = True
 
 
+class BulkRowError(BaseModel):
+    line: int
+    error: str
+
+
+class BulkImportResult(BaseModel):
+    inserted: int = 0
+    failed: int = 0
+    errors: List[BulkRowError] = []
+
+
+class SummaryTotals(BaseModel):
+    income: float = 0
+    expense: float = 0
+    balance: float = 0
+    count: int = 0
+
+
+class PeriodSummary(SummaryTotals):
+    year: int
+    month: Optional[int] = None
+
+
+class MonthlySummary(BaseModel):
+    year: int
+    months: List[PeriodSummary]
+    compare_year: Optional[int] = None
+    compare_months: Optional[List[PeriodSummary]] = None
+
+
+class CategorySummary(SummaryTotals):
+    category_id: Optional[str] = None
+    compare_income: Optional[float] = None
+    compare_expense: Optional[float] = None
+
+
+class AnalyticsMonth(BaseModel):
+    year: int
+    month: int
+    income: float
+    expense: float
+    net: float
+    # Mean over this month and the `window` - 1 before it
+    income_avg: float
+    expense_avg: float
+    net_avg: float
+    # Change from the same month a year earlier, when that is covered
+    income_yoy: Optional[float] = None
+    expense_yoy: Optional[float] = None
+    expense_yoy_pct: Optional[float] = None
+
+
+class CategorySpending(BaseModel):
+    category_id: Optional[str] = None
+    count: int
+    total: float
+    p25: float
+    p50: float
+    p75: float
+    p90: float
+    # Expenses above this are outliers; None while the category has too few expenses
+    outlier_threshold: Optional[float] = None
+
+
+class SpendingOutlier(BaseModel):
+    transaction_id: str
+    date: datetime
+    amount: float
+    category_id: Optional[str] = None
+    threshold: float
+
+
+class Analytics(BaseModel):
+    window: int
+    months: List[AnalyticsMonth]
+    categories: List[CategorySpending]
+    outliers: List[SpendingOutlier]
+
+
+# --------------------------------
+# Keyset pagination helpers
+# --------------------------------
+# `sort` query parameter -> (field, direction); _id in the same direction breaks ties
+SORT_FIELDS = {
+    "-date": ("date", DESCENDING),
+    "date": ("date", ASCENDING),
+    "-amount": ("amount", DESCENDING),
+    "amount": ("amount", ASCENDING),
+}
+SORT_PATTERN = "^-?(date|amount)$"
+
+
+def keyset_sort(sort: str) -> list:
+    field, direction = SORT_FIELDS[sort]
+    return [(field, direction), ("_id", direction)]
+
+
+# Newest first
+KEYSET_SORT = keyset_sort("-date")
+
+
+def encode_cursor(doc: dict, field: str = "date") -> str:
+    value = doc[field]
+    value = value.isoformat() if isinstance(value, datetime) else repr(float(value))
+    raw = f"{value}|{doc['_id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(token: str, field: str = "date"):
+    try:
+        raw = base64.urlsafe_b64decode(token.encode()).decode()
+        value, obj_id = raw.split("|", 1)
+        value = datetime.fromisoformat(value) if field == "date" else float(value)
+        return value, ObjectId(obj_id)
+    except (ValueError, InvalidId, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+
+
+def transactions_query(user_id: str, filters: dict, sort: str = "-date", after: Optional[str] = None) -> dict:
+    query = {**filters, "user_id": user_id}
+    if after:
+        # continue strictly after the last (sort value, _id) the client has seen
+        field, direction = SORT_FIELDS[sort]
+        last_value, last_id = decode_cursor(after, field)
+        op = "$lt" if direction == DESCENDING else "$gt"
+        query["$or"] = [
+            {field: {op: last_value}},
+            {field: last_value, "_id": {op: last_id}},
+        ]
+    return query
+
+
+# --------------------------------
+# Search / filtering
+# --------------------------------
+def as_stored_date(value: datetime) -> datetime:
+    # MongoDB hands dates back as naive UTC; compare against the same
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def transaction_filters(
+    year: Optional[int] = Query(None, ge=1, le=9998),
+    month: Optional[int] = Query(None, ge=1, le=12),
+    start: Optional[datetime] = Query(None, description="Inclusive lower bound on date"),
+    end: Optional[datetime] = Query(None, description="Exclusive upper bound on date"),
+    type: Optional[str] = Query(None, pattern="^(income|expense)$"),
+    category_id: Optional[str] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    q: Optional[str] = Query(None, min_length=1, max_length=200, description="Words to find in the note"),
+) -> dict:
+    """Turn the search query parameters into a MongoDB filter; every field is ANDed."""
+    filters = {}
+    date_range = {}
+    if year or month:
+        # month on its own keeps meaning "in the current year"
+        date_range["$gte"], date_range["$lt"] = period_range(year or datetime.now().year, month)
+    if start:
+        start = as_stored_date(start)
+        date_range["$gte"] = max(start, date_range.get("$gte", start))
+    if end:
+        end = as_stored_date(end)
+        date_range["$lt"] = min(end, date_range.get("$lt", end))
+    if date_range:
+        filters["date"] = date_range
+    if type:
+        filters["type"] = type
+    if category_id:
+        filters["category_id"] = category_id
+    amount_range = {}
+    if min_amount is not None:
+        amount_range["$gte"] = min_amount
+    if max_amount is not None:
+        amount_range["$lte"] = max_amount
+    if amount_range:
+        filters["amount"] = amount_range
+    if q:
+        filters["$text"] = {"$search": q}
+    return filters
+
+
+# --------------------------------
+# Fast JSON path
+# --------------------------------
+TRANSACTION_FIELDS = ("user_id", "category_id", "type", "amount", "date", "note")
+# Only fetch what TransactionOut returns
+TRANSACTION_PROJECTION = dict.fromkeys(TRANSACTION_FIELDS, 1)
+
+
+def transaction_row(doc: dict) -> dict:
+    """Shape a raw document exactly as TransactionOut serializes it, in a single pass."""
+    row = {field: doc.get(field) for field in TRANSACTION_FIELDS}
+    row["_id"] = str(doc["_id"])
+    row["category_name"] = None
+    return row
+
+
+def changed_row(doc: dict) -> dict:
+    """A written document as the listing would return it once read back."""
+    return upsert_change({**transaction_row(doc), "date": as_stored_date(doc["date"])})
+
+
+def fast_json_response(content, headers: Optional[dict] = None) -> Response:
+    # orjson encodes datetimes as ISO 8601 itself, matching pydantic's output
+    return Response(orjson.dumps(content), media_type="application/json", headers=headers)
+
+
+# --------------------------------
+# Bulk import / export helpers
+# --------------------------------
+EXPORT_FIELDS = ["_id", "date", "type", "amount", "category_id", "note"]
+
+
+async def iter_body_lines(request: Request):
+    """
+    Yield the request body line by line, line endings kept, as it arrives.
+    Raises UnicodeDecodeError where the body stops being UTF-8.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in request.stream():
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line + "\n"
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+class PendingLines:
+    """Lines handed over so far, for one csv.reader that outlives each batch; runs dry instead of ending."""
+
+    def __init__(self):
+        self.lines = collections.deque()
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self.lines:
+            raise StopIteration
+        return self.lines.popleft()
+
+    def append(self, line: str):
+        self.lines.append(line)
+
+
+def read_csv_records(reader, pending: PendingLines):
+    """Yield (first line number, values) for every record in `pending`; blank lines are skipped."""
+    while pending:
+        start = reader.line_num + 1
+        try:
+            values = next(reader)
+        except csv.Error as e:
+            yield start, ValueError(str(e))
+            continue
+        if values:
+            yield start, values
+
+
+def csv_row(header: list, values):
+    if isinstance(values, Exception):
+        return values
+    if len(values) != len(header):
+        return ValueError(f"expected {len(header)} columns, got {len(values)}")
+    # Empty cells mean "not set" so optional fields validate as None
+    return {k: (v if v != "" else None) for k, v in zip(header, values)}
+
+
+async def iter_csv_rows(lines):
+    # One reader over the whole body, so quoted fields may span lines. It's only
+    # asked for records once every quote opened so far is closed, i.e. when the
+    # lines handed over end on a record boundary.
+    pending = PendingLines()
+    reader = csv.reader(pending)
+    header = None
+
+    def rows():
+        nonlocal header
+        for line_no, values in read_csv_records(reader, pending):
+            if header is None and not isinstance(values, Exception):
+                header = [name.strip() for name in values]
+            else:
+                yield line_no, csv_row(header, values)
+
+    quotes = 0
+    try:
+        async for line in lines:
+            pending.append(line)
+            quotes += line.count('"')
+            if quotes % 2 == 0:
+                for row in rows():
+                    yield row
+    except UnicodeDecodeError:
+        yield reader.line_num + len(pending) + 1, ValueError("not valid UTF-8; the rest of the body was skipped")
+        return
+    # An unbalanced quote runs to the end of the body
+    for row in rows():
+        yield row
+
+
+async def iter_ndjson_rows(lines):
+    line_no = 0
+    try:
+        async for text in lines:
+            line_no += 1
+            if not text.strip():
+                continue
+            try:
+                yield line_no, json.loads(text)
+            except ValueError as e:
+                yield line_no, e
+    except UnicodeDecodeError:
+        yield line_no + 1, ValueError("not valid UTF-8; the rest of the body was skipped")
+
+
+def format_validation_error(e: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors())
+
+
+async def insert_chunk(docs: list, line_numbers: list, result: BulkImportResult):
+    failed = set()
+    for index, message in await transaction_store.insert_many(docs):
+        failed.add(index)
+        record_row_error(result, line_numbers[index], message)
+    inserted = [doc for i, doc in enumerate(docs) if i not in failed]
+    result.inserted += len(inserted)
+    await apply_rollups(rollups_collection, inserted)
+    if inserted:
+        await data_changed(inserted[0]["user_id"])
+
+
+def record_row_error(result: BulkImportResult, line: int, message: str):
+    result.failed += 1
+    if len(result.errors) < BULK_MAX_REPORTED_ERRORS:
+        result.errors.append(BulkRowError(line=line, error=message))
+
+
+def export_csv_row(doc: dict) -> str:
+    values = []
+    for field in EXPORT_FIELDS:
+        value = doc.get(field)
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        values.append("" if value is None else value)
+    out = io.StringIO()
+    csv.writer(out).writerow(values)
+    return out.getvalue()
+
+
+# --------------------------------
+# Category resolution
+# --------------------------------
+async def resolve_category_names(user_id: str, token: str, category_ids) -> dict:
+    """
+    Map category ids to names with one batched call to category_service for
+    whatever isn't cached. Lookups that fail leave the names out rather than
+    failing the listing.
+    """
+    names, missing = {}, []
+    for category_id in set(category_ids):
+        cached = category_name_cache.get((user_id, category_id))
+        if cached is None:
+            missing.append(category_id)
+        elif cached:
+            names[category_id] = cached
+
+    for i in range(0, len(missing), CATEGORY_BATCH_SIZE):
+        chunk = missing[i:i + CATEGORY_BATCH_SIZE]
+        try:
+            response = await category_http.get(
+                "/categories/batch",
+                params={"ids": ",".join(chunk)},
+                headers={"Authorization": f"Bearer {token}"},
+            )
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            logger.warning("Category lookup failed: %s", e)
+            break
+        found = {c.get("_id") or c.get("id"): c["name"] for c in response.json()}
+        for category_id in chunk:
+            category_name_cache.set((user_id, category_id), found.get(category_id, ""))
+        names.update(found)
+    return names
+
+
+async def expand_categories(transactions: list, user_id: str, token: str) -> list:
+    category_ids = [t["category_id"] for t in transactions if t.get("category_id")]
+    if category_ids:
+        names = await resolve_category_names(user_id, token, category_ids)
+        for t in transactions:
+            t["category_name"] = names.get(t.get("category_id"))
+    return transactions
+
+
+# --------------------------------
+# Aggregation helpers
+# --------------------------------
+def period_range(year: int, month: Optional[int] = None):
+    """Return the [start, end) datetimes covering a year, or one month of it."""
+    if month is None:
+        return datetime(year, 1, 1), datetime(year + 1, 1, 1)
+    start_date = datetime(year, month, 1)
+    if month == 12:
+        end_date = datetime(year + 1, 1, 1)
+    else:
+        end_date = datetime(year, month + 1, 1)
+    return start_date, end_date
+
+
+def summary_match(user_id: str, year: Optional[int] = None, month: Optional[int] = None) -> dict:
+    match = {"user_id": user_id}
+    if year is not None:
+        match["year"] = year
+    if month is not None:
+        match["month"] = month
+    return match
+
+
+async def aggregate_totals(match: dict, group_by: dict, session) -> dict:
+    """
+    Sum the monthly rollups per (group_by keys, type) in MongoDB and fold
+    income/expense into one SummaryTotals-shaped dict per group key tuple.
+    """
+    pipeline = [
+        {"$match": match},
+        {"$group": {
+            "_id": {**group_by, "type": "$type"},
+            "total": {"$sum": "$total"},
+            "count": {"$sum": "$count"},
+        }},
+    ]
+    totals = {}
+    async for row in report_rollups.aggregate(pipeline, session=session):
+        key = tuple(row["_id"].get(k) for k in group_by)
+        bucket = totals.setdefault(key, {"income": 0, "expense": 0, "count": 0})
+        bucket[row["_id"]["type"]] = row["total"]
+        bucket["count"] += row["count"]
+    for bucket in totals.values():
+        bucket["balance"] = bucket["income"] - bucket["expense"]
+    # Rollups whose transactions were all deleted again sum to nothing
+    return {key: bucket for key, bucket in totals.items() if bucket["count"]}
+
+
+async def monthly_totals(user_id: str, year: int, session) -> List[PeriodSummary]:
+    totals = await aggregate_totals(summary_match(user_id, year), {"month": "$month"}, session)
+    return [
+        PeriodSummary(year=year, month=month, **totals.get((month,), {}))
+        for month in range(1, 13)
+    ]
+
+
+async def category_totals(user_id: str, year: Optional[int], month: Optional[int], session) -> dict:
+    totals = await aggregate_totals(summary_match(user_id, year, month), {"category_id": "$category_id"}, session)
+    return {key[0]: value for key, value in totals.items()}
+
+
+async def apply_category_events(events: list):
+    """
+    Converge with category deletes and renames published by category_service
+    (see app/category_events.py). Safe to apply the same events again.
+    """
+    changed_users = set()
+    deleted = {(event["user_id"], event["category_id"]) for event in events if event["type"] == "deleted"}
+    for user_id, category_id in deleted:
+        # Transactions of a deleted category become uncategorised
+        modified = await transaction_store.uncategorise(user_id, category_id)
+        moved = await move_category_rollups(rollups_collection, user_id, category_id)
+        if modified or moved:
+            changed_users.add(user_id)
+        category_name_cache.pop((user_id, category_id))
+    for event in events:
+        if event["type"] == "renamed" and (event["user_id"], event["category_id"]) not in deleted:
+            # Only this worker's cache; the others pick the name up within CATEGORY_CACHE_TTL
+            category_name_cache.set((event["user_id"], event["category_id"]), event["name"])
+    for user_id in changed_users:
+        await data_changed(user_id)
+
+
+# --------------------------------
+# Caching helpers
+# --------------------------------
+async def data_changed(user_id: str, change: Optional[dict] = None):
+    """
+    Call after every write to a user's transactions, once the write has
+    succeeded; `change` is what subscribers to /transactions/changes receive.
+    """
+    version = await bump_version(versions_collection, user_id, change)
+    change_feed.written(user_id, version, change)
+    await summary_cache.invalidate(user_id)
+    # Entries are keyed by ETag and couldn't be hit again anyway; this just frees them
+    analytics_cache.pop(user_id)
+
+
+async def cached_summary(request: Request, response: Response, user_id: str, compute, *extra):
+    """
+    Answer a summary request from, in order: the client's copy (304), the
+    shared cache, or one `compute(session)` shared by identical concurrent
+    requests, which reads the report collections in `session`.
+    """
+    async with causal_session(client) as session:
+        etag = await check_etag(versions_collection, request, user_id, *extra, session=session)
+        response.headers.update(cache_headers(etag))
+
+        async def load():
+            # The ETag already names the data version and the request, so it doubles as the cache field;
+            # a refill that raced a write lands under the old version's ETag and is never read again
+            summary = await summary_cache.get(user_id, etag)
+            if summary is None:
+                # A session of its own: the requests sharing this call may outlive the one that started it
+                async with causal_session(client, after=session) as reports:
+                    summary = jsonable_encoder(await compute(reports))
+                await summary_cache.set(user_id, etag, summary)
+            return summary
+
+        return await summaries_flight.do(etag, load)
+
+
 # --------------------------------
 # API Endpoints
 # --------------------------------
@@ -139,65 +879,291 @@ async def create_transaction(transaction: TransactionCreate, current_user_id: st
         raise HTTPException(status_code=403, detail="Not authorized to create transaction for this user")
 
     new_txn = transaction.model_dump()
-    result = await transactions_collection.insert_one(new_txn)
-    created_txn = await transactions_collection.find_one({"_id": result.inserted_id})
-    return fix_obj_id(created_txn)  
+    # insert_one fills in new_txn["_id"], so there is nothing to read back
+    await transaction_store.insert_one(new_txn)
+    await apply_rollups(rollups_collection, [new_txn])
+    await data_changed(current_user_id, changed_row(new_txn))
+    return fix_obj_id({**new_txn, "date": as_stored_date(new_txn["date"])})
+
+
+# 📥 Bulk import transactions from a CSV (with header row) or NDJSON request body
+@app.post("/transactions/bulk", response_model=BulkImportResult)
+async def bulk_import_transactions(request: Request, current_user_id: str = Depends(get_current_user_id)):
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type == "text/csv":
+        rows = iter_csv_rows(iter_body_lines(request))
+    elif content_type in ("application/x-ndjson", "application/jsonl"):
+        rows = iter_ndjson_rows(iter_body_lines(request))
+    else:
+        raise HTTPException(status_code=415, detail="Send text/csv or application/x-ndjson")
+
+    result = BulkImportResult()
+    docs, line_numbers = [], []
+    async for line_no, row in rows:
+        if isinstance(row, Exception):
+            record_row_error(result, line_no, str(row))
+            continue
+        if not isinstance(row, dict):
+            record_row_error(result, line_no, "expected an object")
+            continue
+        # Missing, null or an empty CSV cell all mean the caller
+        if not row.get("user_id"):
+            row["user_id"] = current_user_id
+        if row["user_id"] != current_user_id:
+            record_row_error(result, line_no, "Not authorized to create transaction for this user")
+            continue
+        try:
+            docs.append(TransactionCreate(**row).model_dump())
+        except ValidationError as e:
+            record_row_error(result, line_no, format_validation_error(e))
+            continue
+        line_numbers.append(line_no)
+        if len(docs) >= BULK_CHUNK_SIZE:
+            await insert_chunk(docs, line_numbers, result)
+            docs, line_numbers = [], []
+    if docs:
+        await insert_chunk(docs, line_numbers, result)
+    return result
+
+
+# 📤 Export all of the user's transactions as CSV, streamed from the cursor
+@app.get("/transactions/export")
+async def export_transactions(current_user_id: str = Depends(get_current_user_id)):
+    async def csv_lines():
+        async with causal_session(client) as session:
+            # Reading the version first makes a lagging secondary wait for the user's latest writes
+            await current_version(versions_collection, current_user_id, session)
+            cursor = report_store.find(
+                {"user_id": current_user_id}, {k: 1 for k in EXPORT_FIELDS}, KEYSET_SORT,
+                batch_size=STREAM_BATCH_SIZE, session=session,
+            )
+            yield ",".join(EXPORT_FIELDS) + "\r\n"
+            async for doc in cursor:
+                yield export_csv_row(doc)
+
+    return StreamingResponse(
+        csv_lines(),
+        media_type="text/csv",
+        headers={"Content-Disposition": 'attachment; filename="transactions.csv"'},
+    )
+
+
+# 📊 Summary totals (filter by user + year/month)
+@app.get("/transactions/summary", response_model=PeriodSummary)
+async def get_summary(
+    request: Request,
+    response: Response,
+    year: Optional[int] = Query(None, ge=1, le=9998),
+    month: Optional[int] = Query(None, ge=1, le=12),
+    current_user_id: str = Depends(get_current_user_id)):
+    if year is None:
+        year = datetime.now().year
+
+    async def compute(session):
+        totals = await aggregate_totals(summary_match(current_user_id, year, month), {}, session)
+        return PeriodSummary(year=year, month=month, **totals.get((), {}))
 
+    return await cached_summary(request, response, current_user_id, compute, year)
+
+
+# 📊 Monthly summary for a year, optionally side by side with another year
+@app.get("/transactions/summary/monthly", response_model=MonthlySummary)
+async def get_monthly_summary(
+    request: Request,
+    response: Response,
+    year: Optional[int] = Query(None, ge=1, le=9998),
+    compare_year: Optional[int] = Query(None, ge=1, le=9998),
+    current_user_id: str = Depends(get_current_user_id)):
+    if year is None:
+        year = datetime.now().year
+
+    async def compute(session):
+        summary = MonthlySummary(year=year, months=await monthly_totals(current_user_id, year, session))
+        if compare_year:
+            summary.compare_year = compare_year
+            summary.compare_months = await monthly_totals(current_user_id, compare_year, session)
+        return summary
+
+    return await cached_summary(request, response, current_user_id, compute, year)
+
+
+# 📊 Yearly summary across the user's whole history
+@app.get("/transactions/summary/yearly", response_model=List[PeriodSummary])
+async def get_yearly_summary(
+    request: Request,
+    response: Response,
+    current_user_id: str = Depends(get_current_user_id)):
+    async def compute(session):
+        totals = await aggregate_totals({"user_id": current_user_id}, {"year": "$year"}, session)
+        return [PeriodSummary(year=key[0], **value) for key, value in sorted(totals.items())]
+
+    return await cached_summary(request, response, current_user_id, compute)
+
+
+# 📊 Per-category summary, optionally compared with another year
+@app.get("/transactions/summary/categories", response_model=List[CategorySummary])
+async def get_category_summary(
+    request: Request,
+    response: Response,
+    year: Optional[int] = Query(None, ge=1, le=9998),
+    month: Optional[int] = Query(None, ge=1, le=12),
+    compare_year: Optional[int] = Query(None, ge=1, le=9998),
+    current_user_id: str = Depends(get_current_user_id)):
+    # A month on its own means that month this year, as on /transactions
+    if month is not None and year is None:
+        year = datetime.now().year
 
-# 📖 Get transactions (filter by user + month)
+    async def compute(session):
+        primary = await category_totals(current_user_id, year, month, session)
+        compare = await category_totals(current_user_id, compare_year, month, session) if compare_year else {}
+
+        results = []
+        for category_id in sorted(primary.keys() | compare.keys(), key=lambda c: c or ""):
+            row = CategorySummary(category_id=category_id, **primary.get(category_id, {}))
+            if compare_year:
+                row.compare_income = compare.get(category_id, {}).get("income", 0)
+                row.compare_expense = compare.get(category_id, {}).get("expense", 0)
+            results.append(row)
+        return results
+
+    # The implied year isn't in the URL; it's in the ETag so a new year doesn't revalidate the old one
+    return await cached_summary(request, response, current_user_id, compute, year)
+
+
+# 📈 Monthly trends with rolling averages and year-over-year changes, per-category
+# expense percentiles and unusually large expenses, over the filtered transactions
+@app.get("/transactions/analytics", response_model=Analytics)
+async def get_analytics(
+    request: Request,
+    response: Response,
+    filters: dict = Depends(transaction_filters),
+    window: int = Query(3, ge=1, le=36, description="Months in each rolling average"),
+    current_user_id: str = Depends(get_current_user_id)):
+    async with causal_session(client) as session:
+        # `month` without `year` means this year, which the URL doesn't say
+        etag = await check_etag(versions_collection, request, current_user_id, filters.get("date"), session=session)
+        response.headers.update(cache_headers(etag))
+        results = analytics_cache.get(current_user_id)
+        if results is None:
+            results = TTLCache(ANALYTICS_CACHE_PER_USER, ANALYTICS_CACHE_TTL)
+            analytics_cache.set(current_user_id, results)
+        analytics = results.get(etag)
+        if analytics is not None:
+            return analytics
+
+        async def load():
+            query = transactions_query(current_user_id, filters)
+            async with causal_session(client, after=session) as reports:
+                cursor = report_store.find(
+                    query, ANALYTICS_PROJECTION, KEYSET_SORT, batch_size=ANALYTICS_BATCH_SIZE, session=reports
+                )
+                columns = await load_columns(cursor)
+            return jsonable_encoder(await asyncio.to_thread(compute_analytics, columns, window))
+
+        analytics = await analytics_flight.do(etag, load)
+    results.set(etag, analytics)
+    return analytics
+
+
+# 📖 Get transactions, filtered on the server (see transaction_filters) and sorted by `sort`
+# Results come in pages of `limit` (DEFAULT_PAGE_SIZE if not given); the token
+# for the next page is returned in the X-Next-Cursor header and goes back in as
+# `after`. /transactions/stream sends every match without holding them all.
+# Responses carry an ETag, so an unchanged list comes back as 304 Not Modified.
 @app.get("/transactions", response_model=List[TransactionOut])
 async def get_transactions(
-    month: Optional[int] = None,
+    request: Request,
+    response: Response,
+    filters: dict = Depends(transaction_filters),
+    sort: str = Query("-date", pattern=SORT_PATTERN),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    expand: Optional[str] = Query(None, pattern="^category$"),
+    token: str = Depends(oauth2_scheme),
+    current_user_id: str = Depends(get_current_user_id)):
+    headers, etag = {}, None
+    if expand is None:
+        # Category names live in category_service, so expanded lists aren't versioned here.
+        # `month` without `year` means this year, which the URL doesn't say
+        etag, version = await check_version(versions_collection, request, current_user_id, filters.get("date"))
+        headers.update(cache_headers(etag, version))
+    query = transactions_query(current_user_id, filters, sort, after)
+
+    async def fetch():
+        # Fetch one extra document to learn whether another page exists
+        cursor = transaction_store.find(query, TRANSACTION_PROJECTION, keyset_sort(sort), limit=limit + 1)
+        return await cursor.to_list(None)
+
+    # Only versioned reads are shared; an unversioned one might have started before a write.
+    # Every caller gets the same documents, so build fresh rows from them.
+    docs = await listing_flight.do(etag, fetch) if etag else await fetch()
+    to_row = transaction_row if FAST_JSON_RESPONSES else fix_obj_id
+    results = [to_row(doc) for doc in docs]
+    if len(results) > limit:
+        results = results[:limit]
+        headers["X-Next-Cursor"] = encode_cursor(results[-1], SORT_FIELDS[sort][0])
+
+    if expand == "category":
+        await expand_categories(results, current_user_id, token)
+    if FAST_JSON_RESPONSES:
+        # Rows already have TransactionOut's shape, so skip re-validating each one
+        return fast_json_response(results, headers)
+    response.headers.update(headers)
+    return results
+
+
+# 📖 Stream transactions as NDJSON, one document per line
+@app.get("/transactions/stream")
+async def stream_transactions(
+    filters: dict = Depends(transaction_filters),
+    sort: str = Query("-date", pattern=SORT_PATTERN),
+    after: Optional[str] = None,
     current_user_id: str = Depends(get_current_user_id)):
-    query = {"user_id": current_user_id}
-    if month:
-        # filter transactions in that month
-        start_date = datetime(datetime.now().year, month, 1)
-        if month == 12:
-            end_date = datetime(datetime.now().year + 1, 1, 1)
-        else:
-            end_date = datetime(datetime.now().year, month + 1, 1)
-        query["date"] = {"$gte": start_date, "$lt": end_date}
+    # Read before the query, so the rows hold at least this version's writes
+    version = await current_version(versions_collection, current_user_id)
+    query = transactions_query(current_user_id, filters, sort, after)
+    cursor = transaction_store.find(query, TRANSACTION_PROJECTION, keyset_sort(sort), batch_size=STREAM_BATCH_SIZE)
+
+    async def ndjson_lines():
+        async for doc in cursor:
+            yield orjson.dumps(fix_obj_id(doc)) + b"\n"
+
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson", headers={VERSION_HEADER: str(version)})
+
 
-    cursor = transactions_collection.find(query)
-    results = await cursor.to_list(length=1000)
-    return fix_obj_id_list(results)
+# 🔔 Server-Sent Events for each write to the user's transactions (see app/changes.py),
+# so clients can patch the list they hold instead of fetching it again
+@app.get("/transactions/changes")
+async def transaction_changes(current_user_id: str = Depends(get_current_user_id)):
+    return change_feed.stream(versions_collection, current_user_id)
 
 
 # ✏️ Update transaction
 @app.put("/transactions/{id}", response_model=TransactionOut)
 async def update_transaction(id: str, transaction: TransactionUpdate, current_user_id: str = Depends(get_current_user_id)):
-    # First, verify the transaction belongs to the current user
-    existing_txn = await transactions_collection.find_one({"_id": ObjectId(id)})
-    if not existing_txn or existing_txn.get("user_id") != current_user_id:
-        raise HTTPException(status_code=404, detail="Transaction not found or not authorized")
-
     update_data = {k: v for k, v in transaction.model_dump().items() if v is not None}
     if not update_data:
         raise HTTPException(status_code=400, detail="No fields to update")
 
-    result = await transactions_collection.update_one(
-        {"_id": ObjectId(id)}, {"$set": update_data}
-    )
-    # It's possible modified_count is 0 if the data is the same.
-    # The check for existence above is sufficient.
-    # We only raise an error if the document was not found initially.
-    if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Transaction not found")
-
-    updated_txn = await transactions_collection.find_one({"_id": ObjectId(id)})
-    return fix_obj_id(updated_txn)
+    # Only the owner's transactions match. The previous version comes back so
+    # its rollup can be moved to the new values.
+    previous_txn = await transaction_store.update(current_user_id, transaction_id(id), update_data)
+    if previous_txn is None:
+        raise HTTPException(status_code=404, detail="Transaction not found or not authorized")
+    updated_txn = {**previous_txn, **update_data}
+    await apply_rollups(rollups_collection, [previous_txn], sign=-1)
+    await apply_rollups(rollups_collection, [updated_txn])
+    await data_changed(current_user_id, changed_row(updated_txn))
+    return fix_obj_id({**updated_txn, "date": as_stored_date(updated_txn["date"])})
 
 
 # ❌ Delete transaction
 @app.delete("/transactions/{id}")
 async def delete_transaction(id: str, current_user_id: str = Depends(get_current_user_id)):
-    # First, verify the transaction belongs to the current user
-    existing_txn = await transactions_collection.find_one({"_id": ObjectId(id)})
-    if not existing_txn or existing_txn.get("user_id") != current_user_id:
+    # Only delete the transaction if it belongs to the current user
+    deleted_txn = await transaction_store.delete(current_user_id, transaction_id(id))
+    if deleted_txn is None:
         raise HTTPException(status_code=404, detail="Transaction not found or not authorized")
-
-    result = await transactions_collection.delete_one({"_id": ObjectId(id)})
-    if result.deleted_count == 0:
-        raise HTTPException(status_code=404, detail="Transaction not found")
+    await apply_rollups(rollups_collection, [deleted_txn], sign=-1)
+    await data_changed(current_user_id, delete_change(id))
     return {"message": "Transaction deleted"} # This will be a 200 OK with a body
@@ -0,0 +1,84 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+
+import motor.motor_asyncio
+from pymongo import read_preferences
+
+from app.metrics import MongoCommandMetrics
+
+# This module is kept identical in every service; each image only ships its
+# own app/ directory, so copy changes to all three (transaction_service
+# tests/test_shared.py fails while they differ).
+
+# Connection pool per worker process; total connections to mongod are
+# roughly workers * MONGO_MAX_POOL_SIZE per replica.
+MONGO_MAX_POOL_SIZE = int(os.environ.get("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.environ.get("MONGO_MIN_POOL_SIZE", "5"))
+MONGO_MAX_IDLE_TIME_MS = int(os.environ.get("MONGO_MAX_IDLE_TIME_MS", "300000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get("MONGO_WAIT_QUEUE_TIMEOUT_MS", "2000"))
+
+# Where report reads (summaries, analytics, exports) go; everything else reads
+# and writes the primary. A standalone mongod serves every read whatever the mode.
+MONGO_REPORT_READ_PREFERENCE = os.environ.get("MONGO_REPORT_READ_PREFERENCE", "secondaryPreferred")
+# Secondaries further behind the primary than this don't serve reports; MongoDB's minimum is 90, -1 means no bound
+MONGO_MAX_STALENESS_SECONDS = int(os.environ.get("MONGO_MAX_STALENESS_SECONDS", "90"))
+
+REPORT_READ_MODES = {
+    "primaryPreferred": read_preferences.PrimaryPreferred,
+    "secondary": read_preferences.Secondary,
+    "secondaryPreferred": read_preferences.SecondaryPreferred,
+    "nearest": read_preferences.Nearest,
+}
+
+
+def report_read_preference():
+    if MONGO_REPORT_READ_PREFERENCE == "primary":
+        return read_preferences.Primary()
+    if MONGO_REPORT_READ_PREFERENCE not in REPORT_READ_MODES:
+        raise RuntimeError(f"Unknown MONGO_REPORT_READ_PREFERENCE: {MONGO_REPORT_READ_PREFERENCE!r}")
+    return REPORT_READ_MODES[MONGO_REPORT_READ_PREFERENCE](max_staleness=MONGO_MAX_STALENESS_SECONDS)
+
+
+REPORT_READ_PREFERENCE = report_read_preference()
+
+
+def create_mongo_client(uri: str) -> motor.motor_asyncio.AsyncIOMotorClient:
+    return motor.motor_asyncio.AsyncIOMotorClient(
+        uri,
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+        connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+        serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        event_listeners=[MongoCommandMetrics()],
+    )
+
+
+async def warm_up_pool(client, connections: int = MONGO_MIN_POOL_SIZE):
+    """Open `connections` pooled sockets up front so the first requests don't pay for the handshakes."""
+    await asyncio.gather(*(client.admin.command("ping") for _ in range(max(1, connections))))
+
+
+def for_reports(collection):
+    """`collection` with reads routed by MONGO_REPORT_READ_PREFERENCE; writes through it still go to the primary."""
+    return collection.with_options(read_preference=REPORT_READ_PREFERENCE)
+
+
+@asynccontextmanager
+async def causal_session(client, after=None):
+    """
+    A causally consistent session. Each read in it sees everything the
+    session has already read or written, on whichever member serves it: a
+    secondary that hasn't caught up yet waits until it has. Pass `after` (a
+    session) to start from what that one has seen; give code that may outlive
+    a request its own session this way rather than sharing the request's.
+    """
+    async with await client.start_session(causal_consistency=True) as session:
+        if after is not None and after.cluster_time is not None:
+            session.advance_cluster_time(after.cluster_time)
+            session.advance_operation_time(after.operation_time)
+        yield session
@@ -0,0 +1,173 @@
+import argparse
+import asyncio
+import sys
+from datetime import timezone
+
+from pymongo import ASCENDING, IndexModel, UpdateOne
+
+# --------------------------------
+# Monthly rollups
+# --------------------------------
+# One document per (user, year, month, type, category) holding the sum and
+# count of the matching transactions. The write handlers keep it current with
+# $inc, so summaries read O(months) rollup rows instead of every transaction.
+# Rollups are not updated in the same transaction as the write, so a crash in
+# between can leave them off; `check` finds that and `rebuild` repairs it:
+#
+#   python -m app.rollups check [--user USER_ID]
+#   python -m app.rollups rebuild [--user USER_ID]
+
+ROLLUP_KEY = ("user_id", "year", "month", "type", "category_id")
+
+ROLLUP_INDEXES = [
+    IndexModel([(k, ASCENDING) for k in ROLLUP_KEY], name="rollup_key", unique=True),
+]
+
+# Float sums drift slightly depending on the order amounts were added in
+TOLERANCE = 1e-6
+
+
+def rollup_key(txn: dict) -> tuple:
+    date = txn["date"]
+    if date.tzinfo is not None:
+        # MongoDB stores and groups dates in UTC
+        date = date.astimezone(timezone.utc)
+    return (txn["user_id"], date.year, date.month, txn["type"], txn.get("category_id"))
+
+
+async def write_increments(rollups, increments: dict):
+    """$inc each rollup key by its [total, count], creating missing rollups."""
+    if not increments:
+        return
+    await rollups.bulk_write(
+        [
+            UpdateOne(dict(zip(ROLLUP_KEY, key)), {"$inc": {"total": total, "count": count}}, upsert=True)
+            for key, (total, count) in increments.items()
+        ],
+        ordered=False,
+    )
+
+
+async def apply_rollups(rollups, txns, sign: int = 1):
+    """Add (sign=1) or remove (sign=-1) the given transactions from their rollups."""
+    increments = {}
+    for txn in txns:
+        inc = increments.setdefault(rollup_key(txn), [0, 0])
+        inc[0] += sign * txn["amount"]
+        inc[1] += sign
+    await write_increments(rollups, increments)
+
+
+async def move_category_rollups(rollups, user_id: str, from_category: str, to_category: str = None) -> int:
+    """Fold one category's rollups into another's (by default uncategorised); returns rows moved."""
+    moves = []
+    async for row in rollups.find({"user_id": user_id, "category_id": from_category}):
+        target = dict(zip(ROLLUP_KEY, (user_id, row["year"], row["month"], row["type"], to_category)))
+        # Adding to the target before taking from the source means a crash in
+        # between counts the row twice rather than losing it; `check` finds either.
+        # $inc rather than a delete keeps writes that land on the source meanwhile.
+        moves.append(UpdateOne(target, {"$inc": {"total": row["total"], "count": row["count"]}}, upsert=True))
+        moves.append(UpdateOne({"_id": row["_id"]}, {"$inc": {"total": -row["total"], "count": -row["count"]}}))
+    if not moves:
+        return 0
+    await rollups.bulk_write(moves, ordered=True)
+    await rollups.delete_many({"user_id": user_id, "category_id": from_category, "count": 0})
+    return len(moves) // 2
+
+
+def source_pipeline() -> list:
+    """Aggregate raw transactions into rollup-shaped documents."""
+    return [
+        {"$group": {
+            "_id": {
+                "user_id": "$user_id",
+                "year": {"$year": "$date"},
+                "month": {"$month": "$date"},
+                "type": "$type",
+                "category_id": "$category_id",
+            },
+            "total": {"$sum": "$amount"},
+            "count": {"$sum": 1},
+        }},
+    ]
+
+
+async def expected_rollups(store, scope: dict) -> dict:
+    expected = {}
+    async for row in store.aggregate(scope, source_pipeline()):
+        key = tuple(row["_id"].get(k) for k in ROLLUP_KEY)
+        expected[key] = (row["total"], row["count"])
+    return expected
+
+
+async def rebuild_rollups(store, rollups, user_id: str = None, batch_size: int = 1000) -> int:
+    """
+    Recompute rollups from raw transactions (read through an app.storage store),
+    for one user or everyone. Each rollup is overwritten in place and stale ones
+    removed afterwards, so it's safe to run twice at once or again after a failure.
+    A write landing while it runs can be overwritten; `check` afterwards finds that.
+    """
+    scope = {} if user_id is None else {"user_id": user_id}
+    expected = await expected_rollups(store, scope)
+    updates = [
+        UpdateOne(dict(zip(ROLLUP_KEY, key)), {"$set": {"total": total, "count": count}}, upsert=True)
+        for key, (total, count) in expected.items()
+    ]
+    for i in range(0, len(updates), batch_size):
+        await rollups.bulk_write(updates[i:i + batch_size], ordered=False)
+    stale = [
+        doc["_id"] async for doc in rollups.find(scope, {k: 1 for k in ROLLUP_KEY})
+        if tuple(doc.get(k) for k in ROLLUP_KEY) not in expected
+    ]
+    for i in range(0, len(stale), batch_size):
+        await rollups.delete_many({"_id": {"$in": stale[i:i + batch_size]}})
+    return len(updates)
+
+
+async def check_rollups(store, rollups, user_id: str = None) -> list:
+    """Return the rollup rows that disagree with the raw transactions."""
+    scope = {} if user_id is None else {"user_id": user_id}
+    expected = await expected_rollups(store, scope)
+    actual = {}
+    async for doc in rollups.find(scope):
+        if doc["count"] == 0 and abs(doc["total"]) < TOLERANCE:
+            # Everything in this rollup was deleted again
+            continue
+        actual[tuple(doc.get(k) for k in ROLLUP_KEY)] = (doc["total"], doc["count"])
+
+    mismatches = []
+    for key in expected.keys() | actual.keys():
+        want, got = expected.get(key, (0, 0)), actual.get(key, (0, 0))
+        if want[1] != got[1] or abs(want[0] - got[0]) > TOLERANCE:
+            mismatches.append({
+                **dict(zip(ROLLUP_KEY, key)),
+                "expected": {"total": want[0], "count": want[1]},
+                "actual": {"total": got[0], "count": got[1]},
+            })
+    return mismatches
+
+
+async def run_command(argv) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.rollups")
+    parser.add_argument("command", choices=["rebuild", "check"])
+    parser.add_argument("--user", help="Only this user_id (default: everyone)")
+    args = parser.parse_args(argv)
+
+    from app import main
+    from app.mongo import create_mongo_client
+
+    main.bind_database(create_mongo_client(main.MONGO_URI))
+    if args.command == "rebuild":
+        count = await rebuild_rollups(main.transaction_store, main.rollups_collection, args.user)
+        print(f"Rebuilt {count} rollup documents")
+        return 0
+
+    mismatches = await check_rollups(main.transaction_store, main.rollups_collection, args.user)
+    for m in mismatches:
+        print(m)
+    print(f"{len(mismatches)} inconsistent rollup documents")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(run_command(sys.argv[1:])))
@@ -0,0 +1,430 @@
+import argparse
+import asyncio
+import os
+import re
+import sys
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+
+# --------------------------------
+# Transaction storage
+# --------------------------------
+# The endpoints work with flat transaction documents; where those live is up
+# to the store that TRANSACTION_STORAGE picks:
+#
+#   documents (default)  one document per transaction
+#   buckets              one document per user-month holding up to BUCKET_SIZE
+#                        transactions plus their count and income/expense totals
+#
+# Buckets keep a few index entries per user-month instead of several per
+# transaction, and a month is read as one or two documents. In exchange,
+# updates and deletes read the bucket before writing it, and `q` turns into a
+# case-insensitive substring match on the note (a text index can't pick out
+# single array elements). Move existing data across while writes are stopped;
+# the documents collection is left as it was, so going back just means
+# unsetting TRANSACTION_STORAGE:
+#
+#   python -m app.storage migrate [--user USER_ID]
+#   python -m app.storage check [--user USER_ID]
+
+BUCKET_SIZE = int(os.environ.get("BUCKET_SIZE", "200"))
+MIGRATE_BATCH_SIZE = 100
+
+# Stored inside each bucket's `txns` array, next to the transaction's _id
+ELEMENT_FIELDS = ("category_id", "type", "amount", "date", "note")
+# Turns an unwound bucket back into a flat transaction document
+FLAT_PROJECTION = {"_id": "$txns._id", "user_id": 1, **{f: f"$txns.{f}" for f in ELEMENT_FIELDS}}
+
+
+def stored_date(date: datetime) -> datetime:
+    # MongoDB stores and compares dates as naive UTC
+    if date.tzinfo is not None:
+        date = date.astimezone(timezone.utc).replace(tzinfo=None)
+    return date
+
+
+def bucket_period(date: datetime) -> datetime:
+    """First instant of the (UTC) month a transaction's bucket covers."""
+    date = stored_date(date)
+    return datetime(date.year, date.month, 1)
+
+
+def element(txn: dict) -> dict:
+    return {"_id": txn["_id"], **{field: txn.get(field) for field in ELEMENT_FIELDS}}
+
+
+def condition_bounds(condition):
+    """(lowest, highest) value a single-field condition allows; None where it's open."""
+    if condition is None:
+        return None, None
+    if not isinstance(condition, dict):
+        return condition, condition
+    return condition.get("$gte", condition.get("$gt")), condition.get("$lt", condition.get("$lte"))
+
+
+def date_bounds(query: dict):
+    """
+    Date range a transactions query can match, from its `date` condition and
+    the keyset `$or` that transactions_query adds for `after`.
+    """
+    low, high = condition_bounds(query.get("date"))
+    if "$or" in query:
+        branches = [condition_bounds(branch.get("date")) for branch in query["$or"]]
+        if all(branch_low is not None for branch_low, _ in branches):
+            branch_low = min(branch_low for branch_low, _ in branches)
+            low = branch_low if low is None else max(low, branch_low)
+        if all(branch_high is not None for _, branch_high in branches):
+            branch_high = max(branch_high for _, branch_high in branches)
+            high = branch_high if high is None else min(high, branch_high)
+    return low, high
+
+
+# --------------------------------
+# One document per transaction
+# --------------------------------
+class DocumentStore:
+    INDEXES = [
+        # Serves the user + date range filter and the (date, _id) keyset sort
+        IndexModel([("user_id", ASCENDING), ("date", DESCENDING), ("_id", DESCENDING)], name="user_id_date"),
+        # category_id filter, still newest first
+        IndexModel(
+            [("user_id", ASCENDING), ("category_id", ASCENDING), ("date", DESCENDING), ("_id", DESCENDING)],
+            name="user_id_category_date",
+        ),
+        # min_amount / max_amount and sort=amount / -amount
+        IndexModel([("user_id", ASCENDING), ("amount", DESCENDING), ("_id", DESCENDING)], name="user_id_amount"),
+        # q= matches whole words of the note within one user. Notes mix Thai and
+        # English, so no stemming; Thai words are only found where the note has spaces.
+        IndexModel([("user_id", ASCENDING), ("note", TEXT)], name="user_id_note_text", default_language="none"),
+    ]
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def ensure_indexes(self):
+        await self.collection.create_indexes(self.INDEXES)
+
+    def find(self, query: dict, projection: dict, sort: list, limit: int = None, batch_size: int = None, session=None):
+        cursor = self.collection.find(query, projection, session=session).sort(sort)
+        if limit is not None:
+            cursor = cursor.limit(limit)
+        if batch_size is not None:
+            cursor = cursor.batch_size(batch_size)
+        return cursor
+
+    def plan_cursor(self, query: dict, sort: list):
+        """A find() cursor whose explain() shows how `find` would run."""
+        return self.collection.find(query).sort(sort)
+
+    def aggregate(self, query: dict, stages: list):
+        """Run `stages` over the flat transactions matching `query`."""
+        return self.collection.aggregate([{"$match": query}, *stages], allowDiskUse=True)
+
+    async def insert_one(self, txn: dict):
+        # Fills in txn["_id"]
+        await self.collection.insert_one(txn)
+
+    async def insert_many(self, txns: list) -> list:
+        """Insert what can be inserted; returns (index in txns, error) for the rest."""
+        try:
+            await self.collection.insert_many(txns, ordered=False)
+        except BulkWriteError as e:
+            return [(err["index"], err.get("errmsg", "write failed")) for err in e.details.get("writeErrors", [])]
+        return []
+
+    async def update(self, user_id: str, txn_id: ObjectId, changes: dict):
+        """Apply `changes` to one of the user's transactions; returns it as it was, or None."""
+        # Ownership is part of the filter, so the check and the write are one atomic operation
+        return await self.collection.find_one_and_update(
+            {"_id": txn_id, "user_id": user_id}, {"$set": changes}, return_document=ReturnDocument.BEFORE
+        )
+
+    async def delete(self, user_id: str, txn_id: ObjectId):
+        """Delete one of the user's transactions; returns it, or None."""
+        return await self.collection.find_one_and_delete({"_id": txn_id, "user_id": user_id})
+
+    async def uncategorise(self, user_id: str, category_id: str) -> int:
+        result = await self.collection.update_many(
+            {"user_id": user_id, "category_id": category_id}, {"$set": {"category_id": None}}
+        )
+        return result.modified_count
+
+
+# --------------------------------
+# One document per user-month
+# --------------------------------
+class BucketStore:
+    INDEXES = [
+        # Month ranges, and finding a bucket with room for a new transaction
+        IndexModel([("user_id", ASCENDING), ("period", DESCENDING), ("count", ASCENDING)], name="user_id_period"),
+        # Updates and deletes by transaction id
+        IndexModel([("user_id", ASCENDING), ("txns._id", ASCENDING)], name="user_id_txn_id"),
+    ]
+
+    def __init__(self, collection, size: int = BUCKET_SIZE):
+        self.collection = collection
+        self.size = size
+
+    async def ensure_indexes(self):
+        await self.collection.create_indexes(self.INDEXES)
+
+    def bucket_match(self, query: dict) -> dict:
+        """The part of a transactions query that can be answered per bucket, to skip the rest."""
+        match = {"user_id": query["user_id"]} if "user_id" in query else {}
+        low, high = date_bounds(query)
+        period = {}
+        if low is not None:
+            period["$gte"] = bucket_period(low)
+        if high is not None:
+            period["$lte"] = stored_date(high)
+        if period:
+            match["period"] = period
+        conditions = {k: v for k, v in query.items() if k in ELEMENT_FIELDS}
+        if conditions:
+            match["txns"] = {"$elemMatch": conditions}
+        return match
+
+    def pipeline(self, query: dict) -> list:
+        conditions = dict(query)
+        if "$text" in conditions:
+            words = conditions.pop("$text")["$search"].split()
+            conditions["note"] = {"$regex": "|".join(map(re.escape, words)), "$options": "i"}
+        return [
+            {"$match": self.bucket_match(query)},
+            {"$unwind": "$txns"},
+            {"$project": FLAT_PROJECTION},
+            {"$match": conditions},
+        ]
+
+    def find(self, query: dict, projection: dict, sort: list, limit: int = None, batch_size: int = None, session=None):
+        # Rows always carry every field; `projection` only narrows the documents layout
+        stages = [*self.pipeline(query), {"$sort": dict(sort)}]
+        if limit is not None:
+            stages.append({"$limit": limit})
+        options = {"allowDiskUse": True}
+        if batch_size is not None:
+            options["batchSize"] = batch_size
+        return self.collection.aggregate(stages, session=session, **options)
+
+    def plan_cursor(self, query: dict, sort: list):
+        # Only the first $match touches an index; the rest runs on the buckets it found
+        return self.collection.find(self.bucket_match(query))
+
+    def aggregate(self, query: dict, stages: list):
+        return self.collection.aggregate([*self.pipeline(query), *stages], allowDiskUse=True)
+
+    def push(self, user_id: str, period: datetime, txns: list):
+        """Filter and update adding `txns` to a bucket of that user-month with room, or a new one."""
+        totals = {}
+        for txn in txns:
+            key = f"totals.{txn['type']}"
+            totals[key] = totals.get(key, 0) + txn["amount"]
+        return (
+            {"user_id": user_id, "period": period, "count": {"$lte": self.size - len(txns)}},
+            {"$push": {"txns": {"$each": [element(txn) for txn in txns]}}, "$inc": {"count": len(txns), **totals}},
+        )
+
+    async def insert_one(self, txn: dict):
+        txn.setdefault("_id", ObjectId())
+        await self.collection.update_one(*self.push(txn["user_id"], bucket_period(txn["date"]), [txn]), upsert=True)
+
+    async def insert_many(self, txns: list) -> list:
+        """Insert what can be inserted; returns (index in txns, error) for the rest."""
+        months = {}
+        for i, txn in enumerate(txns):
+            txn.setdefault("_id", ObjectId())
+            months.setdefault((txn["user_id"], bucket_period(txn["date"])), []).append(i)
+        ops, op_rows = [], []
+        for (user_id, period), rows in months.items():
+            for start in range(0, len(rows), self.size):
+                chunk = rows[start:start + self.size]
+                ops.append(UpdateOne(*self.push(user_id, period, [txns[i] for i in chunk]), upsert=True))
+                op_rows.append(chunk)
+        try:
+            await self.collection.bulk_write(ops, ordered=False)
+        except BulkWriteError as e:
+            return [
+                (i, err.get("errmsg", "write failed"))
+                for err in e.details.get("writeErrors", []) for i in op_rows[err["index"]]
+            ]
+        return []
+
+    async def find_element(self, user_id: str, txn_id: ObjectId):
+        """(bucket _id, period, the transaction as stored) or None."""
+        bucket = await self.collection.find_one(
+            {"user_id": user_id, "txns._id": txn_id}, {"period": 1, "txns": {"$elemMatch": {"_id": txn_id}}}
+        )
+        if bucket is None:
+            return None
+        return bucket["_id"], bucket["period"], bucket["txns"][0]
+
+    async def pull(self, bucket_filter: dict, stored: dict) -> bool:
+        """Remove `stored` from the bucket if it is still exactly that; False if it changed meanwhile."""
+        result = await self.collection.update_one(
+            {**bucket_filter, "txns": {"$elemMatch": stored}},
+            {"$pull": {"txns": {"_id": stored["_id"]}}, "$inc": {"count": -1, f"totals.{stored['type']}": -stored["amount"]}},
+        )
+        if result.modified_count:
+            await self.collection.delete_one({**bucket_filter, "count": 0})
+        return bool(result.modified_count)
+
+    async def update(self, user_id: str, txn_id: ObjectId, changes: dict):
+        """Apply `changes` to one of the user's transactions; returns it as it was, or None."""
+        while True:
+            found = await self.find_element(user_id, txn_id)
+            if found is None:
+                return None
+            bucket_id, period, stored = found
+            updated = {**stored, **changes}
+            if bucket_period(updated["date"]) != period:
+                # Add it to the new month before removing it from the old one, so a crash in
+                # between leaves a duplicate rather than losing it
+                new_period = bucket_period(updated["date"])
+                await self.collection.update_one(*self.push(user_id, new_period, [updated]), upsert=True)
+                if await self.pull({"_id": bucket_id}, stored):
+                    return {**stored, "user_id": user_id}
+                await self.pull({"user_id": user_id, "period": new_period}, element(updated))
+                continue
+
+            totals = {f"totals.{stored['type']}": -stored["amount"]}
+            key = f"totals.{updated['type']}"
+            totals[key] = totals.get(key, 0) + updated["amount"]
+            # Matching the whole element makes this a compare-and-set against what was read
+            result = await self.collection.update_one(
+                {"_id": bucket_id, "txns": {"$elemMatch": stored}},
+                {"$set": {f"txns.$.{k}": v for k, v in changes.items()}, "$inc": totals},
+            )
+            if result.modified_count:
+                return {**stored, "user_id": user_id}
+
+    async def delete(self, user_id: str, txn_id: ObjectId):
+        """Delete one of the user's transactions; returns it, or None."""
+        while True:
+            found = await self.find_element(user_id, txn_id)
+            if found is None:
+                return None
+            bucket_id, _, stored = found
+            if await self.pull({"_id": bucket_id}, stored):
+                return {**stored, "user_id": user_id}
+
+    async def uncategorise(self, user_id: str, category_id: str) -> int:
+        result = await self.collection.update_many(
+            {"user_id": user_id, "txns.category_id": category_id},
+            {"$set": {"txns.$[txn].category_id": None}},
+            array_filters=[{"txn.category_id": category_id}],
+        )
+        return result.modified_count
+
+
+# --------------------------------
+# Migration
+# --------------------------------
+def new_bucket(user_id: str, period: datetime) -> dict:
+    return {"user_id": user_id, "period": period, "count": 0, "totals": {"income": 0, "expense": 0}, "txns": []}
+
+
+async def migrate(documents, buckets: BucketStore, user_id: str = None) -> int:
+    """Rebuild buckets from the documents collection (for one user or everyone); returns buckets written."""
+    scope = {} if user_id is None else {"user_id": user_id}
+    await buckets.collection.delete_many(scope)
+    # The user_id_date index's order, so every user-month comes out in one run
+    cursor = documents.find(scope).sort([("user_id", ASCENDING), ("date", DESCENDING), ("_id", DESCENDING)])
+    written, batch, bucket = 0, [], None
+    async for txn in cursor:
+        period = bucket_period(txn["date"])
+        if bucket is None or bucket["user_id"] != txn["user_id"] or bucket["period"] != period \
+                or bucket["count"] == buckets.size:
+            bucket = new_bucket(txn["user_id"], period)
+            batch.append(bucket)
+        bucket["txns"].append(element(txn))
+        bucket["count"] += 1
+        bucket["totals"][txn["type"]] += txn["amount"]
+        if len(batch) > MIGRATE_BATCH_SIZE:
+            # Everything but the bucket still being filled
+            await buckets.collection.insert_many(batch[:-1])
+            written += len(batch) - 1
+            batch = batch[-1:]
+    if batch:
+        await buckets.collection.insert_many(batch)
+        written += len(batch)
+    return written
+
+
+# Float sums drift slightly depending on the order amounts were added in
+TOLERANCE = 1e-6
+
+
+def totals_differ(a: dict, b: dict) -> bool:
+    return a["count"] != b["count"] or any(abs(a[t] - b[t]) > TOLERANCE for t in ("income", "expense"))
+
+
+async def check(documents, buckets: BucketStore, user_id: str = None) -> list:
+    """
+    Return every bucket whose count or totals don't add up to its own
+    transactions, and every user-month where buckets and documents disagree.
+    """
+    scope = {} if user_id is None else {"user_id": user_id}
+    expected = {}
+    pipeline = [
+        {"$match": scope},
+        {"$group": {
+            "_id": {"user_id": "$user_id", "year": {"$year": "$date"}, "month": {"$month": "$date"}, "type": "$type"},
+            "total": {"$sum": "$amount"},
+            "count": {"$sum": 1},
+        }},
+    ]
+    async for row in documents.aggregate(pipeline, allowDiskUse=True):
+        key = (row["_id"]["user_id"], datetime(row["_id"]["year"], row["_id"]["month"], 1))
+        month = expected.setdefault(key, {"count": 0, "income": 0, "expense": 0})
+        month["count"] += row["count"]
+        month[row["_id"]["type"]] += row["total"]
+
+    problems, actual = [], {}
+    async for bucket in buckets.collection.find(scope):
+        own = {"count": len(bucket["txns"]), "income": 0, "expense": 0}
+        for txn in bucket["txns"]:
+            own[txn["type"]] += txn["amount"]
+        stored = {"count": bucket["count"], **{t: bucket["totals"].get(t, 0) for t in ("income", "expense")}}
+        if totals_differ(own, stored):
+            problems.append({"bucket": bucket["_id"], "stored": stored, "contents": own})
+        month = actual.setdefault((bucket["user_id"], bucket["period"]), {"count": 0, "income": 0, "expense": 0})
+        for field in month:
+            month[field] += own[field]
+
+    empty = {"count": 0, "income": 0, "expense": 0}
+    for key in expected.keys() | actual.keys():
+        want, got = expected.get(key, empty), actual.get(key, empty)
+        if totals_differ(want, got):
+            problems.append({"user_id": key[0], "period": key[1], "documents": want, "buckets": got})
+    return problems
+
+
+async def run_command(argv) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.storage")
+    parser.add_argument("command", choices=["migrate", "check"])
+    parser.add_argument("--user", help="Only this user_id (default: everyone)")
+    args = parser.parse_args(argv)
+
+    from app import main
+    from app.mongo import create_mongo_client
+
+    main.bind_database(create_mongo_client(main.MONGO_URI))
+    buckets = BucketStore(main.db[main.BUCKETS_COLLECTION_NAME])
+    if args.command == "migrate":
+        await buckets.ensure_indexes()
+        count = await migrate(main.transactions_collection, buckets, args.user)
+        print(f"Wrote {count} bucket documents")
+        return 0
+
+    problems = await check(main.transactions_collection, buckets, args.user)
+    for problem in problems:
+        print(problem)
+    print(f"{len(problems)} inconsistencies")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(run_command(sys.argv[1:])))
@@ -0,0 +1,85 @@
+import os
+import shutil
+import sys
+from contextlib import asynccontextmanager
+
+import pytest
+from bson import ObjectId
+from jose import jwt
+
+# Run from backend/transaction_service: `app` imports the way it does in the image
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+BENCHMARKS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "benchmarks")
+
+# app.main reads its configuration at import
+os.environ.setdefault("MONGO_URI", "mongodb://127.0.0.1:27017")
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+os.environ.setdefault("CATEGORY_EVENTS_ENABLED", "false")
+# mongomock can't say whether it's a replica set, so no change streams
+os.environ.setdefault("CHANGE_FEED_SOURCE", "local")
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """The app over an empty in-memory mongomock-motor database, lifespan entered."""
+    from fastapi.testclient import TestClient
+    from mongomock_motor import AsyncMongoMockClient
+
+    from app import main
+
+    mongo = AsyncMongoMockClient()
+
+    async def no_warm_up(client):
+        pass
+
+    # mongomock has no sessions or read preferences: report reads go to the one "server"
+    @asynccontextmanager
+    async def no_session(client, after=None):
+        yield None
+
+    monkeypatch.setattr(main, "create_mongo_client", lambda uri: mongo)
+    monkeypatch.setattr(main, "warm_up_pool", no_warm_up)
+    monkeypatch.setattr(main, "causal_session", no_session)
+    monkeypatch.setattr(main, "for_reports", lambda collection: collection)
+    with TestClient(main.app) as client:
+        yield client
+
+
+def new_user():
+    user_id = str(ObjectId())
+    token = jwt.encode({"sub": user_id}, os.environ["SECRET_KEY"], algorithm="HS256")
+    return user_id, {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture
+def user():
+    """A fresh user id and its Authorization header; in-process caches are per user."""
+    return new_user()
+
+
+@pytest.fixture
+def other_user():
+    return new_user()
+
+
+@pytest.fixture(scope="session")
+def replica_set():
+    """
+    Connection string of a throwaway three-member replica set on localhost
+    (benchmarks/replica_set.py), up for the whole session. Uses MONGOD, else
+    mongod on PATH; skips without one. TEST_REPLICA_SET_URI uses a running set.
+    """
+    if os.environ.get("TEST_REPLICA_SET_URI"):
+        yield os.environ["TEST_REPLICA_SET_URI"]
+        return
+    mongod = os.environ.get("MONGOD") or shutil.which("mongod")
+    if not mongod:
+        pytest.skip("needs mongod (set MONGOD or put it on PATH) or TEST_REPLICA_SET_URI")
+    sys.path.insert(0, BENCHMARKS_DIR)
+    from replica_set import BASE_PORT, MEMBERS, REPLICA_SET_NAME, start, stop
+
+    uri, processes, root = start(mongod, BASE_PORT, MEMBERS, REPLICA_SET_NAME)
+    try:
+        yield uri
+    finally:
+        stop(processes, root)
@@ -0,0 +1,104 @@
+import asyncio
+from datetime import datetime
+
+import numpy as np
+import pytest
+from bson import ObjectId
+
+from app.analytics import compute_analytics, group_quantile, load_columns, rolling_mean, year_over_year
+
+
+def columns_of(*rows):
+    """Columns for (type, amount, date[, category_id]) rows."""
+    async def cursor():
+        for type, amount, date, *category in rows:
+            yield {"_id": ObjectId(), "type": type, "amount": amount, "date": date,
+                   "category_id": category[0] if category else None}
+    return asyncio.run(load_columns(cursor()))
+
+
+def test_rolling_mean_averages_what_the_window_covers():
+    values = np.array([1.0, 2.0, 3.0, 4.0])
+    assert rolling_mean(values, 1).tolist() == [1.0, 2.0, 3.0, 4.0]
+    assert rolling_mean(values, 2).tolist() == [1.0, 1.5, 2.5, 3.5]
+    assert rolling_mean(values, 3).tolist() == [1.0, 1.5, 2.0, 3.0]
+    # Longer than the data: a running mean
+    assert rolling_mean(values, 10).tolist() == [1.0, 1.5, 2.0, 2.5]
+    assert rolling_mean(np.array([]), 3).tolist() == []
+
+
+def test_year_over_year_needs_a_year_of_history():
+    change, previous = year_over_year(np.arange(1.0, 15.0))
+    assert np.isnan(change[:12]).all() and np.isnan(previous[:12]).all()
+    assert change[12:].tolist() == [12.0, 12.0]
+    assert previous[12:].tolist() == [1.0, 2.0]
+
+    for short in (np.array([]), np.array([5.0]), np.arange(12.0)):
+        change, previous = year_over_year(short)
+        assert len(change) == len(short) and np.isnan(previous).all()
+
+
+def test_group_quantile_matches_numpy_percentile():
+    # Two groups sorted within themselves: [1, 2, 3, 4] and [10]
+    values = np.array([1.0, 2.0, 3.0, 4.0, 10.0])
+    starts, counts = np.array([0, 4]), np.array([4, 1])
+    assert group_quantile(values, starts, counts, 0.25).tolist() == [1.75, 10.0]
+    assert group_quantile(values, starts, counts, 0.5).tolist() == [2.5, 10.0]
+    assert group_quantile(values, starts, counts, 0.75).tolist() == [3.25, 10.0]
+    for q in (0.25, 0.5, 0.75, 0.9):
+        assert group_quantile(values, starts, counts, q)[0] == pytest.approx(np.percentile(values[:4], q * 100))
+
+
+def test_empty_history_has_no_analytics():
+    assert compute_analytics(columns_of(), 3) == {"window": 3, "months": [], "categories": [], "outliers": []}
+
+
+def test_single_month():
+    result = compute_analytics(columns_of(
+        ("expense", 50.0, datetime(2025, 3, 5)),
+        ("income", 20.0, datetime(2025, 3, 6)),
+    ), 3)
+    assert result["months"] == [{
+        "year": 2025, "month": 3, "income": 20.0, "expense": 50.0, "net": -30.0,
+        "income_avg": 20.0, "expense_avg": 50.0, "net_avg": -30.0,
+        "income_yoy": None, "expense_yoy": None, "expense_yoy_pct": None,
+    }]
+    assert result["outliers"] == []
+
+
+def test_year_over_year_percent_skips_months_without_expenses_a_year_earlier():
+    months = compute_analytics(columns_of(
+        ("income", 100.0, datetime(2024, 1, 10)),
+        ("expense", 10.0, datetime(2024, 2, 10)),
+        ("expense", 30.0, datetime(2025, 1, 10)),
+        ("expense", 15.0, datetime(2025, 2, 10)),
+    ), 2)["months"]
+    assert [(m["year"], m["month"]) for m in months][0] == (2024, 1)
+    assert len(months) == 14
+    # Gap months count as zero in the averages
+    assert months[2]["expense_avg"] == 5.0
+    january, february = months[12], months[13]
+    assert (january["expense_yoy"], january["expense_yoy_pct"], january["income_yoy"]) == (30.0, None, -100.0)
+    assert (february["expense_yoy"], february["expense_yoy_pct"]) == (5.0, 50.0)
+    assert february["expense_avg"] == 22.5
+
+
+def test_outliers_use_the_upper_fence_of_their_category():
+    rows = [("expense", float(amount), datetime(2025, 1, amount), "food") for amount in range(1, 9)]
+    rows.append(("expense", 100.0, datetime(2025, 2, 1), "food"))
+    # Too few expenses to have a fence
+    rows += [("expense", amount, datetime(2025, 1, 1), "rent") for amount in (1.0, 1.0, 500.0)]
+    rows.append(("income", 1000.0, datetime(2025, 1, 1), "food"))
+    result = compute_analytics(columns_of(*rows), 3)
+
+    food, rent = sorted(result["categories"], key=lambda c: c["category_id"])
+    # [1..8, 100]: Q1 = 3, Q3 = 7, so 7 + 1.5 * 4
+    assert (food["count"], food["total"], food["p25"], food["p50"], food["p75"]) == (9, 136.0, 3.0, 5.0, 7.0)
+    assert food["outlier_threshold"] == 13.0
+    assert rent["outlier_threshold"] is None
+    # Biggest spending first
+    assert [c["category_id"] for c in result["categories"]] == ["rent", "food"]
+
+    assert [(o["category_id"], o["amount"], o["threshold"], o["date"]) for o in result["outliers"]] == [
+        ("food", 100.0, 13.0, datetime(2025, 2, 1)),
+    ]
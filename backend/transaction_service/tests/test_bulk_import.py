@@ -0,0 +1,82 @@
+import asyncio
+import csv
+import io
+
+from app import main
+
+
+class Body:
+    """Stands in for a Request whose body arrives in the given chunks."""
+
+    def __init__(self, *chunks: bytes):
+        self.chunks = chunks
+
+    async def stream(self):
+        for chunk in self.chunks:
+            yield chunk
+
+
+def parse(parser, *chunks: bytes) -> list:
+    async def collect():
+        return [row async for row in parser(main.iter_body_lines(Body(*chunks)))]
+
+    return asyncio.run(collect())
+
+
+def test_csv_quoted_newline_survives_export_and_reimport():
+    exported = main.export_csv_row({"date": "2025-03-01T00:00:00", "type": "expense", "amount": 5.0,
+                                    "note": "line1\nline2, with comma"})
+    body = (",".join(main.EXPORT_FIELDS) + "\r\n" + exported + exported).encode()
+    # Split mid-field so the quoted newline straddles two chunks
+    middle = body.index(b"line2")
+    rows = parse(main.iter_csv_rows, body[:middle], body[middle:])
+
+    assert [line for line, _ in rows] == [2, 4]
+    assert all(row["note"] == "line1\nline2, with comma" for _, row in rows)
+    assert rows[0][1]["amount"] == "5.0"
+
+
+def test_csv_row_errors_keep_line_numbers():
+    rows = parse(main.iter_csv_rows, "\ufeffdate,type,amount\n\n2025-01-01,expense,1\nonly-one\n".encode())
+    assert rows[0] == (3, {"date": "2025-01-01", "type": "expense", "amount": "1"})
+    assert rows[1][0] == 4
+    assert str(rows[1][1]) == "expected 3 columns, got 1"
+
+
+def test_csv_invalid_utf8_is_a_row_error():
+    rows = parse(main.iter_csv_rows, b"date,type,amount\n2025-01-01,expense,1\n", b"\xff\xfe,bad\n")
+    assert rows[0][0] == 2
+    assert rows[1][0] == 3
+    assert isinstance(rows[1][1], ValueError)
+    assert "UTF-8" in str(rows[1][1])
+
+
+def test_ndjson_invalid_utf8_is_a_row_error():
+    rows = parse(main.iter_ndjson_rows, b'{"amount": 1}\n\n', b'{"note": "\xc3"}\n')
+    assert rows[0] == (1, {"amount": 1})
+    assert rows[1][0] == 3
+    assert "UTF-8" in str(rows[1][1])
+
+
+def test_export_rows_parse_as_csv():
+    # The reader used on import agrees with the writer used on export
+    row = main.export_csv_row({"note": 'say "hi"\r\nbye'})
+    assert next(csv.reader(io.StringIO(row))) == ["", "", "", "", "", 'say "hi"\r\nbye']
+
+
+def test_csv_import_with_an_empty_user_id_column(api, user, other_user):
+    user_id, headers = user
+    body = (
+        "user_id,type,amount,date,note\n"
+        ",expense,5,2025-02-01T00:00:00,\"multi\nline\"\n"
+        f"{user_id},income,7,2025-02-02T00:00:00,\n"
+        f"{other_user[0]},income,9,2025-02-03T00:00:00,\n"
+    )
+    result = api.post("/transactions/bulk", content=body.encode(),
+                      headers={**headers, "Content-Type": "text/csv"}).json()
+    assert result["inserted"] == 2
+    assert [error["line"] for error in result["errors"]] == [5]
+    summary = api.get("/transactions/summary", params={"year": 2025, "month": 2}, headers=headers).json()
+    assert (summary["income"], summary["expense"]) == (7.0, 5.0)
+    notes = {row["amount"]: row["note"] for row in api.get("/transactions", headers=headers).json()}
+    assert notes[5.0] == "multi\nline"
@@ -0,0 +1,64 @@
+from datetime import datetime
+
+import httpx
+from jose import jwt
+
+from app import category_events, main
+
+
+def test_reconcile_applies_deletes_that_never_arrived(api, user):
+    user_id, _ = user
+    api.portal.call(main.transaction_store.insert_many, [
+        {"user_id": user_id, "type": "expense", "amount": 1.0, "date": datetime(2025, 1, 1), "category_id": "kept"},
+        {"user_id": user_id, "type": "expense", "amount": 2.0, "date": datetime(2025, 1, 2), "category_id": "gone"},
+        {"user_id": user_id, "type": "expense", "amount": 3.0, "date": datetime(2025, 1, 3), "category_id": None},
+    ])
+    # A category with only rollups left here
+    api.portal.call(main.rollups_collection.insert_one, {
+        "user_id": user_id, "year": 2024, "month": 1, "type": "expense", "category_id": "old", "total": 0, "count": 0,
+    })
+
+    def category_service(request):
+        claims = jwt.decode(request.headers["Authorization"].split()[1], main.SECRET_KEY, algorithms=[main.ALGORITHM])
+        assert claims["scope"] == category_events.EVENTS_SCOPE
+        assert request.url.path == "/internal/category-ids"
+        assert request.url.params["user_id"] == user_id
+        return httpx.Response(200, json=["kept", "unused"])
+
+    applied = []
+
+    async def apply_events(events):
+        applied.extend(events)
+
+    async def run(dry_run):
+        async with httpx.AsyncClient(transport=httpx.MockTransport(category_service), base_url="http://c") as http:
+            return await category_events.reconcile(
+                http, main.transaction_store, main.rollups_collection, apply_events,
+                main.SECRET_KEY, main.ALGORITHM, user_id, dry_run,
+            )
+
+    expected = [
+        {"type": "deleted", "user_id": user_id, "category_id": "gone"},
+        {"type": "deleted", "user_id": user_id, "category_id": "old"},
+    ]
+    assert api.portal.call(run, True) == expected
+    assert applied == []
+    assert api.portal.call(run, False) == expected
+    assert applied == expected
+
+
+def test_deleted_category_rollups_fold_into_uncategorised(api, user):
+    user_id, headers = user
+    for amount, category in ((5.0, "gone"), (7.0, "gone"), (1.0, None), (2.0, "kept")):
+        api.post("/transactions", headers=headers, json={
+            "user_id": user_id, "type": "expense", "amount": amount, "date": "2025-06-01T00:00:00",
+            "category_id": category,
+        })
+
+    moved = api.portal.call(main.move_category_rollups, main.rollups_collection, user_id, "gone")
+    assert moved == 1
+    rows = api.get("/transactions/summary/categories", params={"year": 2025}, headers=headers).json()
+    assert {row["category_id"]: row["expense"] for row in rows} == {None: 13.0, "kept": 2.0}
+    assert api.portal.call(main.rollups_collection.count_documents, {"category_id": "gone"}) == 0
+    # Nothing left to move the second time round
+    assert api.portal.call(main.move_category_rollups, main.rollups_collection, user_id, "gone") == 0
@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta
+
+import orjson
+
+from app import main
+
+
+def seed(api, user_id, count):
+    start = datetime(2025, 1, 1)
+    api.portal.call(main.transaction_store.insert_many, [
+        {"user_id": user_id, "type": "expense", "amount": float(i), "date": start + timedelta(hours=i), "note": None}
+        for i in range(count)
+    ])
+
+
+def test_listing_without_limit_returns_one_page(api, user):
+    user_id, headers = user
+    seed(api, user_id, main.DEFAULT_PAGE_SIZE + 1)
+
+    first = api.get("/transactions", headers=headers)
+    assert len(first.json()) == main.DEFAULT_PAGE_SIZE
+    rest = api.get("/transactions", params={"after": first.headers["x-next-cursor"]}, headers=headers)
+    # Newest first, so the oldest is left over
+    assert [row["amount"] for row in rest.json()] == [0.0]
+    assert "x-next-cursor" not in rest.headers
+
+
+def test_stream_sends_every_transaction(api, user):
+    user_id, headers = user
+    seed(api, user_id, main.DEFAULT_PAGE_SIZE + 1)
+    response = api.get("/transactions/stream", headers=headers)
+    assert len([orjson.loads(line) for line in response.content.splitlines()]) == main.DEFAULT_PAGE_SIZE + 1
+
+
+def test_month_filter_etag_changes_with_the_year(api, user, monkeypatch):
+    _, headers = user
+    before = api.get("/transactions", params={"month": 3}, headers=headers)
+    assert api.get("/transactions", params={"month": 3},
+                   headers={**headers, "If-None-Match": before.headers["etag"]}).status_code == 304
+
+    class NextYear(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return datetime(datetime.now().year + 1, 1, 1, tzinfo=tz)
+
+    # ?month=3 now means March of another year, so the old copy must not be reused
+    monkeypatch.setattr(main, "datetime", NextYear)
+    after = api.get("/transactions", params={"month": 3}, headers={**headers, "If-None-Match": before.headers["etag"]})
+    assert after.status_code == 200
+    assert after.headers["etag"] != before.headers["etag"]
+
+
+def test_listings_send_the_version_they_were_read_at(api, user):
+    user_id, headers = user
+    assert api.get("/transactions/stream", headers=headers).headers["x-data-version"] == "0"
+    for day in (1, 2):
+        api.post("/transactions", headers=headers, json={
+            "user_id": user_id, "type": "expense", "amount": 1.0, "date": f"2025-01-0{day}T00:00:00",
+        })
+    assert api.get("/transactions/stream", headers=headers).headers["x-data-version"] == "2"
+    listing = api.get("/transactions", headers=headers)
+    assert listing.headers["x-data-version"] == "2"
+    not_modified = api.get("/transactions", headers={**headers, "If-None-Match": listing.headers["etag"]})
+    assert not_modified.status_code == 304
+    assert not_modified.headers["x-data-version"] == "2"
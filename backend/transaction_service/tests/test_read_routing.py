@@ -0,0 +1,131 @@
+"""
+Report reads against a real replica set (the `replica_set` fixture; skipped
+without mongod): they run on secondaries, and still include the user's own
+latest write, even while replication to the secondaries is held back.
+"""
+import collections
+import threading
+import time
+from datetime import datetime
+
+import pytest
+from pymongo import MongoClient, monitoring
+
+from app import main
+
+DB_NAME = "transactions_service_test"
+# (command, collection) of the report reads; everything else belongs on the primary
+REPORT_READS = {
+    ("aggregate", "monthly_rollups"),
+    ("find", "transactions_db"), ("getMore", "transactions_db"),
+    ("aggregate", "transaction_buckets"), ("getMore", "transaction_buckets"),
+    ("killCursors", "transactions_db"), ("killCursors", "transaction_buckets"),
+}
+
+
+class CommandTally(monitoring.CommandListener):
+    """(command, collection) -> Counter of the member addresses that ran it, for DB_NAME."""
+
+    def __init__(self):
+        self.commands = collections.defaultdict(collections.Counter)
+
+    def started(self, event):
+        if event.database_name != DB_NAME:
+            return
+        target = event.command.get("collection" if event.command_name == "getMore" else event.command_name)
+        if isinstance(target, str):
+            self.commands[(event.command_name, target)]["%s:%s" % event.connection_id] += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+@pytest.fixture(scope="module")
+def members(replica_set):
+    probe = MongoClient(replica_set)
+    try:
+        hello = probe.admin.command("hello")
+    finally:
+        probe.close()
+    primary = hello["primary"]
+    return primary, [host for host in hello["hosts"] if host != primary]
+
+
+@pytest.fixture
+def rs_api(replica_set, monkeypatch):
+    """The app on the replica set, in a database of its own; yields (client, tally)."""
+    from fastapi.testclient import TestClient
+
+    assert main.MONGO_REPORT_READ_PREFERENCE == "secondaryPreferred"
+    tally = CommandTally()
+    # Clients created from here on report to it
+    monitoring.register(tally)
+    # w=1: a write returns before any secondary has it, which is what causal reads must cope with
+    # (the server's default, w=majority, would also block writes while replication is held)
+    monkeypatch.setattr(main, "MONGO_URI", replica_set + ("&" if "?" in replica_set else "/?") + "w=1")
+    monkeypatch.setattr(main, "DB_NAME", DB_NAME)
+    with TestClient(main.app) as client:
+        yield client, tally
+        client.portal.call(main.client.drop_database, DB_NAME)
+
+
+def hold_replication(secondaries: list, on: bool):
+    for member in secondaries:
+        client = MongoClient(member, directConnection=True)
+        try:
+            client.admin.command("configureFailPoint", "stopReplProducer", mode="alwaysOn" if on else "off")
+        finally:
+            client.close()
+
+
+def write_and_report(api, user, expected: int) -> float:
+    """Write one transaction, check every report includes it; returns how long the reports took."""
+    _, headers = user
+    now = datetime.now()
+    created = api.post("/transactions", headers=headers, json={
+        "user_id": user[0], "type": "expense", "amount": 1.0, "date": now.isoformat(),
+    })
+    assert created.status_code == 200
+    started = time.monotonic()
+    summary = api.get("/transactions/summary", params={"year": now.year, "month": now.month}, headers=headers)
+    analytics = api.get("/transactions/analytics", headers=headers)
+    export = api.get("/transactions/export", headers=headers)
+    elapsed = time.monotonic() - started
+    assert summary.json()["count"] == expected
+    assert round(sum(month["expense"] for month in analytics.json()["months"])) == expected
+    assert len(export.text.strip().splitlines()) - 1 == expected
+    return elapsed
+
+
+def test_report_reads_run_on_secondaries(rs_api, user, members):
+    api, tally = rs_api
+    primary, secondaries = members
+    for expected in range(1, 6):
+        write_and_report(api, user, expected)
+
+    for (command, collection), by_member in tally.commands.items():
+        if (command, collection) in REPORT_READS:
+            assert primary not in by_member, f"{command} on {collection} ran on the primary"
+        else:
+            assert set(by_member) == {primary}, f"{command} on {collection} ran on a secondary"
+    assert ("aggregate", "monthly_rollups") in tally.commands
+
+
+def test_report_reads_wait_for_a_lagging_secondary(rs_api, user, members):
+    api, _ = rs_api
+    _, secondaries = members
+    write_and_report(api, user, 1)
+
+    lag = 2.0
+    hold_replication(secondaries, True)
+    release = threading.Timer(lag, hold_replication, (secondaries, False))
+    release.start()
+    try:
+        # The secondaries don't have this write until the failpoint is lifted
+        assert write_and_report(api, user, 2) >= lag * 0.8
+    finally:
+        release.cancel()
+        hold_replication(secondaries, False)
@@ -0,0 +1,179 @@
+import asyncio
+import os
+import time
+
+import pytest
+import redis.asyncio as redis
+from fakeredis import FakeAsyncRedis
+from jose import JWTError, jwt
+
+from app import auth
+from app.auth import TTLCache, TokenVerifier
+from app.cache import SharedCache
+from app.singleflight import SingleFlight
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Each image only ships its own app/, so these are copied by hand (see their headers)
+SHARED_MODULES = {
+    "auth.py": ("transaction_service", "category_service", "user_service"),
+    "cache.py": ("transaction_service", "category_service", "user_service"),
+    "metrics.py": ("transaction_service", "category_service", "user_service"),
+    "mongo.py": ("transaction_service", "category_service", "user_service"),
+    "changes.py": ("transaction_service", "category_service"),
+    "singleflight.py": ("transaction_service", "category_service"),
+    "versions.py": ("transaction_service", "category_service"),
+}
+
+
+@pytest.mark.parametrize("module", sorted(SHARED_MODULES))
+def test_shared_modules_are_identical_in_every_service(module):
+    services = SHARED_MODULES[module]
+    copies = {}
+    for service in services:
+        with open(os.path.join(BACKEND_DIR, service, "app", module), "rb") as f:
+            copies[service] = f.read()
+    differing = [service for service in services if copies[service] != copies[services[0]]]
+    assert not differing, f"app/{module} in {', '.join(differing)} differs from {services[0]}; copy the change over"
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(auth.time, "monotonic", clock)
+    return clock
+
+
+def test_ttl_cache_expires_entries(clock):
+    cache = TTLCache(maxsize=10, ttl=30)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=5)
+    clock.now += 5
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    clock.now += 25
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_ttl_cache_evicts_least_recently_used(clock):
+    cache = TTLCache(maxsize=2, ttl=30)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    # Reading "a" makes "b" the oldest
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
+    # So does writing it again
+    cache.set("a", 4)
+    cache.set("d", 5)
+    assert (cache.get("a"), cache.get("c"), cache.get("d")) == (4, None, 5)
+
+
+def test_token_verifier_never_caches_past_exp(clock):
+    verifier = TokenVerifier("secret", "HS256", cache_size=10, ttl=300)
+    token = jwt.encode({"sub": "u", "exp": int(time.time()) + 60}, "secret", algorithm="HS256")
+    assert verifier.decode(token)["sub"] == "u"
+    _, expires_at = verifier.cache._data[token]
+    assert expires_at - clock.now <= 60
+
+    expired = jwt.encode({"sub": "u", "exp": int(time.time()) - 1}, "secret", algorithm="HS256")
+    with pytest.raises(JWTError):
+        verifier.decode(expired)
+    assert expired not in verifier.cache._data
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    flight = SingleFlight("test")
+    calls = []
+
+    async def run():
+        release = asyncio.Event()
+
+        async def load():
+            calls.append(1)
+            await release.wait()
+            return {"rows": []}
+
+        callers = [asyncio.ensure_future(flight.do("etag", load)) for _ in range(3)]
+        other = asyncio.ensure_future(flight.do("other", load))
+        await asyncio.sleep(0)
+        # A caller that goes away doesn't cancel the load for the rest
+        callers[0].cancel()
+        release.set()
+        results = await asyncio.gather(*callers[1:], other)
+        assert results[0] is results[1]
+        assert results[0] is not results[2]
+        assert len(calls) == 2
+        assert flight.calls == {}
+
+        # Once finished, the next call loads again
+        await flight.do("etag", load)
+        assert len(calls) == 3
+
+    asyncio.run(run())
+
+
+def test_single_flight_shares_failures_and_forgets_them():
+    flight = SingleFlight("test")
+    attempts = []
+
+    async def load():
+        attempts.append(1)
+        await asyncio.sleep(0)
+        raise ValueError("boom")
+
+    async def run():
+        results = await asyncio.gather(flight.do("k", load), flight.do("k", load), return_exceptions=True)
+        assert [type(r) for r in results] == [ValueError, ValueError]
+        assert len(attempts) == 1
+        with pytest.raises(ValueError):
+            await flight.do("k", load)
+        assert len(attempts) == 2
+
+    asyncio.run(run())
+
+
+def test_shared_cache_round_trip_and_invalidate():
+    async def run():
+        cache = SharedCache(FakeAsyncRedis(), "test", ttl=60)
+        assert await cache.get("u", "etag") is None
+        await cache.set("u", "etag", {"rows": [1, 2]})
+        assert await cache.get("u", "etag") == {"rows": [1, 2]}
+        assert 0 < await cache.client.ttl(cache.key("u")) <= 60
+        await cache.invalidate("u")
+        assert await cache.get("u", "etag") is None
+        await cache.close()
+
+    asyncio.run(run())
+
+
+def test_shared_cache_falls_back_to_misses_when_redis_is_down():
+    async def run():
+        # Nothing listens on port 1
+        client = redis.from_url("redis://127.0.0.1:1", socket_timeout=0.2, socket_connect_timeout=0.2)
+        cache = SharedCache(client, "test")
+        await cache.set("u", "etag", {"rows": []})
+        assert await cache.get("u", "etag") is None
+        await cache.invalidate("u")
+        await cache.close()
+
+    asyncio.run(run())
+
+
+def test_shared_cache_without_a_client_is_a_no_op():
+    async def run():
+        cache = SharedCache(None, "test")
+        await cache.set("u", "etag", 1)
+        assert await cache.get("u", "etag") is None
+        await cache.invalidate("u")
+        await cache.close()
+
+    asyncio.run(run())
@@ -0,0 +1,147 @@
+import asyncio
+import copy
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+from mongomock_motor import AsyncMongoMockClient
+
+from app import main, storage
+from app.storage import BucketStore
+
+
+class Buckets(BucketStore):
+    async def find_element(self, user_id, txn_id):
+        # mongomock's $elemMatch projection hands back the stored element itself,
+        # so later writes would change what was read; MongoDB returns a copy
+        return copy.deepcopy(await super().find_element(user_id, txn_id))
+
+
+@pytest.fixture
+def db():
+    return AsyncMongoMockClient()["storage_test"]
+
+
+def txn(user_id, amount, date, type="expense", **fields):
+    return {"user_id": user_id, "type": type, "amount": amount, "date": date, "note": None, "category_id": None, **fields}
+
+
+def buckets_of(store, user_id):
+    async def load():
+        return await store.collection.find({"user_id": user_id}).sort([("period", 1), ("_id", 1)]).to_list(None)
+    return asyncio.run(load())
+
+
+def bucket_summary(bucket):
+    return bucket["period"], bucket["count"], bucket["totals"], sorted(t["amount"] for t in bucket["txns"])
+
+
+class StaleFirstRead:
+    """Makes the store's first find_element return what another writer has since changed."""
+
+    def __init__(self, store, **stale):
+        self.real = store.find_element
+        self.stale = stale
+        self.calls = 0
+        store.find_element = self
+
+    async def __call__(self, user_id, txn_id):
+        self.calls += 1
+        found = await self.real(user_id, txn_id)
+        if self.calls == 1:
+            bucket_id, period, stored = found
+            return bucket_id, period, {**stored, **self.stale}
+        return found
+
+
+def test_bucket_update_keeps_totals_and_moves_months(db):
+    store = Buckets(db.buckets, size=2)
+    user = "u"
+    march = [txn(user, amount, datetime(2025, 3, day)) for amount, day in ((10.0, 1), (20.0, 2), (30.0, 3))]
+    income = txn(user, 5.0, datetime(2025, 3, 4), type="income")
+
+    async def run():
+        for t in march:
+            await store.insert_one(t)
+        assert await store.insert_many([income]) == []
+        before = await store.update(user, march[0]["_id"], {"amount": 15.0})
+        assert before["amount"] == 10.0 and before["user_id"] == user
+        before = await store.update(user, march[1]["_id"], {"date": datetime(2025, 4, 9), "type": "income"})
+        assert before["date"] == datetime(2025, 3, 2)
+        assert await store.update(user, ObjectId(), {"amount": 1.0}) is None
+        assert await store.update("someone else", march[2]["_id"], {"amount": 1.0}) is None
+    asyncio.run(run())
+
+    # Size 2: March filled one bucket and spilled into a second; the move left one behind in March
+    assert [bucket_summary(b) for b in buckets_of(store, user)] == [
+        (datetime(2025, 3, 1), 1, {"expense": 15.0}, [15.0]),
+        (datetime(2025, 3, 1), 2, {"expense": 30.0, "income": 5.0}, [5.0, 30.0]),
+        (datetime(2025, 4, 1), 1, {"income": 20.0}, [20.0]),
+    ]
+
+
+def test_bucket_delete_drops_emptied_buckets(db):
+    store = Buckets(db.buckets)
+    only = txn("u", 10.0, datetime(2025, 3, 1))
+
+    async def run():
+        await store.insert_one(only)
+        assert (await store.delete("u", only["_id"]))["amount"] == 10.0
+        assert await store.delete("u", only["_id"]) is None
+    asyncio.run(run())
+    assert buckets_of(store, "u") == []
+
+
+def test_bucket_writes_retry_after_a_concurrent_change(db):
+    store = Buckets(db.buckets)
+    same_month, other_month, deleted = (txn("u", amount, datetime(2025, 3, 1)) for amount in (1.0, 2.0, 3.0))
+
+    async def run():
+        for t in (same_month, other_month, deleted):
+            await store.insert_one(t)
+
+        reads = StaleFirstRead(store, amount=99.0)
+        assert (await store.update("u", same_month["_id"], {"amount": 4.0}))["amount"] == 1.0
+        assert reads.calls == 2
+
+        # The copy pushed into April for the stale read is taken back out before retrying
+        reads = StaleFirstRead(store, amount=99.0)
+        assert (await store.update("u", other_month["_id"], {"date": datetime(2025, 4, 1)}))["amount"] == 2.0
+        assert reads.calls == 2
+
+        reads = StaleFirstRead(store, amount=99.0)
+        assert (await store.delete("u", deleted["_id"]))["amount"] == 3.0
+        assert reads.calls == 2
+    asyncio.run(run())
+
+    assert [bucket_summary(b) for b in buckets_of(store, "u")] == [
+        (datetime(2025, 3, 1), 1, {"expense": 4.0}, [4.0]),
+        (datetime(2025, 4, 1), 1, {"expense": 2.0}, [2.0]),
+    ]
+
+
+def test_migrate_and_check_commands(db, monkeypatch, capsys):
+    monkeypatch.setattr("app.mongo.create_mongo_client", lambda uri: db.client)
+    monkeypatch.setattr(main, "for_reports", lambda collection: collection)
+    monkeypatch.setattr(main, "DB_NAME", db.name)
+    monkeypatch.setattr(storage, "MIGRATE_BATCH_SIZE", 1)
+
+    async def seed():
+        await db[main.COLLECTION_NAME].insert_many(
+            [txn("a", float(day), datetime(2025, 3, day)) for day in range(1, 6)]
+            + [txn("a", 7.0, datetime(2025, 4, 1), type="income"), txn("b", 1.0, datetime(2025, 3, 1))]
+        )
+    asyncio.run(seed())
+
+    assert asyncio.run(storage.run_command(["migrate", "--user", "a"])) == 0
+    assert "Wrote 2 bucket documents" in capsys.readouterr().out
+    assert asyncio.run(storage.run_command(["check", "--user", "a"])) == 0
+    assert "0 inconsistencies" in capsys.readouterr().out
+    # b was left out of the migration
+    assert asyncio.run(storage.run_command(["check"])) == 1
+    assert "1 inconsistencies" in capsys.readouterr().out
+
+    asyncio.run(db[main.BUCKETS_COLLECTION_NAME].update_one({"user_id": "a", "period": datetime(2025, 4, 1)},
+                                                            {"$inc": {"totals.income": 1.0}}))
+    assert asyncio.run(storage.run_command(["check", "--user", "a"])) == 1
+    assert "1 inconsistencies" in capsys.readouterr().out
@@ -0,0 +1,47 @@
+from datetime import datetime
+
+from app import main
+
+
+def test_summary_match_keeps_every_filter():
+    assert main.summary_match("u", 2025, 3) == {"user_id": "u", "year": 2025, "month": 3}
+    assert main.summary_match("u", None, 3) == {"user_id": "u", "month": 3}
+    assert main.summary_match("u") == {"user_id": "u"}
+
+
+def seed_rollups(api, user_id, rows):
+    api.portal.call(main.rollups_collection.insert_many, [
+        {"user_id": user_id, "year": year, "month": month, "type": "expense", "category_id": category,
+         "total": total, "count": 1}
+        for year, month, category, total in rows
+    ])
+
+
+def test_category_summary_month_alone_means_this_year(api, user):
+    user_id, headers = user
+    this_year = datetime.now().year
+    seed_rollups(api, user_id, [
+        (this_year, 3, "a", 10.0),
+        (this_year, 4, "a", 20.0),
+        (this_year - 1, 3, "a", 40.0),
+    ])
+
+    march = api.get("/transactions/summary/categories", params={"month": 3}, headers=headers)
+    assert march.status_code == 200
+    assert [(row["category_id"], row["expense"]) for row in march.json()] == [("a", 10.0)]
+
+    all_time = api.get("/transactions/summary/categories", headers=headers).json()
+    assert [(row["category_id"], row["expense"]) for row in all_time] == [("a", 70.0)]
+
+    # The implied year is part of the ETag, unlike an explicit ?year
+    explicit = api.get("/transactions/summary/categories", params={"month": 3, "year": this_year}, headers=headers)
+    assert march.headers["etag"] != explicit.headers["etag"]
+
+
+def test_summary_years_out_of_range_are_rejected(api, user):
+    _, headers = user
+    for path in ("/transactions/summary", "/transactions/summary/monthly", "/transactions/summary/categories"):
+        for year in (0, -1, 9999):
+            assert api.get(path, params={"year": year}, headers=headers).status_code == 422
+    assert api.get("/transactions/summary/monthly", params={"compare_year": 0}, headers=headers).status_code == 422
+    assert api.get("/transactions/summary", params={"year": 9998}, headers=headers).json()["year"] == 9998
@@ -0,0 +1,86 @@
+def summary(api, headers, year, month=None):
+    params = {"year": year} if month is None else {"year": year, "month": month}
+    body = api.get("/transactions/summary", params=params, headers=headers).json()
+    return body["income"], body["expense"], body["count"]
+
+
+def category_expense(api, headers, year):
+    rows = api.get("/transactions/summary/categories", params={"year": year}, headers=headers).json()
+    return {row["category_id"]: row["expense"] for row in rows}
+
+
+def test_create_update_delete_keep_summaries_current(api, user):
+    user_id, headers = user
+    created = api.post("/transactions", headers=headers, json={
+        "user_id": user_id, "type": "expense", "amount": 40.0, "date": "2025-03-10T12:00:00", "category_id": "food",
+    })
+    assert created.status_code == 200
+    txn_id = created.json()["_id"]
+    api.post("/transactions", headers=headers, json={
+        "user_id": user_id, "type": "income", "amount": 100.0, "date": "2025-03-01T00:00:00",
+    })
+    assert summary(api, headers, 2025, 3) == (100.0, 40.0, 2)
+    assert category_expense(api, headers, 2025) == {"food": 40.0, None: 0}
+
+    # Another amount, month and category: the old rollups lose it, the new ones gain it
+    updated = api.put(f"/transactions/{txn_id}", headers=headers, json={
+        "amount": 25.0, "date": "2025-04-02T00:00:00", "category_id": "rent", "type": None, "note": None,
+    })
+    assert updated.status_code == 200
+    assert summary(api, headers, 2025, 3) == (100.0, 0, 1)
+    assert summary(api, headers, 2025, 4) == (0, 25.0, 1)
+    assert category_expense(api, headers, 2025)["rent"] == 25.0
+    assert category_expense(api, headers, 2025).get("food", 0) == 0
+
+    assert api.delete(f"/transactions/{txn_id}", headers=headers).status_code == 200
+    assert summary(api, headers, 2025) == (100.0, 0, 1)
+    assert api.get("/transactions", headers=headers).json()[0]["amount"] == 100.0
+
+
+def test_summary_etag_changes_after_a_write(api, user):
+    user_id, headers = user
+    before = api.get("/transactions/summary", params={"year": 2025}, headers=headers)
+    api.post("/transactions", headers=headers, json={
+        "user_id": user_id, "type": "expense", "amount": 1.0, "date": "2025-01-01T00:00:00",
+    })
+    after = api.get("/transactions/summary", params={"year": 2025},
+                    headers={**headers, "If-None-Match": before.headers["etag"]})
+    assert after.status_code == 200
+    assert after.json()["count"] == 1
+
+
+def test_other_users_transactions_are_not_found(api, user, other_user):
+    user_id, headers = user
+    _, other_headers = other_user
+    created = api.post("/transactions", headers=headers, json={
+        "user_id": user_id, "type": "expense", "amount": 1.0, "date": "2025-01-01T00:00:00",
+    }).json()
+    update = {"amount": 2.0, "type": None, "date": None, "note": None}
+    assert api.put(f"/transactions/{created['_id']}", headers=other_headers, json=update).status_code == 404
+    assert api.delete(f"/transactions/{created['_id']}", headers=other_headers).status_code == 404
+    assert summary(api, headers, 2025) == (0, 1.0, 1)
+    assert api.post("/transactions", headers=other_headers, json={
+        "user_id": user_id, "type": "expense", "amount": 1.0, "date": "2025-01-01T00:00:00",
+    }).status_code == 403
+
+
+def test_written_dates_come_back_as_listed(api, user):
+    user_id, headers = user
+    created = api.post("/transactions", headers=headers, json={
+        "user_id": user_id, "type": "expense", "amount": 1.0, "date": "2025-01-31T23:00:00-05:00",
+    }).json()
+    assert created["date"] == "2025-02-01T04:00:00"
+    assert api.get("/transactions", headers=headers).json()[0]["date"] == created["date"]
+
+    updated = api.put(f"/transactions/{created['_id']}", headers=headers, json={
+        "date": "2025-03-01T09:00:00+09:00", "amount": None, "type": None, "note": None,
+    }).json()
+    assert updated["date"] == "2025-03-01T00:00:00"
+    assert summary(api, headers, 2025, 3) == (0, 1.0, 1)
+
+
+def test_malformed_ids_are_not_found(api, user):
+    _, headers = user
+    update = {"amount": 2.0, "type": None, "date": None, "note": None}
+    assert api.put("/transactions/not-an-id", headers=headers, json=update).status_code == 404
+    assert api.delete("/transactions/not-an-id", headers=headers).status_code == 404
@@ -0,0 +1,76 @@
+import os
+import time
+from collections import OrderedDict
+
+from jose import jwt
+
+# This module is kept identical in every service; each image only ships its
+# own app/ directory, so copy changes to all three (transaction_service
+# tests/test_shared.py fails while they differ).
+
+TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", "10000"))
+TOKEN_CACHE_TTL = float(os.environ.get("TOKEN_CACHE_TTL", "300"))
+
+
+class TTLCache:
+    """Bounded LRU mapping whose entries also expire after a per-entry TTL."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl: float = None):
+        ttl = self.ttl if ttl is None else ttl
+        self._data[key] = (value, time.monotonic() + ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TokenVerifier:
+    """
+    Verifies JWTs and remembers the decoded payload per token, so repeat
+    requests with the same bearer token skip the signature check. Entries
+    never outlive the token's own `exp` claim.
+    """
+
+    def __init__(self, secret_key: str, algorithm: str,
+                 cache_size: int = TOKEN_CACHE_SIZE, ttl: float = TOKEN_CACHE_TTL):
+        self.secret_key = secret_key
+        self.algorithm = algorithm
+        self.cache = TTLCache(cache_size, ttl)
+
+    def decode(self, token: str) -> dict:
+        """Return the token payload; raises jose.JWTError if it is invalid."""
+        payload = self.cache.get(token)
+        if payload is not None:
+            return payload
+
+        payload = jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
+        ttl = self.cache.ttl
+        if "exp" in payload:
+            ttl = min(ttl, payload["exp"] - time.time())
+        if ttl > 0:
+            self.cache.set(token, payload, ttl)
+        return payload
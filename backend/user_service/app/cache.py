@@ -0,0 +1,85 @@
+import logging
+import os
+
+import orjson
+import redis.asyncio as redis
+from prometheus_client import Counter
+from redis.exceptions import RedisError
+
+# This module is kept identical in every service; each image only ships its
+# own app/ directory, so copy changes to all three (transaction_service
+# tests/test_shared.py fails while they differ).
+#
+# Optional cache shared by every replica and worker, in Redis or anything that
+# speaks its protocol. Leave REDIS_URL empty to turn it off. Each user gets
+# one hash per namespace, so dropping everything cached for a user after a
+# write is a single DEL. Redis being down only costs cache misses.
+
+REDIS_URL = os.environ.get("REDIS_URL", "")
+CACHE_TTL = int(os.environ.get("CACHE_TTL", "300"))
+CACHE_TIMEOUT = float(os.environ.get("CACHE_TIMEOUT", "0.2"))
+
+CACHE_REQUESTS = Counter(
+    "shared_cache_requests_total",
+    "Shared cache lookups by namespace and result (hit, miss, error)",
+    ["namespace", "result"],
+)
+
+logger = logging.getLogger(__name__)
+
+
+class SharedCache:
+    """Per-user JSON values in one Redis hash per (namespace, user); a no-op without a client."""
+
+    def __init__(self, client, namespace: str, ttl: int = CACHE_TTL):
+        self.client = client
+        self.namespace = namespace
+        self.ttl = ttl
+
+    def key(self, user_id: str) -> str:
+        return f"cache:{self.namespace}:{user_id}"
+
+    async def get(self, user_id: str, field: str):
+        if self.client is None:
+            return None
+        try:
+            raw = await self.client.hget(self.key(user_id), field)
+        except RedisError as e:
+            logger.warning("Shared cache read failed: %s", e)
+            CACHE_REQUESTS.labels(self.namespace, "error").inc()
+            return None
+        CACHE_REQUESTS.labels(self.namespace, "miss" if raw is None else "hit").inc()
+        return None if raw is None else orjson.loads(raw)
+
+    async def set(self, user_id: str, field: str, value):
+        if self.client is None:
+            return
+        key = self.key(user_id)
+        try:
+            async with self.client.pipeline(transaction=False) as pipe:
+                pipe.hset(key, field, orjson.dumps(value))
+                pipe.expire(key, self.ttl)
+                await pipe.execute()
+        except RedisError as e:
+            logger.warning("Shared cache write failed: %s", e)
+
+    async def invalidate(self, user_id: str):
+        """Call after the write itself, so a refill can't pick up the old data."""
+        if self.client is None:
+            return
+        try:
+            await self.client.delete(self.key(user_id))
+        except RedisError as e:
+            # Entries expire after CACHE_TTL at the latest
+            logger.warning("Shared cache invalidation failed: %s", e)
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+
+
+def create_shared_cache(namespace: str) -> SharedCache:
+    client = None
+    if REDIS_URL:
+        client = redis.from_url(REDIS_URL, socket_timeout=CACHE_TIMEOUT, socket_connect_timeout=CACHE_TIMEOUT)
+    return SharedCache(client, namespace)
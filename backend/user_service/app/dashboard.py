@@ -0,0 +1,135 @@
+import asyncio
+import os
+import time
+
+import httpx
+from prometheus_client import Histogram
+
+# --------------------------------
+# Dashboard bootstrap
+# --------------------------------
+# GET /users/me/dashboard answers the Dashboard's first render in one round
+# trip. The profile comes from this service; categories and this month's
+# transactions come from category_service and transaction_service, all
+# requested at once over one pooled client with the caller's own token.
+# /transactions is paged: its X-Next-Cursor is followed for up to
+# DASHBOARD_MAX_PAGES pages, and a month longer than that stops there with
+# the cursor for the rest under `next_cursor`. A section that fails or takes
+# longer than DASHBOARD_TIMEOUT comes back as null with the reason under
+# `errors`, so the page renders the rest and fetches that part itself.
+# `versions` passes on the X-Data-Version each list was read at, so the page
+# knows which of the change streams' events it already holds.
+
+TRANSACTION_SERVICE_URL = os.environ.get("TRANSACTION_SERVICE_URL", "http://transaction_service:8000")
+CATEGORY_SERVICE_URL = os.environ.get("CATEGORY_SERVICE_URL", "http://category_service:8000")
+# Whole time allowed for each upstream call, connecting included
+DASHBOARD_TIMEOUT = float(os.environ.get("DASHBOARD_TIMEOUT", "2"))
+DASHBOARD_CONNECT_TIMEOUT = float(os.environ.get("DASHBOARD_CONNECT_TIMEOUT", "0.5"))
+# Per worker process, across both upstreams
+DASHBOARD_MAX_CONNECTIONS = int(os.environ.get("DASHBOARD_MAX_CONNECTIONS", "100"))
+DASHBOARD_MAX_KEEPALIVE = int(os.environ.get("DASHBOARD_MAX_KEEPALIVE", "20"))
+# transaction_service's MAX_PAGE_SIZE
+DASHBOARD_PAGE_SIZE = int(os.environ.get("DASHBOARD_PAGE_SIZE", "500"))
+DASHBOARD_MAX_PAGES = int(os.environ.get("DASHBOARD_MAX_PAGES", "10"))
+VERSION_HEADER = "X-Data-Version"
+CURSOR_HEADER = "X-Next-Cursor"
+
+UPSTREAM_LATENCY = Histogram(
+    "dashboard_upstream_duration_seconds",
+    "Calls made for the dashboard bootstrap, by section and outcome",
+    ["section", "outcome"],
+)
+
+
+def create_upstream_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(DASHBOARD_TIMEOUT, connect=DASHBOARD_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=DASHBOARD_MAX_CONNECTIONS,
+            max_keepalive_connections=DASHBOARD_MAX_KEEPALIVE,
+        ),
+    )
+
+
+class UpstreamStatus(Exception):
+    pass
+
+
+async def get_pages(http: httpx.AsyncClient, url: str, token: str, params: dict, max_pages: int):
+    """(body, first response, next cursor); a list body is followed through X-Next-Cursor for up to max_pages pages."""
+    headers = {"Authorization": f"Bearer {token}"}
+    first = response = await http.get(url, params=params, headers=headers)
+    if response.status_code != 200:
+        raise UpstreamStatus(response.status_code)
+    body = response.json()
+    cursor = response.headers.get(CURSOR_HEADER)
+    pages = 1
+    while cursor and pages < max_pages:
+        response = await http.get(url, params={**params, "after": cursor}, headers=headers)
+        if response.status_code != 200:
+            raise UpstreamStatus(response.status_code)
+        body.extend(response.json())
+        cursor = response.headers.get(CURSOR_HEADER)
+        pages += 1
+    return body, first, cursor
+
+
+async def fetch_section(http: httpx.AsyncClient, section: str, url: str, token: str, params: dict = None,
+                        versions: dict = None, cursors: dict = None, max_pages: int = 1):
+    """
+    GET one section; returns (body, None), or (None, why it's missing).
+    Records the version it was read at in `versions`, and the cursor for what
+    max_pages pages didn't cover in `cursors`.
+    """
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        # httpx's timeout applies per read; this bounds the section as a whole
+        body, response, cursor = await asyncio.wait_for(
+            get_pages(http, url, token, params or {}, max_pages), DASHBOARD_TIMEOUT
+        )
+        # The first page's version: later pages may hold newer writes, never older ones
+        if versions is not None and response.headers.get(VERSION_HEADER, "").isdigit():
+            versions[section] = int(response.headers[VERSION_HEADER])
+        if cursors is not None and cursor:
+            cursors[section] = cursor
+        outcome = "ok"
+        return body, None
+    except UpstreamStatus as e:
+        return None, f"upstream answered {e}"
+    except (asyncio.TimeoutError, httpx.TimeoutException):
+        outcome = "timeout"
+        return None, "upstream timed out"
+    except httpx.HTTPError:
+        return None, "upstream unavailable"
+    except ValueError:
+        # e.g. a proxy's HTML error page sent with 200
+        return None, "upstream sent invalid JSON"
+    finally:
+        UPSTREAM_LATENCY.labels(section, outcome).observe(time.perf_counter() - start)
+
+
+async def load_sections(http: httpx.AsyncClient, token: str, year: int, month: int) -> dict:
+    # section -> (url, params, pages)
+    sections = {
+        "categories": (f"{CATEGORY_SERVICE_URL}/categories", None, 1),
+        "transactions": (
+            f"{TRANSACTION_SERVICE_URL}/transactions",
+            {"year": year, "month": month, "limit": DASHBOARD_PAGE_SIZE},
+            DASHBOARD_MAX_PAGES,
+        ),
+    }
+    versions, cursors = {}, {}
+    results = await asyncio.gather(*(
+        fetch_section(http, section, url, token, params, versions, cursors, pages)
+        for section, (url, params, pages) in sections.items()
+    ))
+    payload, errors = {}, {}
+    for section, (body, error) in zip(sections, results):
+        payload[section] = body
+        if error:
+            errors[section] = error
+    payload["errors"] = errors
+    payload["versions"] = versions
+    payload["next_cursor"] = cursors.get("transactions")
+    return payload
@@ -0,0 +1,13 @@
+from passlib.context import CryptContext
+
+# Kept in its own small module so worker processes can import it without
+# pulling in the FastAPI app, the Mongo client or the required env vars.
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+def verify_password(plain_password, hashed_password):
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def get_password_hash(password):
+    return pwd_context.hash(password)
@@ -1,15 +1,26 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Query
 from pydantic import BaseModel, EmailStr, validator
-from typing import Optional
-from passlib.context import CryptContext
+from typing import Optional, List
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from fastapi.security import OAuth2PasswordBearer
 from bson import ObjectId
-import motor.motor_asyncio
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import DuplicateKeyError
 import os
+import asyncio
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from dotenv import load_dotenv
 from fastapi.middleware.cors import CORSMiddleware
+from app import hashing
+from app.auth import TTLCache, TokenVerifier
+from app.cache import SharedCache, create_shared_cache
+from app.dashboard import create_upstream_client, load_sections
+from app.metrics import event_loop_monitor, instrument
+from app.mongo import create_mongo_client, warm_up_pool
+from prometheus_client import Gauge, Histogram
+import time
 # -------------------------------
 # CONFIG
 # -------------------------------
@@ -24,11 +35,30 @@ except KeyError:
 
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# Short-lived in-process cache of user documents for the auth dependency,
+# in front of the shared cache (see app/cache.py) when REDIS_URL is set
+USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(os.environ.get("USER_CACHE_TTL", "30"))
+
+# Run explain() on the hot queries at startup and refuse to start on a COLLSCAN
+CHECK_QUERY_PLANS = os.environ.get("CHECK_QUERY_PLANS", "false").lower() == "true"
+
+# Password hashing pool: bcrypt is CPU bound, so it runs off the event loop.
+# HASH_EXECUTOR is "thread" (bcrypt releases the GIL) or "process".
+HASH_EXECUTOR = os.environ.get("HASH_EXECUTOR", "thread")
+HASH_WORKERS = int(os.environ.get("HASH_WORKERS", os.cpu_count() or 1))
+# How many hash jobs may wait for a free worker before we answer 503
+HASH_MAX_PENDING = int(os.environ.get("HASH_MAX_PENDING", HASH_WORKERS * 4))
+
+if HASH_EXECUTOR == "process":
+    hash_pool = ProcessPoolExecutor(max_workers=HASH_WORKERS)
+else:
+    hash_pool = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="bcrypt")
+hash_jobs_in_flight = 0
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="users/login")
-
-app = FastAPI(title="User Service")
+token_verifier = TokenVerifier(SECRET_KEY, ALGORITHM)
+user_cache = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
 
 # MongoDB Client (Read from environment variable)
 try:
@@ -38,9 +68,44 @@ except KeyError:
     # which is a good practice for required configurations.
     raise RuntimeError("MONGO_URI environment variable not set. Application cannot start.")
 
-client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_URI)
-db = client["users_service"]   # database
-users_collection = db["users_db"]  # collection
+# Created in the lifespan, so every worker process opens its own pools
+client = None
+db = None
+users_collection = None
+upstream_http = None
+# Replaced in the lifespan; a no-op until then (and when REDIS_URL isn't set)
+profile_cache = SharedCache(None, "users")
+
+def bind_database(mongo_client):
+    global client, db, users_collection
+    client = mongo_client
+    db = client["users_service"]   # database
+    users_collection = db["users_db"]  # collection
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global profile_cache, upstream_http
+    bind_database(create_mongo_client(MONGO_URI))
+    profile_cache = create_shared_cache("users")
+    upstream_http = create_upstream_client()
+    # Everything below finishes before the server accepts its first request
+    await warm_up_pool(client)
+    await ensure_indexes()
+    if CHECK_QUERY_PLANS:
+        await verify_query_plans()
+    async with event_loop_monitor():
+        yield
+    hash_pool.shutdown(wait=False, cancel_futures=True)
+    await upstream_http.aclose()
+    await profile_cache.close()
+    client.close()
+
+app = FastAPI(title="User Service", lifespan=lifespan)
+
+# Indexes: login and registration look users up by email
+USER_INDEXES = [
+    IndexModel([("email", ASCENDING)], name="email", unique=True),
+]
 
 # CORS Middleware
 origins = [
@@ -56,6 +121,18 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+instrument(app)
+
+PASSWORD_HASH_DURATION = Histogram(
+    "password_hash_duration_seconds",
+    "Time spent hashing or verifying a password, including the wait for a pool worker",
+    ["operation"],
+)
+PASSWORD_HASH_JOBS = Gauge(
+    "password_hash_jobs_in_flight",
+    "Password hash jobs running or queued",
+    multiprocess_mode="livesum",
+)
 
 # -------------------------------
 # MODELS
@@ -103,14 +180,45 @@ class Token(BaseModel):
     access_token: str
     token_type: str
 
+class Dashboard(BaseModel):
+    profile: UserProfile
+    # Passed through as the other services return them; null when that call failed
+    categories: Optional[List[dict]] = None
+    transactions: Optional[List[dict]] = None
+    # Set when the month has more transactions than the bootstrap reads; `after` for /transactions
+    next_cursor: Optional[str] = None
+    # Section -> why it's missing
+    errors: dict = {}
+    # Section -> the X-Data-Version it was read at
+    versions: dict = {}
+
 # -------------------------------
 # UTILS
 # -------------------------------
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+async def run_in_hash_pool(func, *args):
+    global hash_jobs_in_flight
+    if hash_jobs_in_flight >= HASH_WORKERS + HASH_MAX_PENDING:
+        raise HTTPException(
+            status_code=503,
+            detail="Server is busy, please try again",
+            headers={"Retry-After": "1"},
+        )
+    hash_jobs_in_flight += 1
+    PASSWORD_HASH_JOBS.inc()
+    start = time.perf_counter()
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(hash_pool, func, *args)
+    finally:
+        hash_jobs_in_flight -= 1
+        PASSWORD_HASH_JOBS.dec()
+        PASSWORD_HASH_DURATION.labels(func.__name__).observe(time.perf_counter() - start)
+
+async def verify_password(plain_password, hashed_password):
+    return await run_in_hash_pool(hashing.verify_password, plain_password, hashed_password)
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+async def get_password_hash(password):
+    return await run_in_hash_pool(hashing.get_password_hash, password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -124,20 +232,80 @@ async def get_user_by_email(email: str):
 async def get_user_by_id(user_id: str):
     return await users_collection.find_one({"_id": ObjectId(user_id)})
 
+def cacheable_user(user: dict) -> dict:
+    # Password hashes never go into a cache, least of all a shared one
+    return {"_id": str(user["_id"]), "name": user["name"], "email": user["email"]}
+
+async def get_cached_user(user_id: str):
+    """
+    get_user_by_id behind user_cache and profile_cache, without password_hash;
+    call invalidate_user after writes.
+    """
+    user = user_cache.get(user_id)
+    if user is None:
+        user = await profile_cache.get(user_id, "profile")
+        if user is None:
+            db_user = await get_user_by_id(user_id)
+            if db_user is None:
+                return None
+            user = cacheable_user(db_user)
+            await profile_cache.set(user_id, "profile", user)
+        user_cache.set(user_id, user)
+    return user
+
+async def invalidate_user(user_id: str):
+    """Call after the write; other pods' user_cache still expires within USER_CACHE_TTL."""
+    user_cache.pop(user_id)
+    await profile_cache.invalidate(user_id)
+
 async def get_current_user(token: str = Depends(oauth2_scheme)):
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = token_verifier.decode(token)
         user_id: str = payload.get("sub")
         if user_id is None:
             raise HTTPException(status_code=401, detail="Invalid authentication")
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-    user = await get_user_by_id(user_id)
+    user = await get_cached_user(user_id)
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
+# -------------------------------
+# INDEXES
+# -------------------------------
+def hot_queries():
+    return {
+        "get_user_by_email": users_collection.find({"email": "query-plan-check@example.com"}),
+    }
+
+async def ensure_indexes():
+    await users_collection.create_indexes(USER_INDEXES)
+
+def plan_stages(plan) -> set:
+    """Collect every `stage` name found anywhere in an explain() plan tree."""
+    stages = set()
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.add(plan["stage"])
+        for value in plan.values():
+            stages |= plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            stages |= plan_stages(item)
+    return stages
+
+async def verify_query_plans():
+    """Fail loudly if any hot query would fall back to a collection scan."""
+    collection_scans = []
+    for name, cursor in hot_queries().items():
+        explain = await cursor.explain()
+        if "COLLSCAN" in plan_stages(explain["queryPlanner"]["winningPlan"]):
+            collection_scans.append(name)
+    if collection_scans:
+        raise RuntimeError(f"Queries not served by an index: {', '.join(collection_scans)}")
+
 # -------------------------------
 # ROUTES
 # -------------------------------
@@ -149,20 +317,23 @@ async def register(user: UserRegister):
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
 
-    hashed_pw = get_password_hash(user.password)
+    hashed_pw = await get_password_hash(user.password)
     user_doc = {
         "name": user.name,
         "email": user.email,
         "password_hash": hashed_pw
     }
-    result = await users_collection.insert_one(user_doc)
+    try:
+        result = await users_collection.insert_one(user_doc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Email already registered")
     return UserProfile(id=str(result.inserted_id), name=user.name, email=user.email)
 
 # Login
 @app.post("/users/login", response_model=Token)
 async def login(user: UserLogin):
     db_user = await get_user_by_email(user.email)
-    if not db_user or not verify_password(user.password, db_user["password_hash"]):
+    if not db_user or not await verify_password(user.password, db_user["password_hash"]):
         raise HTTPException(status_code=401, detail="Invalid email or password")
 
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -171,6 +342,19 @@ async def login(user: UserLogin):
     )
     return Token(access_token=access_token, token_type="bearer")
 
+# Dashboard bootstrap: profile, categories and this month's transactions in one call
+@app.get("/users/me/dashboard", response_model=Dashboard)
+async def dashboard(
+    year: Optional[int] = Query(None, ge=1, le=9998),
+    month: Optional[int] = Query(None, ge=1, le=12),
+    token: str = Depends(oauth2_scheme),
+    current_user: dict = Depends(get_current_user),
+):
+    now = datetime.now()
+    sections = await load_sections(upstream_http, token, year or now.year, month or now.month)
+    profile = UserProfile(id=str(current_user["_id"]), name=current_user["name"], email=current_user["email"])
+    return Dashboard(profile=profile, **sections)
+
 # Profile
 @app.get("/users/{user_id}", response_model=UserProfile)
 async def profile(user_id: str, current_user: dict = Depends(get_current_user)):
@@ -192,6 +376,7 @@ async def update_user_name(update_data: UserUpdateName, current_user: dict = Dep
         {"_id": ObjectId(user_id)},
         {"$set": {"name": update_data.name}}
     )
+    await invalidate_user(user_id)
     
     updated_user = await get_user_by_id(user_id)
     return UserProfile(
@@ -203,15 +388,17 @@ async def update_user_name(update_data: UserUpdateName, current_user: dict = Dep
 # Update user password
 @app.put("/users/me/password")
 async def update_user_password(update_data: UserUpdatePassword, current_user: dict = Depends(get_current_user)):
-    # Verify old password
-    if not verify_password(update_data.old_password, current_user["password_hash"]):
+    # Verify old password; cached users don't carry the hash
+    db_user = await get_user_by_id(current_user["_id"])
+    if not await verify_password(update_data.old_password, db_user["password_hash"]):
         raise HTTPException(status_code=400, detail="รหัสผ่านเดิมไม่ถูกต้อง")
 
     # Hash and update new password
-    new_hashed_password = get_password_hash(update_data.new_password)
+    new_hashed_password = await get_password_hash(update_data.new_password)
     await users_collection.update_one(
         {"_id": ObjectId(current_user["_id"])},
         {"$set": {"password_hash": new_hashed_password}}
     )
+    await invalidate_user(current_user["_id"])
 
     return {"message": "อัปเดตรหัสผ่านสำเร็จ"}
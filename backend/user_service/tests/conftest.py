@@ -0,0 +1,9 @@
+import os
+import sys
+
+# Run from backend/user_service: `app` imports the way it does in the image
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# app.main reads its configuration at import
+os.environ.setdefault("MONGO_URI", "mongodb://127.0.0.1:27017")
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
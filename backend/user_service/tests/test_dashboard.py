@@ -0,0 +1,115 @@
+import asyncio
+
+import httpx
+
+from app import dashboard
+
+
+def fetch(handler):
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as http:
+            return await dashboard.fetch_section(http, "summary", "http://upstream/summary", "token")
+
+    return asyncio.run(run())
+
+
+def test_fetch_section_returns_the_body():
+    assert fetch(lambda request: httpx.Response(200, json={"count": 1})) == ({"count": 1}, None)
+
+
+def test_fetch_section_reports_upstream_status():
+    assert fetch(lambda request: httpx.Response(503)) == (None, "upstream answered 503")
+
+
+def test_fetch_section_survives_a_non_json_200():
+    page = httpx.Response(200, text="<html>Bad gateway</html>", headers={"Content-Type": "text/html"})
+    assert fetch(lambda request: page) == (None, "upstream sent invalid JSON")
+
+
+def test_fetch_section_survives_connection_errors():
+    def refuse(request):
+        raise httpx.ConnectError("refused", request=request)
+
+    assert fetch(refuse) == (None, "upstream unavailable")
+
+
+def test_fetch_section_records_the_data_version():
+    versions = {}
+
+    async def run(response):
+        async with httpx.AsyncClient(transport=httpx.MockTransport(lambda request: response)) as http:
+            return await dashboard.fetch_section(http, "categories", "http://upstream/c", "token", versions=versions)
+
+    assert asyncio.run(run(httpx.Response(200, json=[], headers={"X-Data-Version": "7"}))) == ([], None)
+    assert versions == {"categories": 7}
+    # Nothing to record without the header, or without the data
+    asyncio.run(run(httpx.Response(200, json=[])))
+    asyncio.run(run(httpx.Response(503, headers={"X-Data-Version": "9"})))
+    assert versions == {"categories": 7}
+
+
+def paged_upstream(rows: int, page_size: int):
+    """category_service and a transaction_service holding `rows` transactions this month, `page_size` a page."""
+    transactions = [{"_id": str(i), "amount": 1.0} for i in range(rows)]
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        if request.url.path == "/categories":
+            return httpx.Response(200, json=[{"id": "c", "name": "food"}], headers={"X-Data-Version": "3"})
+        start = int(request.url.params.get("after", 0))
+        limit = min(int(request.url.params["limit"]), page_size)
+        headers = {"X-Data-Version": "5"}
+        if start + limit < rows:
+            headers["X-Next-Cursor"] = str(start + limit)
+        return httpx.Response(200, json=transactions[start:start + limit], headers=headers)
+
+    return handler, requests
+
+
+def load(handler):
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as http:
+            return await dashboard.load_sections(http, "token", 2025, 3)
+
+    return asyncio.run(run())
+
+
+def test_load_sections_follows_the_transaction_cursor(monkeypatch):
+    monkeypatch.setattr(dashboard, "DASHBOARD_PAGE_SIZE", 100)
+    handler, requests = paged_upstream(rows=250, page_size=100)
+    sections = load(handler)
+
+    assert [t["_id"] for t in sections["transactions"]] == [str(i) for i in range(250)]
+    assert sections["next_cursor"] is None
+    assert sections["categories"] == [{"id": "c", "name": "food"}]
+    assert sections["versions"] == {"categories": 3, "transactions": 5}
+    assert sections["errors"] == {}
+    pages = [r.url.params for r in requests if r.url.path == "/transactions"]
+    assert [p.get("after") for p in pages] == [None, "100", "200"]
+    assert all((p["year"], p["month"], p["limit"]) == ("2025", "3", "100") for p in pages)
+
+
+def test_load_sections_stops_after_the_page_limit(monkeypatch):
+    monkeypatch.setattr(dashboard, "DASHBOARD_PAGE_SIZE", 100)
+    monkeypatch.setattr(dashboard, "DASHBOARD_MAX_PAGES", 2)
+    handler, _ = paged_upstream(rows=250, page_size=100)
+    sections = load(handler)
+
+    assert len(sections["transactions"]) == 200
+    assert sections["next_cursor"] == "200"
+    assert "summary" not in sections
+
+
+def test_load_sections_reports_a_failed_later_page():
+    handler, _ = paged_upstream(rows=150, page_size=100)
+
+    def failing(request):
+        if request.url.params.get("after"):
+            return httpx.Response(500)
+        return handler(request)
+
+    sections = load(failing)
+    assert sections["transactions"] is None
+    assert sections["errors"] == {"transactions": "upstream answered 500"}
+    assert sections["next_cursor"] is None
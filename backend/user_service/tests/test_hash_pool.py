@@ -0,0 +1,45 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi import HTTPException
+
+from app import main
+
+
+def wait_for(event):
+    event.wait(5)
+    return "hashed"
+
+
+def test_hash_jobs_beyond_the_queue_get_503(monkeypatch):
+    pool = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(main, "hash_pool", pool)
+    monkeypatch.setattr(main, "HASH_WORKERS", 1)
+    monkeypatch.setattr(main, "HASH_MAX_PENDING", 1)
+    release = threading.Event()
+
+    async def run():
+        # One job on the worker and one waiting for it fill the pool
+        running = [asyncio.ensure_future(main.run_in_hash_pool(wait_for, release)) for _ in range(2)]
+        await asyncio.sleep(0)
+        assert main.hash_jobs_in_flight == 2
+
+        with pytest.raises(HTTPException) as busy:
+            await main.run_in_hash_pool(wait_for, release)
+        assert busy.value.status_code == 503
+        assert busy.value.headers == {"Retry-After": "1"}
+        assert main.hash_jobs_in_flight == 2
+
+        release.set()
+        assert await asyncio.gather(*running) == ["hashed", "hashed"]
+        assert main.hash_jobs_in_flight == 0
+        # Room again once they finish
+        assert await main.run_in_hash_pool(wait_for, release) == "hashed"
+
+    try:
+        asyncio.run(run())
+    finally:
+        release.set()
+        pool.shutdown()
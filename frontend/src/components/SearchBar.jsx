@@ -2,29 +2,29 @@
 import React, { useState } from 'react';
 import './SearchBar.css'; // สร้างไฟล์ CSS แยกสำหรับ Component นี้
 
+// ส่งคำค้นให้ server ค้นใน note (พารามิเตอร์ q ของ /transactions) แทนการกรองใน browser
 const SearchBar = ({ onSearch, isLoading }) => {
-    const [userId, setUserId] = useState('');
+    const [query, setQuery] = useState('');
 
     const handleSubmit = (e) => {
         e.preventDefault(); // ป้องกันการ refresh หน้าเมื่อกด Enter
-        if (userId) {
-            onSearch(userId);
-        }
+        onSearch(query.trim()); // คำค้นว่างคือยกเลิกการค้นหา
     };
 
     return (
         <form onSubmit={handleSubmit} className="search-box">
-            <label htmlFor="userIdInput">กรุณาใส่ User ID:</label>
+            <label htmlFor="noteSearchInput">ค้นหาในบันทึก:</label>
             <input
-                id="userIdInput"
-                type="text"
-                value={userId}
-                onChange={(e) => setUserId(e.target.value)}
-                placeholder="เช่น 1, 2, 3..."
+                id="noteSearchInput"
+                type="search"
+                value={query}
+                onChange={(e) => setQuery(e.target.value)}
+                placeholder="เช่น ค่าอาหาร, taxi..."
+                maxLength={200}
                 disabled={isLoading}
             />
             <button type="submit" disabled={isLoading}>
-                {isLoading ? 'กำลังโหลด...' : 'ดึงข้อมูล'}
+                {isLoading ? 'กำลังโหลด...' : 'ค้นหา'}
             </button>
         </form>
     );
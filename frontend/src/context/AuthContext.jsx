@@ -67,7 +67,8 @@ export const AuthProvider = ({ children }) => {
         setUser(null);
     };
 
-    const value = { token, user, login, register, logout, fetchCurrentUser };
+    // setUser lets a page that already received the profile (e.g. the Dashboard bootstrap) skip fetching it
+    const value = { token, user, setUser, login, register, logout, fetchCurrentUser };
 
     return <AuthContext.Provider value={value}>{children}</AuthContext.Provider>;
 };
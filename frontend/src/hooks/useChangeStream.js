@@ -0,0 +1,109 @@
+import { useCallback, useEffect, useRef } from 'react';
+
+// Follows a per-user change stream such as /transactions/changes (Server-Sent Events).
+// Read with fetch rather than EventSource, which can't send the Authorization header.
+// Calls onChange({ op: 'upsert', doc } | { op: 'delete', id }) for each write, and
+// onRefetch() whenever the list held may have missed one: on connecting with a
+// version other than the last one seen, on a gap in the versions, or on `reset`.
+// Returns loaded(version): call it with the X-Data-Version of every full fetch
+// (null if the response had none), so the first connection only refetches when
+// the list is older than the stream.
+const useChangeStream = (url, token, { onChange, onRefetch }) => {
+    // Always call the latest callbacks, so they can read current state
+    const handlers = useRef({ onChange, onRefetch });
+    handlers.current = { onChange, onRefetch };
+    // Version of the list held: undefined until a fetch finishes, null if it's unknown
+    const loadedVersion = useRef(undefined);
+    // Last version seen on the stream, null until it connects
+    const streamVersion = useRef(null);
+
+    useEffect(() => {
+        if (!token) return undefined;
+        const controller = new AbortController();
+        let lastVersion = null;
+        let retryMs = 3000;
+
+        const handleEvent = (event, data) => {
+            if (event === 'ready') {
+                if (lastVersion === null) {
+                    lastVersion = data.version;
+                    // Still loading: loaded() compares once the list arrives
+                    const held = loadedVersion.current;
+                    if (held !== undefined && (held === null || held < data.version)) handlers.current.onRefetch();
+                } else if (data.version !== lastVersion) {
+                    lastVersion = data.version;
+                    handlers.current.onRefetch();
+                }
+                streamVersion.current = lastVersion;
+                return;
+            }
+            if (lastVersion !== null && data.version <= lastVersion) return; // already seen
+            const missedSome = lastVersion === null || data.version !== lastVersion + 1;
+            lastVersion = data.version;
+            streamVersion.current = lastVersion;
+            if (event === 'reset' || missedSome) {
+                handlers.current.onRefetch();
+            } else {
+                handlers.current.onChange(data);
+            }
+        };
+
+        const follow = async () => {
+            const response = await fetch(url, {
+                headers: { 'Authorization': `Bearer ${token}`, 'Accept': 'text/event-stream' },
+                signal: controller.signal,
+            });
+            if (!response.ok) throw new Error(`change stream failed (status: ${response.status})`);
+            const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+            let buffer = '';
+            for (;;) {
+                const { value, done } = await reader.read();
+                if (done) return;
+                buffer += value;
+                let end;
+                while ((end = buffer.indexOf('\n\n')) >= 0) {
+                    const block = buffer.slice(0, end);
+                    buffer = buffer.slice(end + 2);
+                    let event = 'message';
+                    let data = '';
+                    for (const line of block.split('\n')) {
+                        if (line.startsWith('event: ')) event = line.slice(7);
+                        else if (line.startsWith('data: ')) data += line.slice(6);
+                        else if (line.startsWith('retry: ')) retryMs = Number(line.slice(7));
+                    }
+                    // Lines starting with ':' are keep-alives and carry no data
+                    if (data) handleEvent(event, JSON.parse(data));
+                }
+            }
+        };
+
+        const run = async () => {
+            while (!controller.signal.aborted) {
+                try {
+                    await follow();
+                } catch (err) {
+                    if (controller.signal.aborted) return;
+                    console.error('Change stream:', err.message);
+                }
+                // The server ends streams now and then; reconnect and compare versions
+                await new Promise(resolve => setTimeout(resolve, retryMs));
+            }
+        };
+        run();
+        return () => {
+            controller.abort();
+            streamVersion.current = null;
+        };
+    }, [url, token]);
+
+    return useCallback((version) => {
+        loadedVersion.current = version;
+        // The stream got ahead of this fetch, and its events went to the list this one replaced.
+        // An unknown version is only refetched on connecting, or every refetch would start another
+        if (streamVersion.current !== null && version !== null && version < streamVersion.current) {
+            handlers.current.onRefetch();
+        }
+    }, []);
+};
+
+export default useChangeStream;
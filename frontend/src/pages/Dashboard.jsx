@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useAuth } from '../context/AuthContext';
 import { useNavigate } from 'react-router-dom';
 import UserInfo from '../components/UserInfo';
@@ -6,13 +6,21 @@ import TransactionList from '../components/TransactionList';
 import TransactionForm from '../components/TransactionForm';
 import Summary from '../components/Summary'; // Import a new component for the summary
 import Pagination from '../components/Pagination'; // Import the new Pagination component
+import SearchBar from '../components/SearchBar';
+import useChangeStream from '../hooks/useChangeStream';
 
 // --- การตั้งค่าที่ต้องแก้ไข ---
 const API_GATEWAY_URL = 'http://localhost:80'; // URL ของ API Gateway
 const ITEMS_PER_PAGE = 10; // จำนวนรายการต่อหน้า
 
+// The version the listing was read at, for lining it up with the change stream
+const dataVersion = (response) => {
+    const version = response.headers.get('X-Data-Version');
+    return version === null ? null : Number(version);
+};
+
 const Dashboard = () => {
-    const { user, token, logout, fetchCurrentUser } = useAuth();
+    const { user, setUser, token, logout, fetchCurrentUser } = useAuth();
     const navigate = useNavigate();
     const [transactions, setTransactions] = useState([]);
     const [isTransactionsLoading, setIsTransactionsLoading] = useState(true);
@@ -22,25 +30,110 @@ const Dashboard = () => {
     const [categories, setCategories] = useState({ list: [], map: {} }); // Initialize as an object
     const [editingTransaction, setEditingTransaction] = useState(null); // To hold data for editing
     const [categoryFilter, setCategoryFilter] = useState(''); // State for category filter, '' means all
+    const [searchTerm, setSearchTerm] = useState(''); // Words to find in the note, searched by the server
     const [currentPage, setCurrentPage] = useState(1); // State for pagination
+    // True while the list holds only this month's transactions from the bootstrap
+    const [isMonthPreview, setIsMonthPreview] = useState(false);
+    const hasFullList = useRef(false);
+
+    useEffect(() => {
+        // Profile, categories and this month's transactions in one round trip, without waiting for the profile first
+        if (token) {
+            fetchBootstrap();
+        }
+    }, [token]);
 
-     useEffect(() => {
-        // This logic has been moved to App.jsx to handle it globally.
-
-        // If there's a user, fetch their transactions
-        if (user) {
-            // Pass the token to fetch functions for consistency
+    useEffect(() => {
+        // The category filter and the search are applied by the server, so refetch when they change
+        if (token) {
             fetchTransactions();
+        }
+    }, [token, categoryFilter, searchTerm]);
+
+    const fetchBootstrap = async () => {
+        try {
+            const response = await fetch(`${API_GATEWAY_URL}/users/me/dashboard`, {
+                headers: { 'Authorization': `Bearer ${token}` },
+            });
+            if (!response.ok) {
+                throw new Error(`ไม่สามารถดึงข้อมูลหน้าแรกได้ (สถานะ: ${response.status})`);
+            }
+            const data = await response.json();
+            setUser(current => current || data.profile);
+            // A section that failed upstream comes back as null; fetch that one directly
+            if (data.categories) {
+                setCategoriesFromList(data.categories);
+                categoriesLoaded(data.versions?.categories ?? null);
+                setIsCategoriesLoading(false);
+            } else {
+                fetchCategories();
+            }
+            // Show this month's transactions until the full list arrives
+            if (data.transactions && !hasFullList.current && !categoryFilter && !searchTerm) {
+                setTransactions(data.transactions.map(tx => ({ ...tx, id: tx.id || tx._id })));
+                setIsMonthPreview(true);
+                setIsTransactionsLoading(false);
+            }
+        } catch (err) {
+            console.error('Error fetching dashboard:', err.message);
             fetchCategories();
         }
-    }, [user, token]); // Re-run when user or token changes
+    };
 
-    const fetchTransactions = async (userId) => {
-        setIsTransactionsLoading(true);
+    // Writes (from this tab or anywhere else) arrive as change events and are patched into the lists;
+    // the lists are only fetched again when the stream says something may have been missed
+    const transactionsLoaded = useChangeStream(`${API_GATEWAY_URL}/transactions/changes`, token, {
+        onChange: (change) => applyTransactionChange(change),
+        onRefetch: () => fetchTransactions(false),
+    });
+    const categoriesLoaded = useChangeStream(`${API_GATEWAY_URL}/categories/changes`, token, {
+        onChange: (change) => applyCategoryChange(change),
+        onRefetch: () => fetchCategories(false),
+    });
+
+    const applyTransactionChange = (change) => {
+        // Only the server knows whether a written note matches the search
+        if (searchTerm && change.op === 'upsert') {
+            fetchTransactions(false);
+            return;
+        }
+        setTransactions(prev => {
+            const id = change.op === 'delete' ? change.id : change.doc._id;
+            const rest = prev.filter(tx => tx.id !== id);
+            if (change.op === 'delete') return rest;
+            // The list holds only the filtered category
+            if (categoryFilter && change.doc.category_id !== categoryFilter) return rest;
+            const transaction = { ...change.doc, id };
+            // Keep the server's newest-first order
+            const index = rest.findIndex(tx => new Date(tx.date) < new Date(transaction.date));
+            return index < 0 ? [...rest, transaction] : [...rest.slice(0, index), transaction, ...rest.slice(index)];
+        });
+    };
+
+    const applyCategoryChange = (change) => {
+        setCategories(prev => {
+            const id = change.op === 'delete' ? change.id : change.doc._id;
+            const list = prev.list.filter(cat => (cat.id || cat._id) !== id);
+            const map = { ...prev.map };
+            delete map[id];
+            if (change.op === 'upsert') {
+                list.push({ ...change.doc, id });
+                map[id] = change.doc.name;
+            }
+            return { list, map };
+        });
+    };
+
+    const fetchTransactions = async (showLoading = true) => {
+        if (showLoading) setIsTransactionsLoading(true);
         setError('');
         try {
             // The user_id is now derived from the token on the backend.
-            const response = await fetch(`${API_GATEWAY_URL}/transactions`, {
+            const params = new URLSearchParams();
+            if (categoryFilter) params.set('category_id', categoryFilter);
+            if (searchTerm) params.set('q', searchTerm);
+            // /transactions is paged; the stream sends the whole list as NDJSON, one transaction per line
+            const response = await fetch(`${API_GATEWAY_URL}/transactions/stream?${params}`, {
                 headers: { 'Authorization': `Bearer ${token}` },
             });
 
@@ -48,13 +141,16 @@ const Dashboard = () => {
                 throw new Error(`ไม่สามารถดึงข้อมูลธุรกรรมได้ (สถานะ: ${response.status})`);
             }
 
-            const data = await response.json();
+            const data = (await response.text()).split('\n').filter(Boolean).map(line => JSON.parse(line));
             // Ensure every transaction has an id field (for MongoDB _id compatibility)
             const mappedData = data.map(tx => ({
                 ...tx,
                 id: tx.id || tx._id // ใช้ id ถ้ามี ถ้าไม่มีใช้ _id
             }));
+            hasFullList.current = true;
             setTransactions(mappedData);
+            setIsMonthPreview(false);
+            transactionsLoaded(dataVersion(response));
         } catch (err) {
             setError(err.message);
         } finally {
@@ -62,9 +158,18 @@ const Dashboard = () => {
         }
     };
 
-    const fetchCategories = async () => {
+    const setCategoriesFromList = (data) => {
+        // Map categories to an object for quick lookups
+        const categoryMap = data.reduce((acc, cat) => {
+            acc[cat.id] = cat.name;
+            return acc;
+        }, {});
+        setCategories({ list: data, map: categoryMap }); // Ensure both list and map are set
+    };
+
+    const fetchCategories = async (showLoading = true) => {
         if (!token) return;
-        setIsCategoriesLoading(true);
+        if (showLoading) setIsCategoriesLoading(true);
         try {
             const response = await fetch(`${API_GATEWAY_URL}/categories`, {
                 headers: { 'Authorization': `Bearer ${token}` },
@@ -74,13 +179,8 @@ const Dashboard = () => {
                 console.error('ไม่สามารถดึงข้อมูลหมวดหมู่ได้');
                 return;
             }
-            const data = await response.json();
-            // Map categories to an object for quick lookups
-            const categoryMap = data.reduce((acc, cat) => {
-                acc[cat.id] = cat.name;
-                return acc;
-            }, {});
-            setCategories({ list: data, map: categoryMap }); // Ensure both list and map are set
+            setCategoriesFromList(await response.json());
+            categoriesLoaded(dataVersion(response));
         } catch (err) {
             console.error("Error fetching categories:", err.message);
         } finally {
@@ -122,10 +222,10 @@ const Dashboard = () => {
                 throw new Error(errData.detail || 'Failed to save transaction');
             }
 
-            // Reset form and refresh list
+            // Reset form and show the saved transaction (the change event that follows is a no-op)
             setIsFormVisible(false);
             setEditingTransaction(null);
-            fetchTransactions(); // Refresh the list
+            applyTransactionChange({ op: 'upsert', doc: await response.json() });
 
         } catch (err) {
             setError(err.message);
@@ -149,7 +249,7 @@ const Dashboard = () => {
                 throw new Error('Failed to delete transaction');
             }
 
-            fetchTransactions(); // Refresh the list
+            applyTransactionChange({ op: 'delete', id: transactionId });
         } catch (err) {
             setError(err.message);
         }
@@ -166,13 +266,8 @@ const Dashboard = () => {
 
     const isLoading = isTransactionsLoading || isCategoriesLoading;
 
-    // Filter transactions based on the selected category
-    const filteredTransactions = transactions.filter(tx => {
-        if (!categoryFilter) {
-            return true; // If no filter is selected, show all
-        }
-        return tx.category_id === categoryFilter;
-    });
+    // Already filtered by the selected category and search on the server
+    const filteredTransactions = transactions;
 
     // --- Pagination Logic ---
     // Calculate total pages
@@ -196,7 +291,8 @@ const Dashboard = () => {
         <div className="container">
             <h1>ภาพรวมธุรกรรม</h1>
 
-            <Summary income={totalIncome} expense={totalExpense} />
+            {/* Totals cover every transaction, so wait for the full list */}
+            {!isMonthPreview && <Summary income={totalIncome} expense={totalExpense} />}
 
             <div className="filters-container">
                 <label htmlFor="category-filter">กรองตามหมวดหมู่:</label>
@@ -213,6 +309,14 @@ const Dashboard = () => {
                 </select>
             </div>
 
+            <SearchBar
+                isLoading={isLoading}
+                onSearch={(term) => {
+                    setSearchTerm(term);
+                    setCurrentPage(1); // Reset to first page on a new search
+                }}
+            />
+
             {isFormVisible ? (
                 <TransactionForm
                     onSubmit={handleFormSubmit}
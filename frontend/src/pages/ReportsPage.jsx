@@ -27,12 +27,15 @@ const API_GATEWAY_URL = 'http://localhost:80';
 
 const ReportsPage = () => {
     const { user, token } = useAuth();
-    const [transactions, setTransactions] = useState([]);
+    const [availableYears, setAvailableYears] = useState([]);
     const [categories, setCategories] = useState([]);
+    const [monthly, setMonthly] = useState(null);
+    const [categoryRows, setCategoryRows] = useState([]);
     const [isLoading, setIsLoading] = useState(true);
     const [error, setError] = useState('');
     const [selectedYear, setSelectedYear] = useState(new Date().getFullYear());
     const [compareYear, setCompareYear] = useState(''); // '' for no comparison
+    const [analytics, setAnalytics] = useState(null);
 
     useEffect(() => {
         if (user) {
@@ -40,13 +43,13 @@ const ReportsPage = () => {
                 setIsLoading(true);
                 setError('');
                 try {
-                    // Fetch all transactions for the user
-                    const transResponse = await fetch(`${API_GATEWAY_URL}/transactions`, {
+                    // Years with any transactions, from the server's yearly totals
+                    const yearsResponse = await fetch(`${API_GATEWAY_URL}/transactions/summary/yearly`, {
                         headers: { 'Authorization': `Bearer ${token}` },
                     });
-                    if (!transResponse.ok) throw new Error('ไม่สามารถดึงข้อมูลธุรกรรมได้');
-                    const transData = await transResponse.json();
-                    setTransactions(transData);
+                    if (!yearsResponse.ok) throw new Error('ไม่สามารถดึงข้อมูลธุรกรรมได้');
+                    const yearsData = await yearsResponse.json();
+                    setAvailableYears(yearsData.map(y => y.year).sort((a, b) => b - a));
 
                     // Fetch all categories
                     const catResponse = await fetch(`${API_GATEWAY_URL}/categories`, {
@@ -56,6 +59,12 @@ const ReportsPage = () => {
                     const catData = await catResponse.json();
                     setCategories(catData.reduce((acc, cat) => ({ ...acc, [cat.id]: cat.name }), {}));
 
+                    // Trends and unusual expenses are computed by the server over the whole history
+                    const analyticsResponse = await fetch(`${API_GATEWAY_URL}/transactions/analytics`, {
+                        headers: { 'Authorization': `Bearer ${token}` },
+                    });
+                    if (analyticsResponse.ok) setAnalytics(await analyticsResponse.json());
+
                 } catch (err) {
                     setError(err.message);
                 } finally {
@@ -66,85 +75,66 @@ const ReportsPage = () => {
         }
     }, [user, token]);
 
-    // --- Data Processing with useMemo for performance ---
-
-    const processTransactions = (year) => {
-        if (!year) return { monthlySummary: [], categorySummary: {} };
-
-        const filtered = transactions.filter(tx => new Date(tx.date).getFullYear() === year);
-
-        const summary = Array.from({ length: 12 }, () => ({ income: 0, expense: 0 }));
-        const catSummary = {};
-
-        filtered.forEach(tx => {
-            // Monthly summary
-            const month = new Date(tx.date).getMonth();
-            if (tx.type === 'income') {
-                summary[month].income += tx.amount;
-            } else {
-                summary[month].expense += tx.amount;
-            }
-
-            // Category summary
-            const catId = tx.category_id || 'uncategorized';
-            if (!catSummary[catId]) {
-                catSummary[catId] = { name: categories[catId] || 'ไม่ระบุหมวดหมู่', income: 0, expense: 0 };
-            }
-            if (tx.type === 'income') {
-                catSummary[catId].income += tx.amount;
-            } else {
-                catSummary[catId].expense += tx.amount;
+    // Monthly and per-category totals for the chosen years come from the server's summaries
+    useEffect(() => {
+        if (!user) return;
+        const params = new URLSearchParams({ year: selectedYear });
+        if (compareYear) params.set('compare_year', compareYear);
+        const fetchSummaries = async () => {
+            try {
+                const [monthlyResponse, categoryResponse] = await Promise.all([
+                    fetch(`${API_GATEWAY_URL}/transactions/summary/monthly?${params}`, {
+                        headers: { 'Authorization': `Bearer ${token}` },
+                    }),
+                    fetch(`${API_GATEWAY_URL}/transactions/summary/categories?${params}`, {
+                        headers: { 'Authorization': `Bearer ${token}` },
+                    }),
+                ]);
+                if (!monthlyResponse.ok || !categoryResponse.ok) throw new Error('ไม่สามารถดึงข้อมูลสรุปได้');
+                setMonthly(await monthlyResponse.json());
+                setCategoryRows(await categoryResponse.json());
+            } catch (err) {
+                setError(err.message);
             }
-        });
-
-        return { monthlySummary: summary, categorySummary: catSummary };
-    };
-
-    const primaryData = useMemo(() => processTransactions(selectedYear), [transactions, selectedYear, categories]);
-    const compareData = useMemo(() => processTransactions(compareYear ? parseInt(compareYear) : null), [transactions, compareYear, categories]);
+        };
+        fetchSummaries();
+    }, [user, token, selectedYear, compareYear]);
 
-    const combinedCategorySummary = useMemo(() => {
-        const allCategoryIds = new Set([...Object.keys(primaryData.categorySummary), ...Object.keys(compareData.categorySummary)]);
-        const combined = [];
+    const monthlySummary = monthly ? monthly.months : [];
+    const compareMonthlySummary = monthly?.compare_months || [];
 
-        allCategoryIds.forEach(catId => {
-            const primaryCat = primaryData.categorySummary[catId];
-            const compareCat = compareData.categorySummary[catId];
-            combined.push({
-                id: catId,
-                name: (primaryCat?.name || compareCat?.name),
-                primaryIncome: primaryCat?.income || 0,
-                primaryExpense: primaryCat?.expense || 0,
-                compareIncome: compareCat?.income || 0,
-                compareExpense: compareCat?.expense || 0,
-            });
-        });
-        return combined;
-    }, [primaryData.categorySummary, compareData.categorySummary]);
+    const combinedCategorySummary = useMemo(() => categoryRows.map(row => ({
+        id: row.category_id || 'uncategorized',
+        name: categories[row.category_id] || 'ไม่ระบุหมวดหมู่',
+        primaryIncome: row.income,
+        primaryExpense: row.expense,
+        compareIncome: row.compare_income || 0,
+        compareExpense: row.compare_expense || 0,
+    })), [categoryRows, categories]);
 
     const chartData = {
         labels: ['ม.ค.', 'ก.พ.', 'มี.ค.', 'เม.ย.', 'พ.ค.', 'มิ.ย.', 'ก.ค.', 'ส.ค.', 'ก.ย.', 'ต.ค.', 'พ.ย.', 'ธ.ค.'],
         datasets: [
             {
                 label: `รายรับ ปี ${selectedYear}`,
-                data: primaryData.monthlySummary.map(s => s.income),
+                data: monthlySummary.map(s => s.income),
                 backgroundColor: 'rgba(75, 192, 192, 0.6)',
             },
             {
                 label: `รายจ่าย ปี ${selectedYear}`,
-                data: primaryData.monthlySummary.map(s => s.expense),
+                data: monthlySummary.map(s => s.expense),
                 backgroundColor: 'rgba(255, 99, 132, 0.6)',
             },
             // Add comparison year data if selected
             ...(compareYear ? [
                 {
                     label: `รายรับ ปี ${compareYear}`,
-                    data: compareData.monthlySummary.map(s => s.income),
+                    data: compareMonthlySummary.map(s => s.income),
                     backgroundColor: 'rgba(54, 162, 235, 0.6)',
                 },
                 {
                     label: `รายจ่าย ปี ${compareYear}`,
-                    data: compareData.monthlySummary.map(s => s.expense),
+                    data: compareMonthlySummary.map(s => s.expense),
                     backgroundColor: 'rgba(255, 159, 64, 0.6)',
                 }
             ] : [])
@@ -152,12 +142,12 @@ const ReportsPage = () => {
     };
 
     const doughnutChartData = useMemo(() => {
-        const expenseCategories = Object.values(primaryData.categorySummary)
-            .filter(cat => cat.expense > 0)
-            .sort((a, b) => b.expense - a.expense);
+        const expenseCategories = combinedCategorySummary
+            .filter(cat => cat.primaryExpense > 0)
+            .sort((a, b) => b.primaryExpense - a.primaryExpense);
 
         const labels = expenseCategories.map(cat => cat.name);
-        const data = expenseCategories.map(cat => cat.expense);
+        const data = expenseCategories.map(cat => cat.primaryExpense);
 
         return {
             labels,
@@ -174,15 +164,22 @@ const ReportsPage = () => {
                 ]
             }]
         };
-    }, [primaryData.categorySummary]);
+    }, [combinedCategorySummary]);
+
+    const trendMonths = useMemo(
+        () => (analytics ? analytics.months.filter(m => m.year === selectedYear) : []),
+        [analytics, selectedYear]
+    );
+    const yearOutliers = useMemo(
+        () => (analytics ? analytics.outliers.filter(o => new Date(o.date).getFullYear() === selectedYear) : []),
+        [analytics, selectedYear]
+    );
 
     const formatCurrency = (amount) => new Intl.NumberFormat('th-TH', { style: 'currency', currency: 'THB' }).format(amount);
 
     if (isLoading) return <div className="loading">กำลังโหลดรายงาน...</div>;
     if (error) return <div className="error">{error}</div>;
 
-    const availableYears = [...new Set(transactions.map(tx => new Date(tx.date).getFullYear()))].sort((a, b) => b - a);
-
     return (
         <div className="container">
             <h1>รายงานและสถิติ</h1>
@@ -250,6 +247,64 @@ const ReportsPage = () => {
                     </table>
                 </div>
             </div>
+
+            {analytics && (
+                <div style={{ display: 'grid', gridTemplateColumns: '1fr 1fr', gap: '20px', alignItems: 'flex-start' }}>
+                    <div className="card">
+                        <h2>แนวโน้มรายจ่าย ปี {selectedYear} (ค่าเฉลี่ย {analytics.window} เดือน)</h2>
+                        <table style={{ width: '100%', textAlign: 'left', borderCollapse: 'collapse' }}>
+                            <thead>
+                                <tr>
+                                    <th>เดือน</th>
+                                    <th style={{ textAlign: 'right' }}>รายจ่าย</th>
+                                    <th style={{ textAlign: 'right' }}>ค่าเฉลี่ย</th>
+                                    <th style={{ textAlign: 'right' }}>เทียบปีก่อน</th>
+                                </tr>
+                            </thead>
+                            <tbody>
+                                {trendMonths.map(m => (
+                                    <tr key={m.month}>
+                                        <td>{chartData.labels[m.month - 1]}</td>
+                                        <td style={{ textAlign: 'right' }}>{formatCurrency(m.expense)}</td>
+                                        <td style={{ textAlign: 'right' }}>{formatCurrency(m.expense_avg)}</td>
+                                        <td style={{ textAlign: 'right', color: m.expense_yoy_pct > 0 ? 'red' : 'green' }}>
+                                            {m.expense_yoy_pct === null ? '-' : `${m.expense_yoy_pct > 0 ? '+' : ''}${m.expense_yoy_pct.toFixed(1)}%`}
+                                        </td>
+                                    </tr>
+                                ))}
+                            </tbody>
+                        </table>
+                    </div>
+
+                    <div className="card">
+                        <h2>รายจ่ายที่สูงผิดปกติ ปี {selectedYear}</h2>
+                        {yearOutliers.length > 0 ? (
+                            <table style={{ width: '100%', textAlign: 'left', borderCollapse: 'collapse' }}>
+                                <thead>
+                                    <tr>
+                                        <th>วันที่</th>
+                                        <th>หมวดหมู่</th>
+                                        <th style={{ textAlign: 'right' }}>จำนวน</th>
+                                        <th style={{ textAlign: 'right' }}>ปกติไม่เกิน</th>
+                                    </tr>
+                                </thead>
+                                <tbody>
+                                    {yearOutliers.map(o => (
+                                        <tr key={o.transaction_id}>
+                                            <td>{new Date(o.date).toLocaleDateString('th-TH')}</td>
+                                            <td>{categories[o.category_id] || 'ไม่ระบุหมวดหมู่'}</td>
+                                            <td style={{ textAlign: 'right', color: 'red' }}>{formatCurrency(o.amount)}</td>
+                                            <td style={{ textAlign: 'right' }}>{formatCurrency(o.threshold)}</td>
+                                        </tr>
+                                    ))}
+                                </tbody>
+                            </table>
+                        ) : (
+                            <p className="no-data-message">ไม่พบรายจ่ายที่ผิดปกติ</p>
+                        )}
+                    </div>
+                </div>
+            )}
         </div>
     );
 };